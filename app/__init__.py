@@ -1,7 +1,11 @@
 from flask import Flask, render_template
+from .commands import register_commands
 from .config import config_by_name
 from .routes.main_routes import main
 from .routes.api_routes import api
+from .utils.clients import preload, warm_up
+from .utils.jobs import start_job_workers
+from .utils.sync_scheduler import start_sync_ticker
 
 import os
 import logging
@@ -18,8 +22,37 @@ def create_app(config_name=None):
     app.register_blueprint(main)
     app.register_blueprint(api)
     register_error_handlers(app)
+    register_commands(app)
+    if os.getenv('PRELOAD_APP', 'False').lower() == 'true':
+        # The gunicorn master builds the app before forking (gunicorn.conf.py):
+        # load what the workers can share, and leave clients to init_worker in
+        # each worker.
+        preload()
+    else:
+        init_worker()
     return app
 
+def init_worker():
+    """
+    Creates the per-process clients.
+    """
+    if os.getenv('WARM_UP', 'True').lower() == 'true':
+        warm_up()
+
+def start_background_workers():
+    """
+    Starts the background threads of a server process: the job workers and
+    the sync scheduler.
+
+    Called by the servers (gunicorn.conf.py, asgi.py), never by create_app, so
+    that `flask` commands and scripts that build the app don't pick up queued
+    jobs and abandon them when they exit. enqueue_job also starts the job
+    workers of the process it runs in, and request_sync the sync scheduler,
+    which covers `flask run`.
+    """
+    start_job_workers()
+    start_sync_ticker()
+
 def register_error_handlers(app):
     @app.errorhandler(404)
     def page_not_found(e):
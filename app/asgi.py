@@ -0,0 +1,272 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.async_pipeline import addnote_async, addnote_english_async
+from app.utils.circuit_breaker import AnkiUnavailableError, breaker_status
+from app.utils.clients import run_blocking
+from app.utils.container import handle_container
+from app.utils.duplicates import DuplicateNoteError
+from app.utils.metrics import collect_timings, server_timing_header, span
+from app.utils.single_flight import flight_key, single_flight_async
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Threads serving the requests that go to the Flask app.
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "16"))
+
+
+def _wsgi_environ(scope, body):
+    """
+    Builds the WSGI environ of an ASGI HTTP request whose body was read.
+    """
+    script_name = scope.get("root_path", "").encode("utf8").decode("latin1")
+    path_info = scope["path"].encode("utf8").decode("latin1")
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name) :]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name,
+        "PATH_INFO": path_info,
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin1")
+        if name in environ:
+            value = f"{environ[name]},{value}"
+        environ[name] = value
+    return environ
+
+
+class _WsgiAdapter:
+    """
+    Serves a WSGI app under ASGI. Each request runs in a thread of `executor`,
+    so Flask routes are served concurrently, and the response is sent back to
+    the event loop chunk by chunk, so streamed responses such as the job events
+    keep streaming.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        self.wsgi_application = wsgi_application
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        environ = _wsgi_environ(scope, await _read_body(receive))
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        await loop.run_in_executor(
+            self.executor, self._run, environ, send_from_thread
+        )
+
+    def _run(self, environ, send):
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response_start.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response_start["message"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [
+                    (name.lower().encode("latin1"), value.encode("latin1"))
+                    for name, value in headers
+                ],
+            }
+
+        def start():
+            if not response_start.get("sent"):
+                send(response_start["message"])
+                response_start["sent"] = True
+
+        chunks = self.wsgi_application(environ, start_response)
+        try:
+            for chunk in chunks:
+                start()
+                if chunk:
+                    send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+            start()
+            send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+def _replay(body):
+    """
+    Returns a `receive` callable that hands an already read body to the WSGI
+    app.
+    """
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return receive
+
+
+async def _send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *headers,
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _retry_after_headers(ankiconnect_url, error):
+    """
+    Returns the Retry-After header of a 503, like `unavailable` in the API
+    routes. A request that waited on another one gets the error without its
+    retry time, which is then read from the breaker.
+    """
+    retry_after = error.retry_after
+    if retry_after is None:
+        status = await run_blocking(breaker_status, ankiconnect_url)
+        retry_after = status.get("retry_after")
+    if retry_after is None:
+        return []
+    return [(b"retry-after", str(max(1, round(retry_after))).encode())]
+
+
+async def _add_note(data):
+    """
+    Async counterpart of the /api/addnote view. Returns (status, payload, headers).
+    """
+    ankiconnect_url = os.environ.get("ANKICONNECT_URL")
+    if not ankiconnect_url:
+        return 500, {"error": "ANKICONNECT_URL environment variable not set"}, []
+    word = (data.get("word") or "").strip()
+    if not word:
+        return 400, {"message": "Missing 'word'"}, []
+    dropdown_value = data.get("dropdownValue")
+    fresh = bool(data.get("fresh", False))
+
+    async def run():
+        if os.environ.get("HANDLE_CONTAINER", "False").lower() == "true":
+            await run_blocking(handle_container, ankiconnect_url)
+        deck = dropdown_value.capitalize()
+        if dropdown_value == "japanese":
+            await addnote_async(ankiconnect_url, deck, word, fresh)
+        else:
+            await addnote_english_async(ankiconnect_url, deck, word, fresh)
+        return {
+            "message": "Note added successfully",
+            "word": word,
+            "value": dropdown_value,
+        }
+
+    try:
+        payload = await single_flight_async(
+            flight_key(word, dropdown_value),
+            run,
+            shared_errors=(DuplicateNoteError, AnkiUnavailableError),
+        )
+    except DuplicateNoteError as e:
+        return 409, {"error": str(e)}, []
+    except AnkiUnavailableError as e:
+        return 503, {"error": str(e)}, await _retry_after_headers(ankiconnect_url, e)
+    except Exception as e:
+        return 500, {"error": str(e)}, []
+    return 200, payload, []
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def create_asgi_app(flask_app):
+    """
+    Wraps the Flask app in an ASGI app that serves synchronous
+    `POST /api/addnote` requests with the async pipeline.
+
+    Every other request, including queued (`"async": true`) notes, goes to the
+    Flask app unchanged, on a pool of `ASGI_WSGI_THREADS` threads.
+    """
+    wsgi_app = _WsgiAdapter(
+        flask_app,
+        ThreadPoolExecutor(max_workers=ASGI_WSGI_THREADS, thread_name_prefix="wsgi"),
+    )
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            await _lifespan(receive, send)
+            return
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] != "/api/addnote"
+        ):
+            await wsgi_app(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or not data or data.get("async"):
+            await wsgi_app(scope, _replay(body), send)
+            return
+
+        with collect_timings() as timings, span("total"):
+            status, payload, headers = await _add_note(data)
+        await _send_json(
+            send,
+            status,
+            payload,
+            [*headers, (b"server-timing", server_timing_header(timings).encode())],
+        )
+
+    return app
@@ -0,0 +1,142 @@
+import logging
+import os
+
+import click
+
+from app.utils.container import handle_container
+from app.utils.importer import IMPORT_CONCURRENCY, import_words
+from app.utils.refresher import (
+    REFRESH_BATCH_SIZE,
+    REFRESH_CONCURRENCY,
+    REFRESHABLE_FIELDS,
+    refresh_notes,
+    refresh_query,
+)
+from app.utils.sync_scheduler import flush_sync
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _ankiconnect_url():
+    ankiconnect_url = os.environ.get("ANKICONNECT_URL")
+    if not ankiconnect_url:
+        raise click.ClickException("ANKICONNECT_URL environment variable not set")
+    if os.environ.get("HANDLE_CONTAINER", "False").lower() == "true":
+        handle_container(ankiconnect_url)
+    return ankiconnect_url
+
+
+@click.command("import-words")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--deck",
+    type=click.Choice(["japanese", "english"]),
+    default="japanese",
+    show_default=True,
+    help="Deck of words without a 'deck' column.",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=IMPORT_CONCURRENCY,
+    show_default=True,
+    help="Words processed at the same time.",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    help="Checkpoint file. Defaults to PATH.checkpoint.",
+)
+@click.option("--fresh", is_flag=True, help="Don't reuse cached Gemini content.")
+@click.option(
+    "--max-consecutive-failures",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="Stop after this many failures in a row.",
+)
+def import_words_command(
+    path, deck, concurrency, checkpoint, fresh, max_consecutive_failures
+):
+    """Add every word of a text or CSV file to Anki."""
+    ankiconnect_url = _ankiconnect_url()
+    result = import_words(
+        ankiconnect_url,
+        path,
+        default_deck=deck,
+        concurrency=concurrency,
+        checkpoint_path=checkpoint,
+        fresh=fresh,
+        max_consecutive_failures=max_consecutive_failures,
+    )
+    if result["added"]:
+        flush_sync(ankiconnect_url)
+    click.echo(
+        f"{result['added']} added, {result['duplicate']} duplicates, "
+        f"{result['failed']} failed, {result['resumed']} already done"
+    )
+    if result["stopped"]:
+        raise click.ClickException("Import stopped early; run it again to resume")
+
+
+@click.command("refresh-notes")
+@click.option("--tag", help="Only refresh notes with this tag.")
+@click.option("--deck", help="Only refresh notes in this deck.")
+@click.option(
+    "--field",
+    "fields",
+    type=click.Choice(REFRESHABLE_FIELDS),
+    multiple=True,
+    help="Field to regenerate; repeat for both. Defaults to Front and Back.",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=REFRESH_CONCURRENCY,
+    show_default=True,
+    help="Notes rebuilt at the same time.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=REFRESH_BATCH_SIZE,
+    show_default=True,
+    help="Notes written back to Anki per request.",
+)
+@click.option("--fresh", is_flag=True, help="Don't reuse cached Gemini content.")
+@click.option(
+    "--force", is_flag=True, help="Also refresh notes generated with current settings."
+)
+@click.option("--dry-run", is_flag=True, help="Only count the notes to refresh.")
+def refresh_notes_command(
+    tag, deck, fields, concurrency, batch_size, fresh, force, dry_run
+):
+    """Regenerate notes created with other Gemini or TTS settings."""
+    ankiconnect_url = _ankiconnect_url()
+    result = refresh_notes(
+        ankiconnect_url,
+        refresh_query(tag, deck),
+        fields=fields or REFRESHABLE_FIELDS,
+        concurrency=concurrency,
+        batch_size=batch_size,
+        fresh=fresh,
+        force=force,
+        dry_run=dry_run,
+    )
+    pending = result["matching"] - result["up_to_date"]
+    if dry_run:
+        click.echo(f"{pending} of {result['matching']} notes would be refreshed")
+        return
+    if result["updated"] or result["unchanged"]:
+        flush_sync(ankiconnect_url)
+    click.echo(
+        f"{result['updated']} updated, {result['unchanged']} unchanged, "
+        f"{result['up_to_date']} already up to date, {result['skipped']} skipped, "
+        f"{result['failed']} failed"
+    )
+
+
+def register_commands(app):
+    app.cli.add_command(import_words_command)
+    app.cli.add_command(refresh_notes_command)
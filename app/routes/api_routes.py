@@ -1,18 +1,96 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context, url_for
+import json
 import os
 import logging
+import time
 from app.utils.utils import addnote as add_anki_note
 from app.utils.utils import addnote_english as add_anki_note_english
+from app.utils.utils import addnotes as add_anki_notes
+from app.utils.utils import build_note, build_note_english
+from app.utils.circuit_breaker import AnkiUnavailableError
 from app.utils.container import handle_container
+from app.utils.duplicates import DuplicateNoteError, ensure_not_duplicate
+from app.utils.jobs import enqueue_job, get_job, register_job_handler
+from app.utils.metrics import collect_timings, server_timing_header, span
+from app.utils.previews import cached_build
+from app.utils.single_flight import flight_key, single_flight
+from app.utils.sync_scheduler import flush_sync
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
+def add_note(ankiConnect, dropdown_value, word, fresh=False, progress=None):
+  def run():
+    HANDLE_CONTAINER = os.environ.get('HANDLE_CONTAINER', 'False').lower() == 'true'
+    if HANDLE_CONTAINER:
+      if progress:
+        progress("container")
+      handle_container(ankiConnect)
+    deck = dropdown_value.capitalize()
+    if dropdown_value == "japanese":
+      add_anki_note(ankiConnect, deck, word, fresh, progress)
+    else:
+      add_anki_note_english(ankiConnect, deck, word, fresh, progress)
+    return {
+          "message": "Note added successfully",
+          "word": word,
+          "value": dropdown_value
+    }
+
+  # Double submits and other tabs sending the same word share one run.
+  return single_flight(
+    flight_key(word, dropdown_value),
+    run,
+    shared_errors=(DuplicateNoteError, AnkiUnavailableError),
+    on_wait=(lambda: progress("waiting")) if progress else None
+  )
+
+
+def unavailable(error):
+  """Returns the 503 response for a request rejected by the AnkiConnect breaker."""
+  headers = {}
+  if error.retry_after is not None:
+    headers["Retry-After"] = str(max(1, round(error.retry_after)))
+  return jsonify({"error": str(error)}), 503, headers
+
+
+def run_addnote_job(payload, progress):
+  ankiConnect = os.environ.get("ANKICONNECT_URL")
+  if not ankiConnect:
+    raise Exception("ANKICONNECT_URL environment variable not set")
+  return add_note(ankiConnect, payload["value"], payload["word"], payload["fresh"], progress)
+
+
+register_job_handler("addnote", run_addnote_job)
+
+
+def add_notes(ankiConnect, entries, fresh=False, progress=None):
+  if os.environ.get('HANDLE_CONTAINER', 'False').lower() == 'true':
+    if progress:
+      progress("container")
+    handle_container(ankiConnect)
+  results = add_anki_notes(ankiConnect, entries, fresh, progress)
+  added = sum(1 for result in results if result.get("status") == "added")
+  return {
+        "message": f"{added} of {len(results)} notes added",
+        "results": results
+  }
+
+
+def run_addnotes_job(payload, progress):
+  ankiConnect = os.environ.get("ANKICONNECT_URL")
+  if not ankiConnect:
+    raise Exception("ANKICONNECT_URL environment variable not set")
+  return add_notes(ankiConnect, payload["entries"], payload["fresh"], progress)
+
+
+register_job_handler("addnotes", run_addnotes_job)
+
+
 @api.route("/addnote", methods=["POST"])
 def addnote():
-  HANDLE_CONTAINER = os.environ.get('HANDLE_CONTAINER', 'False').lower() == 'true'
   ankiConnect = os.environ.get("ANKICONNECT_URL")
   if not ankiConnect:
     return jsonify({"error": "ANKICONNECT_URL environment variable not set"}), 500
@@ -22,27 +100,177 @@ def addnote():
         return jsonify({"error": "Missing JSON data"}), 400
   word = data.get("word").strip()
   dropdown_value = data.get("dropdownValue")
+  fresh = bool(data.get("fresh", False))
 
   if not word:
     return jsonify({"message": "Missing 'word'"}), 400
 
-  try:
-    if HANDLE_CONTAINER:
-      handle_container()
-    deck = dropdown_value.capitalize()
-    if dropdown_value == "japanese":
-      add_anki_note(ankiConnect, deck, word)
-      return jsonify({
-            "message": "Note added successfully",
-            "word": word,
-            "value": dropdown_value
-      }), 200
-    else:
-      add_anki_note_english(ankiConnect, deck, word)
-      return jsonify({
-            "message": "Note added successfully",
+  if data.get("async"):
+    job_id = enqueue_job("addnote", {"word": word, "value": dropdown_value, "fresh": fresh})
+    status_url = url_for("api.job_status", job_id=job_id)
+    return jsonify({
+          "message": "Note queued",
+          "job_id": job_id,
+          "status_url": status_url,
+          "events_url": url_for("api.job_events", job_id=job_id)
+    }), 202, {"Location": status_url}
+
+  with collect_timings() as timings, span("total"):
+    try:
+      response = jsonify(add_note(ankiConnect, dropdown_value, word, fresh)), 200
+    except DuplicateNoteError as e:
+      response = jsonify({"error": str(e)}), 409
+    except AnkiUnavailableError as e:
+      response = unavailable(e)
+    except Exception as e:
+      response = jsonify({"error": str(e)}), 500
+  headers = {"Server-Timing": server_timing_header(timings)}
+  if len(response) > 2:
+    headers.update(response[2])
+  return response[0], response[1], headers
+
+
+@api.route("/preview", methods=["POST"])
+def preview():
+  data = request.get_json()
+  if not data:
+        return jsonify({"error": "Missing JSON data"}), 400
+  word = (data.get("word") or "").strip()
+  dropdown_value = data.get("dropdownValue") or "japanese"
+  fresh = bool(data.get("fresh", False))
+
+  if not word:
+    return jsonify({"message": "Missing 'word'"}), 400
+
+  # Builds the card without touching Anki (nor starting its container), so
+  # that a following /api/addnote for the word only has to write it. The
+  # duplicate check only reads the local note index, as last refreshed by an
+  # add; the add checks again against Anki.
+  deck = dropdown_value.capitalize()
+  builder = build_note if dropdown_value == "japanese" else build_note_english
+  with collect_timings() as timings, span("preview"):
+    try:
+      note, media = cached_build(
+        builder,
+        deck,
+        word,
+        fresh,
+        preflight=lambda front: ensure_not_duplicate(
+              None, deck, front, refresh=False
+        )
+      )
+      response = jsonify({
             "word": word,
-            "value": dropdown_value
+            "value": dropdown_value,
+            "fields": note["fields"],
+            "audio": list(media)
       }), 200
+    except DuplicateNoteError as e:
+      response = jsonify({"error": str(e)}), 409
+    except Exception as e:
+      response = jsonify({"error": str(e)}), 500
+  return (*response, {"Server-Timing": server_timing_header(timings)})
+
+
+@api.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+  job = get_job(job_id)
+  if job is None:
+    return jsonify({"error": "Job not found"}), 404
+  # The stages of a finished job show up in the browser's devtools like those
+  # of a synchronous /api/addnote.
+  headers = {"Server-Timing": job["timings"]} if job["timings"] else {}
+  return jsonify(job), 200, headers
+
+
+@api.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+  if get_job(job_id) is None:
+    return jsonify({"error": "Job not found"}), 404
+
+  # Opt-in: the stream holds a sync worker until the job ends, so the web form
+  # polls /api/jobs/<id> instead.
+  def events():
+    last_stage = None
+    while True:
+      job = get_job(job_id)
+      if job is None:
+        yield "event: gone\ndata: {}\n\n"
+        return
+      if job["stage"] != last_stage:
+        last_stage = job["stage"]
+        yield f"event: stage\ndata: {json.dumps(job)}\n\n"
+      if job["status"] in ("done", "failed"):
+        return
+      time.sleep(0.5)
+
+  return Response(
+    stream_with_context(events()),
+    mimetype="text/event-stream",
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+  )
+
+
+@api.route("/addnotes", methods=["POST"])
+def addnotes():
+  ankiConnect = os.environ.get("ANKICONNECT_URL")
+  if not ankiConnect:
+    return jsonify({"error": "ANKICONNECT_URL environment variable not set"}), 500
+
+  data = request.get_json()
+  if not data:
+        return jsonify({"error": "Missing JSON data"}), 400
+  words = data.get("words")
+  default_value = data.get("dropdownValue", "japanese")
+  fresh = bool(data.get("fresh", False))
+
+  if not isinstance(words, list) or not words:
+    return jsonify({"message": "Missing 'words'"}), 400
+
+  entries = []
+  for item in words:
+    if isinstance(item, str):
+      item = {"word": item}
+    if not isinstance(item, dict) or not isinstance(item.get("word") or "", str):
+      return jsonify({"message": "Each item of 'words' must be a word or an object with a 'word'"}), 400
+    word = (item.get("word") or "").strip()
+    if not word:
+      return jsonify({"message": "Missing 'word' in 'words'"}), 400
+    deck = item.get("dropdownValue") or default_value
+    if not isinstance(deck, str):
+      return jsonify({"message": f"Invalid 'dropdownValue' for '{word}'"}), 400
+    entries.append({"word": word, "deck": deck})
+
+  # A batch easily outlasts the gunicorn worker timeout, so it runs as a job
+  # unless the client asks to wait for it.
+  if data.get("async", True):
+    job_id = enqueue_job("addnotes", {"entries": entries, "fresh": fresh})
+    status_url = url_for("api.job_status", job_id=job_id)
+    return jsonify({
+          "message": f"{len(entries)} notes queued",
+          "job_id": job_id,
+          "status_url": status_url,
+          "events_url": url_for("api.job_events", job_id=job_id)
+    }), 202, {"Location": status_url}
+
+  try:
+    return jsonify(add_notes(ankiConnect, entries, fresh)), 200
+  except AnkiUnavailableError as e:
+    return unavailable(e)
+  except Exception as e:
+    return jsonify({"error": str(e)}), 500
+
+
+@api.route("/sync", methods=["POST"])
+def sync():
+  ankiConnect = os.environ.get("ANKICONNECT_URL")
+  if not ankiConnect:
+    return jsonify({"error": "ANKICONNECT_URL environment variable not set"}), 500
+
+  try:
+    flush_sync(ankiConnect)
+    return jsonify({"message": "Sync successful"}), 200
+  except AnkiUnavailableError as e:
+    return unavailable(e)
   except Exception as e:
     return jsonify({"error": str(e)}), 500
@@ -1,5 +1,10 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, Response, abort, jsonify, render_template, request, send_file
 import logging
+import os
+from app.utils.audio_cache import audio_path
+from app.utils.circuit_breaker import AnkiUnavailableError, breaker_status, ensure_anki_available
+from app.utils.media import verify_media_token
+from app.utils.metrics import metrics_payload
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -8,4 +13,37 @@ main = Blueprint('main', __name__)
 
 @main.route('/')
 def home():
-    return render_template('home.html')
\ No newline at end of file
+    return render_template('home.html')
+
+@main.route('/metrics')
+def metrics():
+    body, content_type = metrics_payload()
+    return Response(body, content_type=content_type)
+
+
+@main.route('/health')
+def health():
+    """Reports whether AnkiConnect is reachable, probing it if nothing did recently."""
+    ankiConnect = os.environ.get("ANKICONNECT_URL")
+    if not ankiConnect:
+        return jsonify({"status": "ok", "ankiconnect": None}), 200
+    try:
+        ensure_anki_available(ankiConnect)
+    except AnkiUnavailableError:
+        pass
+    status = breaker_status(ankiConnect)
+    return jsonify({
+        "status": "ok" if status["state"] == "closed" and not status["failures"] else "degraded",
+        "ankiconnect": status
+    }), 200
+
+
+@main.route('/media/<key>.mp3')
+def media(key):
+    """Serves a cached clip to AnkiConnect through a signed, short-lived URL."""
+    if not verify_media_token(key, request.args.get('expires'), request.args.get('token')):
+        abort(403)
+    path = audio_path(key)
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(os.path.abspath(path), mimetype='audio/mpeg')
@@ -6,6 +6,7 @@ const hiddenInput = document.getElementById('dropdownValue');
 const wordInput = document.getElementById('word');
 const form = document.getElementById('language');
 const resultBox = document.getElementById('result');
+const previewBox = document.getElementById('preview');
 
 function showMessage(type, message) {
     resultBox.classList.remove('success', 'error');
@@ -27,6 +28,7 @@ optionsList.forEach(option => {
         selected.textContent = option.textContent;
         selected.dataset.value = option.dataset.value;
         hiddenInput.value = option.dataset.value;
+        schedulePreview();
     });
 });
 
@@ -47,8 +49,130 @@ dropdown.addEventListener('keydown', (e) => {
 });
 
 
+const stageLabels = {
+    queued: 'Queued...',
+    waiting: 'Already being added...',
+    container: 'Starting Anki...',
+    translation: 'Translating...',
+    generation: 'Generating sentence...',
+    audio: 'Creating audio...',
+    anki: 'Adding to Anki...'
+};
+
+// Polls the job with short requests rather than a server-sent events stream,
+// which would hold a gunicorn worker for the whole job.
+const JOB_POLL_INTERVAL = 1000;
+
+async function waitForJob(statusUrl) {
+    while (true) {
+        const res = await fetch(statusUrl);
+        const job = await res.json();
+        if (!res.ok) {
+            throw new Error(job?.error || 'Lost track of the job');
+        }
+        if (job.status === 'done') {
+            return job.result;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Unknown error');
+        }
+        resultBox.textContent = stageLabels[job.stage] || 'Loading...';
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+    }
+}
+
+// Builds the card while the user is still typing, so that "Add" only has to
+// write it to Anki.
+const PREVIEW_DELAY = 800;
+// Latin words shorter than this are still being typed. A single kanji or kana
+// can be a whole word.
+const PREVIEW_MIN_LENGTH = 3;
+let previewTimer = null;
+let previewController = null;
+let previewKey = null;
+
+function previewable(word) {
+    return word.length >= PREVIEW_MIN_LENGTH || /[^\x00-\x7F]/.test(word);
+}
+
+function fieldText(html) {
+    const withBreaks = html.replace(/<br\s*\/?>/gi, '\n').replace(/\[sound:[^\]]*\]/g, '');
+    const doc = new DOMParser().parseFromString(withBreaks, 'text/html');
+    return doc.body.textContent.replace(/\n{2,}/g, '\n').trim();
+}
+
+function showPreview(text, pending) {
+    previewBox.replaceChildren();
+    const texts = Array.isArray(text) ? text : [text];
+    texts.forEach(item => {
+        const field = document.createElement('div');
+        field.className = pending ? 'preview-field pending' : 'preview-field';
+        field.textContent = item;
+        previewBox.appendChild(field);
+    });
+}
+
+async function loadPreview() {
+    const word = wordInput.value.trim();
+    const key = `${hiddenInput.value}:${word.toLowerCase()}`;
+    // The same word and deck is already shown or being built.
+    if (key === previewKey) {
+        return;
+    }
+    if (previewController) {
+        previewController.abort();
+    }
+    previewKey = null;
+    if (!previewable(word)) {
+        previewBox.replaceChildren();
+        return;
+    }
+    previewKey = key;
+    const controller = new AbortController();
+    previewController = controller;
+    showPreview('Preparing card...', true);
+    try {
+        const res = await fetch('/api/preview', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                word: word,
+                dropdownValue: hiddenInput.value
+            }),
+            signal: controller.signal
+        });
+        const result = await res.json();
+        if (controller !== previewController) {
+            return;
+        }
+        if (!res.ok) {
+            // Let the same word be tried again, e.g. after a server error.
+            previewKey = null;
+            showPreview(result?.error || 'No preview available', true);
+            return;
+        }
+        showPreview([fieldText(result.fields.Front), fieldText(result.fields.Back)], false);
+    } catch (err) {
+        if (err.name !== 'AbortError') {
+            console.error(err);
+            previewKey = null;
+            previewBox.replaceChildren();
+        }
+    }
+}
+
+function schedulePreview() {
+    clearTimeout(previewTimer);
+    previewTimer = setTimeout(loadPreview, PREVIEW_DELAY);
+}
+
+wordInput.addEventListener('input', schedulePreview);
+
 form.addEventListener('submit', async (e) => {
     e.preventDefault();
+    clearTimeout(previewTimer);
 
     resultBox.classList.remove('success', 'error');
     resultBox.textContent = 'Loading...';
@@ -64,18 +188,30 @@ form.addEventListener('submit', async (e) => {
             },
             body: JSON.stringify({
                 word: word,
-                dropdownValue: value
+                dropdownValue: value,
+                async: true
             })
         });
 
-        const result = await res.json();
+        let result = await res.json();
         if (!res.ok) {
             console.error(result?.error || 'Unknown error');
             showMessage('error', 'Failed to add');
             return;
         }
+        if (res.status === 202) {
+            try {
+                result = await waitForJob(result.status_url);
+            } catch (err) {
+                console.error(err);
+                showMessage('error', 'Failed to add');
+                return;
+            }
+        }
         showMessage('success', result.message || 'Note added!');
         wordInput.textContent = '';
+        previewKey = null;
+        previewBox.replaceChildren();
     } catch (err) {
         console.error(err);
         showMessage('error', 'Error submitting note');
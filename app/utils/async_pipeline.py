@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+
+import httpx
+
+from app.utils.circuit_breaker import ensure_anki_available, guarded_call_async
+from app.utils.clients import get_async_genai_client, run_blocking
+from app.utils.duplicates import ensure_not_duplicate, front_key, record_note
+from app.utils.media import fall_back_to_base64, media_params, transfer_mode
+from app.utils.metrics import record_error, span
+from app.utils.previews import cached_build_async
+from app.utils.rate_limit import rate_limited_async
+from app.utils.sessions import async_http_request
+from app.utils.sync_scheduler import request_sync
+from app.utils.utils import (
+    GEMINI_GENERATION_MODE,
+    GEMINI_MAX_ATTEMPTS,
+    GEMINI_MODEL,
+    IDEMPOTENT_ACTIONS,
+    card_request,
+    english_note,
+    generation_cache,
+    get_definition,
+    get_kana_sentence,
+    get_sentence_with_word,
+    get_sentence_with_word_english,
+    identify_language,
+    japanese_note,
+    japanese_to_hiragana,
+    synthesize_audio,
+    translate_to_english,
+    translate_to_japanese,
+    validate_card_content,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Async version of the note pipeline, used by the ASGI entry point (asgi.py).
+# Gemini, Google Translate and AnkiConnect are awaited on the event loop, so one
+# worker keeps many cards in flight. gTTS, pykakasi and every SQLite-backed
+# cache, index and lock are blocking and run in the pool of `run_blocking`.
+
+
+async def invoke_ankiconnect_async(ankiconnect_url, action, **params):
+    with span(f"ankiconnect_{action}"):
+        return await guarded_call_async(
+            ankiconnect_url, _invoke_ankiconnect_async, ankiconnect_url, action, params
+        )
+
+
+async def _invoke_ankiconnect_async(ankiconnect_url, action, params):
+    payload = {"action": action, "version": 6, "params": params}
+    try:
+        response = await async_http_request(
+            "ankiconnect",
+            "POST",
+            ankiconnect_url,
+            idempotent=action in IDEMPOTENT_ACTIONS,
+            json=payload,
+        )
+        response.raise_for_status()
+    except httpx.ConnectError:
+        logger.error(f"Error: Could not connect to AnkiConnect at {ankiconnect_url}.")
+        raise
+    result = response.json()
+    if result.get("error"):
+        raise Exception(f"AnkiConnect error: {result['error']}")
+    return result.get("result")
+
+
+async def upload_audio_async(filename, clip, ankiconnect_url):
+    """
+    Async version of `upload_audio`.
+    """
+    logger.info(f"Uploading audio: {filename}")
+    mode = transfer_mode()
+    try:
+        params = await run_blocking(media_params, filename, clip, mode)
+        await invoke_ankiconnect_async(ankiconnect_url, "storeMediaFile", **params)
+    except Exception as e:
+        if mode == "base64":
+            raise
+        fall_back_to_base64(e)
+        params = await run_blocking(media_params, filename, clip, "base64")
+        await invoke_ankiconnect_async(ankiconnect_url, "storeMediaFile", **params)
+
+
+async def generate_card_content_async(word, kind, fresh=False):
+    """
+    Async version of `generate_card_content`, sharing its cache.
+    """
+    if not fresh:
+        cached = await run_blocking(
+            generation_cache.get, GEMINI_MODEL, f"card_{kind}", word
+        )
+        if cached:
+            return cached
+
+    prompt, config = card_request(word, kind)
+    error = None
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        try:
+            with span("gemini"):
+                response = await rate_limited_async(
+                    "gemini",
+                    get_async_genai_client().models.generate_content,
+                    model=GEMINI_MODEL,
+                    contents=prompt,
+                    config=config,
+                )
+            content = validate_card_content(json.loads(response.text), kind)
+            await run_blocking(
+                generation_cache.set, content, GEMINI_MODEL, f"card_{kind}", word
+            )
+            return content
+        except (ValueError, TypeError) as e:
+            error = e
+            record_error("gemini")
+            logger.warning(f"Invalid Gemini response for '{word}': {e}")
+    raise Exception(f"Error generating card content for '{word}': {error}")
+
+
+async def get_japanese_sentence_async(word, fresh=False):
+    """
+    Returns the Japanese sentence, romaji and English translation, or three
+    Nones if generation failed.
+    """
+    if GEMINI_GENERATION_MODE != "structured":
+        return await run_blocking(get_sentence_with_word, word, fresh)
+    try:
+        content = await generate_card_content_async(word, "japanese", fresh)
+        return content["sentence"], content["romaji"], content["translation"]
+    except Exception as e:
+        logger.error(e)
+        return None, None, None
+
+
+async def get_english_content_async(word, fresh=False):
+    """
+    Returns the definition and sentence of an English card, or error strings if
+    generation failed.
+    """
+    if GEMINI_GENERATION_MODE != "structured":
+        return await asyncio.gather(
+            run_blocking(get_definition, word, fresh),
+            run_blocking(get_sentence_with_word_english, word, fresh),
+        )
+    try:
+        content = await generate_card_content_async(word, "english", fresh)
+        return content["definition"], content["sentence"]
+    except Exception as e:
+        logger.error(e)
+        return f"Error generating sentence: {e}", f"Error generating sentence: {e}"
+
+
+async def build_note_async(deck_name, word, fresh=False, preflight=None):
+    """
+    Async version of `build_note`. `preflight` is an async callable.
+    """
+    word = word.lower()
+    language = identify_language(word)
+
+    if language == "English":
+        english_word = word
+        translation = await translate_to_japanese(word)
+    else:
+        translation = word
+
+    if preflight:
+        await preflight(translation)
+
+    english_word_task = None
+    if language != "English":
+        english_word_task = asyncio.create_task(translate_to_english(word))
+    kana_word_task = asyncio.create_task(
+        run_blocking(japanese_to_hiragana, translation)
+    )
+    word_audio_task = asyncio.create_task(
+        run_blocking(synthesize_audio, translation, "ja")
+    )
+
+    japanese_sentence, romaji_sentence, english_sentence = (
+        await get_japanese_sentence_async(translation, fresh)
+    )
+    if not japanese_sentence or not romaji_sentence or not english_sentence:
+        logger.warning(f"Skipping note for '{word}' due to sentence generation error.")
+        pending = (english_word_task, kana_word_task, word_audio_task)
+        await asyncio.gather(
+            *(task for task in pending if task), return_exceptions=True
+        )
+        raise Exception("Sentences not found")
+
+    kana_sentence, sentence_audio = await asyncio.gather(
+        run_blocking(get_kana_sentence, japanese_sentence, romaji_sentence),
+        run_blocking(synthesize_audio, japanese_sentence, "ja"),
+    )
+    if english_word_task is not None:
+        english_word = (await english_word_task).lower()
+    kana_word = await kana_word_task
+    word_audio = await word_audio_task
+
+    if not word_audio or not sentence_audio:
+        logger.warning(f"Skipping note for '{word}' due to audio download error.")
+        raise Exception("Audios not found")
+
+    note = japanese_note(
+        deck_name,
+        translation,
+        kana_word,
+        english_word,
+        japanese_sentence,
+        kana_sentence,
+        english_sentence,
+    )
+    return note, {
+        f"{translation}.mp3": word_audio,
+        f"{translation}_sentence.mp3": sentence_audio,
+    }
+
+
+async def build_note_english_async(deck_name, word, fresh=False, preflight=None):
+    """
+    Async version of `build_note_english`. `preflight` is an async callable.
+    """
+    word = word.lower()
+    if identify_language(word) == "Japanese":
+        english_word = (await translate_to_english(word)).lower()
+    else:
+        english_word = word
+
+    if preflight:
+        await preflight(english_word)
+
+    word_audio_task = asyncio.create_task(
+        run_blocking(synthesize_audio, english_word, "en")
+    )
+    english_definition, english_sentence = await get_english_content_async(
+        word, fresh
+    )
+    sentence_audio = None
+    if english_sentence and "Error generating sentence" not in english_sentence:
+        sentence_audio = await run_blocking(
+            synthesize_audio, english_sentence, "en"
+        )
+    word_audio = await word_audio_task
+
+    if not english_sentence or not english_definition:
+        logger.warning(f"Skipping note for '{word}' due to generation error.")
+        raise Exception("Sentence or definition not found")
+
+    if "Error generating sentence" in english_sentence + english_definition:
+        raise Exception("Error generating sentence detected in definition or sentence")
+
+    if not word_audio or not sentence_audio:
+        logger.warning(f"Skipping note for '{word}' due to audio download error.")
+        raise Exception("Audios not found")
+
+    note = english_note(deck_name, english_word, english_definition, english_sentence)
+    return note, {
+        f"{english_word}.mp3": word_audio,
+        f"{english_word}_sentence.mp3": sentence_audio,
+    }
+
+
+async def _add_note_async(stage, build, ankiconnect_url, deck_name, word, fresh):
+    async def preflight(front):
+        await run_blocking(ensure_not_duplicate, ankiconnect_url, deck_name, front)
+
+    with span(stage):
+        try:
+            await run_blocking(ensure_anki_available, ankiconnect_url)
+            note, media = await cached_build_async(
+                build, deck_name, word, fresh, preflight=preflight
+            )
+
+            logger.info("Adding note to Anki...")
+            note_id = await invoke_ankiconnect_async(
+                ankiconnect_url, "addNote", note=note
+            )
+            await run_blocking(
+                record_note, deck_name, note_id, front_key(note["fields"]["Front"])
+            )
+            logger.info(f"Added note for: {word}")
+
+            await asyncio.gather(
+                *(
+                    upload_audio_async(filename, clip, ankiconnect_url)
+                    for filename, clip in media.items()
+                )
+            )
+
+            # Sync once the burst of adds is over
+            await run_blocking(request_sync, ankiconnect_url)
+        except Exception as e:
+            logger.error(f"Skipping note for '{word}' due to error: {e}")
+            raise e
+
+
+async def addnote_async(ankiconnect_url, deck_name, word, fresh=False):
+    await _add_note_async(
+        "addnote", build_note_async, ankiconnect_url, deck_name, word, fresh
+    )
+
+
+async def addnote_english_async(ankiconnect_url, deck_name, word, fresh=False):
+    await _add_note_async(
+        "addnote_english",
+        build_note_english_async,
+        ankiconnect_url,
+        deck_name,
+        word,
+        fresh,
+    )
@@ -0,0 +1,135 @@
+import contextvars
+import hashlib
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+from app.utils.cache import CACHE_DIR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join(CACHE_DIR, "audio"))
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+EVICT_EVERY = 50
+
+_stores = 0
+_sources = contextvars.ContextVar("audio_sources", default=None)
+
+
+def audio_key(text, lang, engine):
+    """
+    Returns the content address of an audio clip.
+
+    Args:
+      text: The text that is spoken.
+      lang: The language code passed to the TTS engine.
+      engine: The TTS engine (and voice) that produced the clip.
+
+    Returns:
+      A hex SHA-256 digest of the three values.
+    """
+    return hashlib.sha256(f"{engine}\0{lang}\0{text}".encode("utf-8")).hexdigest()
+
+
+def audio_path(key):
+    return os.path.join(AUDIO_CACHE_DIR, key[:2], f"{key}.mp3")
+
+
+@contextmanager
+def record_audio_sources():
+    """
+    Collects the text and language of every clip synthesized in the block.
+
+    Yields a dict mapping each audio cache key to a `[text, lang]` pair, from
+    which an evicted clip can be synthesized again. Stages that run in other
+    threads report to it as long as they run in a copy of the context.
+    """
+    sources = {}
+    token = _sources.set(sources)
+    try:
+        yield sources
+    finally:
+        _sources.reset(token)
+
+
+def record_audio_source(key, text, lang):
+    sources = _sources.get()
+    if sources is not None:
+        sources[key] = [text, lang]
+
+
+def get_cached_audio(key):
+    """
+    Returns the path of a cached clip, or None on a miss.
+
+    A hit refreshes the file's modification time, which is what the LRU eviction
+    sorts on.
+    """
+    path = audio_path(key)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def store_audio(key, data):
+    """
+    Stores the bytes of a clip under its key and returns its path.
+
+    The file is written to a temporary name and renamed into place, so other
+    workers never see a partially written clip.
+    """
+    global _stores
+    path = audio_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _stores += 1
+    if _stores % EVICT_EVERY == 1:
+        evict_audio_cache()
+    return path
+
+
+def evict_audio_cache(max_bytes=None):
+    """
+    Deletes the least recently used clips until the cache fits in `max_bytes`.
+    """
+    max_bytes = AUDIO_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    for root, _, files in os.walk(AUDIO_CACHE_DIR):
+        for name in files:
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    if total <= max_bytes:
+        return
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            continue
+    logger.info(f"Audio cache trimmed to {total} bytes")
@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+
+_local = threading.local()
+
+
+def get_connection(db_name="cache.db"):
+    """
+    Returns a SQLite connection for the current thread and process.
+
+    Connections are never shared between threads, and a forked gunicorn worker
+    opens its own instead of reusing the one inherited from the master. WAL mode
+    and a busy timeout let the workers read and write the same file at once.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    connection = connections.get(db_name)
+    if connection is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        connection = sqlite3.connect(
+            os.path.join(CACHE_DIR, db_name), timeout=30, isolation_level=None
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connections[db_name] = connection
+    return connection
+
+
+class SQLiteCache:
+    """
+    A small key/value cache stored in SQLite and shared by every worker.
+
+    Entries expire after `ttl` seconds, and once the table holds more than
+    `max_entries` rows the least recently used ones are evicted. Values must be
+    JSON serializable.
+    """
+
+    def __init__(self, name, ttl, max_entries, db_name="cache.db"):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.db_name = db_name
+        self._writes = 0
+        self._ready = None
+
+    def _connection(self):
+        connection = get_connection(self.db_name)
+        # The table is created once per process and per database file, which
+        # changes with CACHE_DIR.
+        ready = (os.getpid(), os.path.abspath(os.path.join(CACHE_DIR, self.db_name)))
+        if self._ready != ready:
+            connection.execute(
+                f"""CREATE TABLE IF NOT EXISTS "{self.name}" (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            connection.execute(
+                f'CREATE INDEX IF NOT EXISTS "{self.name}_accessed" '
+                f'ON "{self.name}" (accessed_at)'
+            )
+            self._ready = ready
+        return connection
+
+    @staticmethod
+    def make_key(*parts):
+        return json.dumps(parts, ensure_ascii=False)
+
+    def get(self, *parts):
+        """
+        Returns the cached value for the key parts, or None on a miss.
+        """
+        key = self.make_key(*parts)
+        now = time.time()
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                f'SELECT value, created_at FROM "{self.name}" WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl and now - row[1] > self.ttl:
+                connection.execute(f'DELETE FROM "{self.name}" WHERE key = ?', (key,))
+                return None
+            connection.execute(
+                f'UPDATE "{self.name}" SET accessed_at = ? WHERE key = ?', (now, key)
+            )
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.error(f"Cache read failed ({self.name}): {e}")
+            return None
+
+    def set(self, value, *parts):
+        """
+        Stores a value for the key parts.
+        """
+        key = self.make_key(*parts)
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute(
+                f'INSERT OR REPLACE INTO "{self.name}" '
+                "(key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 1:
+                self.evict()
+        except sqlite3.Error as e:
+            logger.error(f"Cache write failed ({self.name}): {e}")
+
+    def delete(self, *parts):
+        try:
+            self._connection().execute(
+                f'DELETE FROM "{self.name}" WHERE key = ?', (self.make_key(*parts),)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Cache delete failed ({self.name}): {e}")
+
+    def evict(self):
+        """
+        Removes expired entries and trims the table to `max_entries`.
+        """
+        connection = self._connection()
+        if self.ttl:
+            connection.execute(
+                f'DELETE FROM "{self.name}" WHERE created_at < ?',
+                (time.time() - self.ttl,),
+            )
+        if self.max_entries:
+            connection.execute(
+                f'DELETE FROM "{self.name}" WHERE key IN ('
+                f'SELECT key FROM "{self.name}" ORDER BY accessed_at DESC '
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
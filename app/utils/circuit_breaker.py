@@ -0,0 +1,328 @@
+import logging
+import os
+import sqlite3
+import time
+
+import httpx
+import requests
+
+from app.utils.cache import get_connection
+from app.utils.clients import run_blocking
+from app.utils.metrics import span
+from app.utils.sessions import http_request
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Consecutive connection failures after which AnkiConnect is considered down.
+ANKI_BREAKER_THRESHOLD = int(os.getenv("ANKI_BREAKER_THRESHOLD", "3"))
+# Seconds requests are rejected before AnkiConnect is probed again.
+ANKI_BREAKER_COOLDOWN = float(os.getenv("ANKI_BREAKER_COOLDOWN", "30"))
+# Seconds a successful call or probe vouches for AnkiConnect.
+ANKI_HEALTH_TTL = float(os.getenv("ANKI_HEALTH_TTL", "10"))
+ANKI_HEALTH_TIMEOUT = float(os.getenv("ANKI_HEALTH_TIMEOUT", "3"))
+
+DB_NAME = "breaker.db"
+FIELDS = ("state", "failures", "opened_at", "healthy_at", "last_error", "probe_at")
+
+_schema_pid = None
+
+
+class AnkiUnavailableError(Exception):
+    """
+    Raised without calling AnkiConnect while its circuit breaker is open.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _connection():
+    global _schema_pid
+    connection = get_connection(DB_NAME)
+    if _schema_pid != os.getpid():
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS breakers (
+                url TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                failures INTEGER NOT NULL,
+                opened_at REAL,
+                healthy_at REAL,
+                last_error TEXT,
+                probe_at REAL
+            )"""
+        )
+        # Tables created before probe_at existed. Another worker may be adding
+        # the column at the same time.
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(breakers)")]
+        if "probe_at" not in columns:
+            try:
+                connection.execute("ALTER TABLE breakers ADD COLUMN probe_at REAL")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):
+                    raise
+        _schema_pid = os.getpid()
+    return connection
+
+
+def _update_breaker(ankiconnect_url, update):
+    """
+    Loads the breaker of an AnkiConnect URL, passes it to `update` and stores
+    the result, all in one transaction shared by every worker.
+    """
+    connection = _connection()
+    now = time.time()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        breaker = _load(ankiconnect_url)
+        result = update(breaker, now)
+        connection.execute(
+            "INSERT OR REPLACE INTO breakers "
+            "(url, state, failures, opened_at, healthy_at, last_error, probe_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (ankiconnect_url, *(breaker[field] for field in FIELDS)),
+        )
+        connection.execute("COMMIT")
+        return result
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+
+def _load(ankiconnect_url):
+    row = (
+        _connection()
+        .execute(
+            "SELECT state, failures, opened_at, healthy_at, last_error, probe_at "
+            "FROM breakers WHERE url = ?",
+            (ankiconnect_url,),
+        )
+        .fetchone()
+    )
+    return dict(zip(FIELDS, row or ("closed", 0, None, None, None, None)))
+
+
+def _retry_after(breaker, now):
+    return max(0.0, breaker["opened_at"] + ANKI_BREAKER_COOLDOWN - now)
+
+
+def _unavailable(breaker, now):
+    retry_after = _retry_after(breaker, now)
+    return AnkiUnavailableError(
+        f"AnkiConnect is unavailable ({breaker['last_error'] or 'not answering'}), "
+        f"retry in {retry_after:.0f}s",
+        retry_after=retry_after,
+    )
+
+
+def is_connection_failure(error):
+    """
+    Tells whether an exception means AnkiConnect could not be reached, as
+    opposed to AnkiConnect answering with an error.
+    """
+    if isinstance(
+        error, (requests.ConnectionError, requests.Timeout, httpx.TransportError)
+    ):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status is not None and status >= 500
+
+
+def record_success(ankiconnect_url):
+    """
+    Closes the breaker after AnkiConnect answered.
+    """
+    breaker = _load(ankiconnect_url)
+    now = time.time()
+    # Skip the write while the breaker is closed and recently confirmed.
+    if (
+        breaker["state"] == "closed"
+        and not breaker["failures"]
+        and breaker["healthy_at"]
+        and now - breaker["healthy_at"] < ANKI_HEALTH_TTL / 2
+    ):
+        return
+
+    def close(breaker, now):
+        if breaker["state"] != "closed":
+            logger.info(f"AnkiConnect at {ankiconnect_url} is back, closing breaker")
+        breaker.update(state="closed", failures=0, healthy_at=now, last_error=None)
+
+    _update_breaker(ankiconnect_url, close)
+
+
+def record_failure(ankiconnect_url, error):
+    """
+    Counts a failed call. The breaker opens after `ANKI_BREAKER_THRESHOLD`
+    consecutive failures, or right away if a half-open probe failed.
+    """
+
+    def fail(breaker, now):
+        breaker["failures"] += 1
+        breaker["last_error"] = str(error)[:200]
+        if breaker["state"] == "half_open" or (
+            breaker["state"] == "closed"
+            and breaker["failures"] >= ANKI_BREAKER_THRESHOLD
+        ):
+            logger.warning(
+                f"Opening breaker for AnkiConnect at {ankiconnect_url} for "
+                f"{ANKI_BREAKER_COOLDOWN:.0f}s: {error}"
+            )
+            breaker.update(state="open", opened_at=now)
+
+    _update_breaker(ankiconnect_url, fail)
+
+
+def check_breaker(ankiconnect_url):
+    """
+    Raises AnkiUnavailableError while the breaker is open or another worker is
+    probing AnkiConnect.
+    """
+    breaker = _load(ankiconnect_url)
+    now = time.time()
+    if breaker["state"] == "half_open":
+        raise _unavailable(breaker, now)
+    if breaker["state"] == "open" and _retry_after(breaker, now) > 0:
+        raise _unavailable(breaker, now)
+
+
+def _claim_probe(ankiconnect_url):
+    """
+    Returns whether this caller should probe AnkiConnect now. After the
+    cooldown, a single caller across all workers moves the breaker to
+    half-open and probes. While the breaker is closed, a single caller takes
+    the health check and the others go on with the last result until the
+    probe times out.
+    """
+
+    def claim(breaker, now):
+        if breaker["state"] == "closed":
+            healthy_at = breaker["healthy_at"] or 0
+            probe_at = breaker["probe_at"] or 0
+            if now - healthy_at < ANKI_HEALTH_TTL:
+                return False
+            if now - probe_at < 2 * ANKI_HEALTH_TIMEOUT:
+                return False
+            breaker["probe_at"] = now
+            return True
+        if breaker["state"] == "open" and _retry_after(breaker, now) <= 0:
+            breaker["state"] = "half_open"
+            # Reuse opened_at so that a probe that dies leaves the breaker
+            # half-open for one cooldown at most.
+            breaker["opened_at"] = now
+            return True
+        if breaker["state"] == "half_open" and _retry_after(breaker, now) <= 0:
+            breaker["opened_at"] = now
+            return True
+        return False
+
+    return _update_breaker(ankiconnect_url, claim)
+
+
+def probe(ankiconnect_url):
+    """
+    Asks AnkiConnect for its `version` and records the outcome.
+
+    Returns:
+      True if AnkiConnect answered.
+    """
+    payload = {"action": "version", "version": 6}
+    try:
+        with span("ankiconnect_health"):
+            response = http_request(
+                "ankiconnect",
+                "POST",
+                ankiconnect_url,
+                idempotent=True,
+                timeout=(ANKI_HEALTH_TIMEOUT, ANKI_HEALTH_TIMEOUT),
+                retries=False,
+                json=payload,
+            )
+            response.raise_for_status()
+            response.json()
+    except (requests.RequestException, ValueError) as e:
+        record_failure(ankiconnect_url, e)
+        return False
+    record_success(ankiconnect_url)
+    return True
+
+
+def ensure_anki_available(ankiconnect_url):
+    """
+    Fails fast before any Gemini or gTTS call if AnkiConnect is down.
+
+    AnkiConnect is probed when nothing has vouched for it in the last
+    `ANKI_HEALTH_TTL` seconds, or once the cooldown of an open breaker is over.
+
+    Raises:
+      AnkiUnavailableError: If the breaker is open or the probe failed.
+    """
+    breaker = _load(ankiconnect_url)
+    healthy_at = breaker["healthy_at"] or 0
+    if breaker["state"] == "closed" and time.time() - healthy_at < ANKI_HEALTH_TTL:
+        return
+    check_breaker(ankiconnect_url)
+    if _claim_probe(ankiconnect_url) and not probe(ankiconnect_url):
+        breaker = _load(ankiconnect_url)
+        if breaker["state"] != "closed":
+            raise _unavailable(breaker, time.time())
+        raise AnkiUnavailableError(
+            f"AnkiConnect is unavailable ({breaker['last_error']})"
+        )
+
+
+def guarded_call(ankiconnect_url, func, *args):
+    """
+    Calls AnkiConnect through the breaker: rejected while it is open, and the
+    outcome is recorded.
+    """
+    check_breaker(ankiconnect_url)
+    try:
+        result = func(*args)
+    except Exception as e:
+        if is_connection_failure(e):
+            record_failure(ankiconnect_url, e)
+        else:
+            record_success(ankiconnect_url)
+        raise
+    record_success(ankiconnect_url)
+    return result
+
+
+async def guarded_call_async(ankiconnect_url, func, *args):
+    """
+    Async version of `guarded_call` for a coroutine function. The breaker is
+    read and written in the pool of `run_blocking`.
+    """
+    await run_blocking(check_breaker, ankiconnect_url)
+    try:
+        result = await func(*args)
+    except Exception as e:
+        if is_connection_failure(e):
+            await run_blocking(record_failure, ankiconnect_url, e)
+        else:
+            await run_blocking(record_success, ankiconnect_url)
+        raise
+    await run_blocking(record_success, ankiconnect_url)
+    return result
+
+
+def breaker_status(ankiconnect_url):
+    """
+    Returns the state of the breaker for the health endpoint.
+    """
+    breaker = _load(ankiconnect_url)
+    now = time.time()
+    status = {
+        "state": breaker["state"],
+        "failures": breaker["failures"],
+        "last_error": breaker["last_error"],
+        "healthy_seconds_ago": (
+            round(now - breaker["healthy_at"], 1) if breaker["healthy_at"] else None
+        ),
+    }
+    if breaker["state"] != "closed":
+        status["retry_after"] = round(_retry_after(breaker, now), 1)
+    return status
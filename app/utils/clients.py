@@ -0,0 +1,210 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+# google.genai, googletrans, gtts and pykakasi are imported on first use: they
+# take most of the startup time and memory of a worker, and the CLI commands
+# and the metrics endpoint don't need them. See `preload` for loading them in
+# the gunicorn master instead.
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ASYNC_BLOCKING_WORKERS = int(os.getenv("ASYNC_BLOCKING_WORKERS", "32"))
+
+_lock = threading.Lock()
+_instances = {}
+_instances_pid = None
+_loop_instances = weakref.WeakKeyDictionary()
+
+
+def _get_instance(name, factory):
+    """
+    Returns the process-wide instance called `name`, creating it on first use.
+
+    Instances are dropped after a fork so that a gunicorn worker never shares
+    sockets or event loops with the master.
+    """
+    global _instances, _instances_pid
+    if _instances_pid == os.getpid() and name in _instances:
+        return _instances[name]
+    with _lock:
+        if _instances_pid != os.getpid():
+            _instances = {}
+            _instances_pid = os.getpid()
+        if name not in _instances:
+            _instances[name] = factory()
+        return _instances[name]
+
+
+def _get_loop_instance(name, factory):
+    """
+    Returns the instance called `name` for the running event loop.
+
+    Async clients keep connections that belong to the loop they were first used
+    on, so each loop gets its own.
+    """
+    instances = _loop_instances.setdefault(asyncio.get_running_loop(), {})
+    if name not in instances:
+        instances[name] = factory()
+    return instances[name]
+
+
+def _new_genai_client():
+    from google import genai
+
+    return genai.Client()
+
+
+def _new_translator():
+    from googletrans import Translator
+
+    return Translator()
+
+
+def _new_kakasi():
+    import pykakasi
+
+    return pykakasi.kakasi()
+
+
+def genai_types():
+    """
+    Returns the `google.genai.types` module.
+    """
+    from google.genai import types
+
+    return types
+
+
+def get_gtts():
+    """
+    Returns the gTTS class.
+    """
+    from gtts import gTTS
+
+    return gTTS
+
+
+def get_genai_client():
+    return _get_instance("genai", _new_genai_client)
+
+
+def get_async_genai_client():
+    """
+    Returns the async (`client.aio`) Gemini client of the running event loop.
+    """
+    return _get_loop_instance("genai", _new_genai_client).aio
+
+
+def get_translator():
+    """
+    Returns the translator of the running event loop.
+    """
+    return _get_loop_instance("translator", _new_translator)
+
+
+def get_kakasi():
+    return _get_instance("kakasi", _new_kakasi)
+
+
+def _start_event_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(
+        target=loop.run_forever, name="async-clients", daemon=True
+    )
+    thread.start()
+    return loop
+
+
+def get_event_loop():
+    """
+    Returns a long-lived event loop running in a background thread.
+    """
+    return _get_instance("event_loop", _start_event_loop)
+
+
+def run_async(coroutine):
+    """
+    Runs a coroutine on the long-lived event loop and waits for its result.
+
+    Use this from synchronous code instead of `asyncio.run`, which creates and
+    tears down a new event loop on every call.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()).result()
+
+
+def get_blocking_executor():
+    """
+    Returns the thread pool that runs blocking calls for coroutines: gTTS,
+    pykakasi and every SQLite-backed cache, index and lock.
+    """
+    return _get_instance(
+        "blocking_executor",
+        lambda: ThreadPoolExecutor(
+            max_workers=ASYNC_BLOCKING_WORKERS, thread_name_prefix="async-blocking"
+        ),
+    )
+
+
+async def run_blocking(func, *args):
+    """
+    Runs a blocking call in `get_blocking_executor()` without blocking the loop.
+
+    Like `asyncio.to_thread`, the call sees the caller's context, but the pool
+    is sized for I/O-bound calls such as gTTS rather than for the CPU count.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_blocking_executor(), context.run, func, *args
+    )
+
+
+async def _warm_translator():
+    get_translator()
+
+
+def _warm_kakasi():
+    # pykakasi loads its dictionaries on the first conversion.
+    get_kakasi().convert("日本語")
+
+
+def warm_up():
+    """
+    Creates the shared clients up front so the first request doesn't pay for it.
+    """
+    for name, getter in (
+        ("event loop", get_event_loop),
+        ("pykakasi", _warm_kakasi),
+        ("translator", lambda: run_async(_warm_translator())),
+        ("Gemini client", get_genai_client),
+    ):
+        try:
+            getter()
+        except Exception as e:
+            logger.warning(f"Could not warm up the {name}: {e}")
+
+
+def preload():
+    """
+    Imports the client libraries and loads pykakasi's dictionaries without
+    creating any client.
+
+    Meant for the gunicorn master with `preload_app`: everything loaded here is
+    inherited by the workers and shared copy-on-write, while clients, sockets
+    and threads are only created in the workers by `warm_up`.
+    """
+    started = time.perf_counter()
+    genai_types()
+    get_gtts()
+    _new_translator()
+    # pykakasi keeps its dictionaries in class-level state, so loading them
+    # through a throwaway instance is enough for every later one to share them.
+    _new_kakasi().convert("日本語")
+    logger.info(f"Preloaded client libraries in {time.perf_counter() - started:.2f}s")
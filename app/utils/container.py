@@ -1,9 +1,19 @@
+import base64
+import fcntl
+import json
 import logging
 import os
+import threading
 import time
+from contextlib import contextmanager
 
 import requests
 
+from app.utils.cache import CACHE_DIR
+from app.utils.circuit_breaker import record_success
+from app.utils.metrics import span
+from app.utils.sessions import http_request
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -13,22 +23,55 @@ USERNAME = os.getenv("PORTAINER_USERNAME")
 PASSWORD = os.getenv("PORTAINER_PASSWORD")
 ENDPOINT_ID = os.getenv("PORTAINER_ENDPOINT_ID", "1")
 CONTAINER_ID = os.getenv("PORTAINER_CONTAINER_ID")
+CONTAINER_STATUS_TTL = float(os.getenv("CONTAINER_STATUS_TTL", "30"))
+ANKI_READY_TIMEOUT = float(os.getenv("ANKI_READY_TIMEOUT", "60"))
+ANKI_READY_INTERVAL = 0.5
+JWT_DEFAULT_TTL = 8 * 3600
+JWT_EXPIRY_MARGIN = 60
+
+_jwt = {"token": None, "expires_at": 0.0}
+_running_checked_at = 0.0
+_start_lock = threading.Lock()
 
 
 # === AUTHENTICATE AND GET JWT TOKEN ===
 def get_jwt_token():
     url = f"{PORTAINER_URL}/api/auth"
     payload = {"Username": USERNAME, "Password": PASSWORD}
-    response = requests.post(url, json=payload)
+    response = http_request("portainer", "POST", url, idempotent=True, json=payload)
     response.raise_for_status()
     return response.json()["jwt"]
 
 
+def _jwt_expiry(token):
+    """
+    Reads the `exp` claim of a JWT without verifying it.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return time.time() + JWT_DEFAULT_TTL
+
+
+def get_cached_jwt_token(refresh=False):
+    """
+    Returns a Portainer JWT, logging in again only when it is about to expire.
+    """
+    if refresh or time.time() >= _jwt["expires_at"] - JWT_EXPIRY_MARGIN:
+        token = get_jwt_token()
+        _jwt.update(token=token, expires_at=_jwt_expiry(token))
+    return _jwt["token"]
+
+
 # === STOP THE CONTAINER ===
 def stop_container(jwt_token):
     url = f"{PORTAINER_URL}/api/endpoints/{ENDPOINT_ID}/docker/containers/{CONTAINER_ID}/stop"
     headers = {"Authorization": f"Bearer {jwt_token}"}
-    response = requests.post(url, headers=headers)
+    response = http_request(
+        "portainer", "POST", url, idempotent=True, headers=headers
+    )
 
     if response.status_code == 204:
         logger.info(f"Container '{CONTAINER_ID}' stopped successfully.")
@@ -45,7 +88,9 @@ def stop_container(jwt_token):
 def start_container(jwt_token):
     url = f"{PORTAINER_URL}/api/endpoints/{ENDPOINT_ID}/docker/containers/{CONTAINER_ID}/start"
     headers = {"Authorization": f"Bearer {jwt_token}"}
-    response = requests.post(url, headers=headers)
+    response = http_request(
+        "portainer", "POST", url, idempotent=True, headers=headers
+    )
 
     if response.status_code == 204:
         logger.info(f"Container '{CONTAINER_ID}' started successfully.")
@@ -61,28 +106,104 @@ def start_container(jwt_token):
 def get_container_status(jwt_token):
     url = f"{PORTAINER_URL}/api/endpoints/{ENDPOINT_ID}/docker/containers/{CONTAINER_ID}/json"
     headers = {"Authorization": f"Bearer {jwt_token}"}
-    response = requests.get(url, headers=headers)
+    response = http_request(
+        "portainer", "GET", url, idempotent=True, headers=headers
+    )
     response.raise_for_status()
     data = response.json()
     return data["State"]["Status"]  # e.g., "running", "exited"
 
 
-def handle_container():
+def _get_status():
     try:
-        token = get_jwt_token()
-        status = get_container_status(token)
-
-        logger.info(f"Current container status: {status}")
-
-        if status == "exited" or status == "created":
-            start_container(token)
-            logger.info("Waiting...")
-            time.sleep(10)
-        elif status == "running":
-            logger.info(f"Container '{CONTAINER_ID}' is already running.")
-        else:
-            logger.warning(f"Container is in an unexpected state: {status}")
-            raise Exception("Container is in an unexpected state")
+        return get_container_status(get_cached_jwt_token())
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code != 401:
+            raise
+        # The token was revoked or Portainer restarted: log in again once.
+        return get_container_status(get_cached_jwt_token(refresh=True))
+
+
+def wait_for_ankiconnect(ankiconnect_url, timeout=None):
+    """
+    Polls AnkiConnect's `version` action until it answers or the deadline passes.
+    """
+    deadline = time.monotonic() + (ANKI_READY_TIMEOUT if timeout is None else timeout)
+    payload = {"action": "version", "version": 6}
+    while True:
+        try:
+            # This loop is the retry: a retrying session would stack its own
+            # backoff on top of every attempt.
+            response = http_request(
+                "ankiconnect",
+                "POST",
+                ankiconnect_url,
+                json=payload,
+                timeout=(1, 2),
+                retries=False,
+            )
+            response.raise_for_status()
+            logger.info(f"AnkiConnect is ready (version {response.json()['result']})")
+            record_success(ankiconnect_url)
+            return
+        except (requests.RequestException, ValueError, KeyError):
+            if time.monotonic() >= deadline:
+                raise Exception("AnkiConnect did not become ready in time")
+            time.sleep(ANKI_READY_INTERVAL)
+
+
+@contextmanager
+def _start_file_lock():
+    """
+    Serializes container starts across gunicorn workers.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(os.path.join(CACHE_DIR, "container.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@span("container")
+def handle_container(ankiconnect_url=None):
+    """
+    Makes sure the Anki container is running and AnkiConnect answers.
+
+    A "running" status is trusted for `CONTAINER_STATUS_TTL` seconds without
+    asking Portainer again. When the container has to be started, concurrent
+    requests in every worker share the same start instead of each triggering
+    their own. The lock is released once the start was sent, and each request
+    then polls AnkiConnect until it is ready, so a slow Anki start doesn't hold
+    a thread of every worker on the lock.
+    """
+    global _running_checked_at
+    ankiconnect_url = ankiconnect_url or os.getenv("ANKICONNECT_URL")
+    if time.monotonic() - _running_checked_at < CONTAINER_STATUS_TTL:
+        return
+
+    try:
+        with _start_lock, _start_file_lock():
+            if time.monotonic() - _running_checked_at < CONTAINER_STATUS_TTL:
+                return
+
+            status = _get_status()
+            logger.info(f"Current container status: {status}")
+
+            if status == "exited" or status == "created":
+                start_container(get_cached_jwt_token())
+                logger.info("Waiting for AnkiConnect...")
+            elif status == "running":
+                logger.info(f"Container '{CONTAINER_ID}' is already running.")
+            else:
+                logger.warning(f"Container is in an unexpected state: {status}")
+                raise Exception("Container is in an unexpected state")
+
+        # Also covers a container that another worker has just started.
+        if ankiconnect_url:
+            wait_for_ankiconnect(ankiconnect_url)
+        _running_checked_at = time.monotonic()
     except requests.RequestException as e:
         logger.error(f"Request failed: {e}")
         raise e
@@ -0,0 +1,194 @@
+import html
+import logging
+import os
+import re
+import threading
+import time
+
+from app.utils.cache import get_connection
+from app.utils.metrics import span
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DUPLICATE_CHECK = os.getenv("DUPLICATE_CHECK", "True").lower() == "true"
+DUPLICATE_INDEX_TTL = float(os.getenv("DUPLICATE_INDEX_TTL", "60"))
+NOTES_INFO_CHUNK = 500
+
+DB_NAME = "notes.db"
+
+_schema_pid = None
+_refresh_lock = threading.Lock()
+
+
+class DuplicateNoteError(Exception):
+    """
+    Raised when a note for the word already exists in the deck.
+    """
+
+
+def _connection():
+    global _schema_pid
+    connection = get_connection(DB_NAME)
+    if _schema_pid != os.getpid():
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS note_index (
+                deck TEXT NOT NULL,
+                note_id INTEGER NOT NULL,
+                front TEXT NOT NULL,
+                PRIMARY KEY (deck, note_id)
+            )"""
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS note_index_front ON note_index (deck, front)"
+        )
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS note_index_state (
+                deck TEXT PRIMARY KEY,
+                refreshed_at REAL NOT NULL
+            )"""
+        )
+        _schema_pid = os.getpid()
+    return connection
+
+
+def normalize_front(text):
+    return text.strip().lower()
+
+
+def front_key(front_html):
+    """
+    Extracts the word from the Front field of a note.
+
+    Notes created by this app keep the word in the first <span>. For other
+    notes the first line of the field, without HTML, is used.
+    """
+    match = re.search(r"<span[^>]*>(.*?)</span>", front_html, re.DOTALL)
+    text = match.group(1) if match else re.split(r"<br\s*/?>", front_html)[0]
+    text = re.sub(r"\[sound:[^\]]*\]", "", re.sub(r"<[^>]+>", "", text))
+    return normalize_front(html.unescape(text))
+
+
+def record_note(deck_name, note_id, front):
+    """
+    Adds a note this app just created to the local index.
+    """
+    if not note_id:
+        return
+    _connection().execute(
+        "INSERT OR REPLACE INTO note_index (deck, note_id, front) VALUES (?, ?, ?)",
+        (deck_name, note_id, normalize_front(front)),
+    )
+
+
+def refresh_deck_index(ankiconnect_url, deck_name):
+    """
+    Brings the index of a deck up to date with Anki.
+
+    Only notes that are new since the last refresh are fetched with
+    `notesInfo`; notes that were deleted in Anki are dropped from the index.
+    """
+    # Imported here because utils imports this module.
+    from app.utils.utils import invoke_ankiconnect
+
+    connection = _connection()
+    note_ids = set(
+        invoke_ankiconnect(
+            ankiconnect_url, "findNotes", query=f'"deck:{deck_name}"'
+        )
+    )
+    known_ids = {
+        row[0]
+        for row in connection.execute(
+            "SELECT note_id FROM note_index WHERE deck = ?", (deck_name,)
+        )
+    }
+
+    new_ids = sorted(note_ids - known_ids)
+    rows = []
+    for start in range(0, len(new_ids), NOTES_INFO_CHUNK):
+        chunk = new_ids[start : start + NOTES_INFO_CHUNK]
+        for info in invoke_ankiconnect(ankiconnect_url, "notesInfo", notes=chunk):
+            front = info.get("fields", {}).get("Front", {}).get("value")
+            if front is not None:
+                rows.append((deck_name, info["noteId"], front_key(front)))
+
+    removed_ids = known_ids - note_ids
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.executemany(
+            "INSERT OR REPLACE INTO note_index (deck, note_id, front) VALUES (?, ?, ?)",
+            rows,
+        )
+        connection.executemany(
+            "DELETE FROM note_index WHERE deck = ? AND note_id = ?",
+            [(deck_name, note_id) for note_id in removed_ids],
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO note_index_state (deck, refreshed_at) "
+            "VALUES (?, ?)",
+            (deck_name, time.time()),
+        )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    if rows or removed_ids:
+        logger.info(
+            f"Note index for '{deck_name}': {len(rows)} added, "
+            f"{len(removed_ids)} removed"
+        )
+
+
+def _refresh_if_stale(ankiconnect_url, deck_name):
+    connection = _connection()
+    row = connection.execute(
+        "SELECT refreshed_at FROM note_index_state WHERE deck = ?", (deck_name,)
+    ).fetchone()
+    if row and time.time() - row[0] < DUPLICATE_INDEX_TTL:
+        return
+    with _refresh_lock:
+        row = connection.execute(
+            "SELECT refreshed_at FROM note_index_state WHERE deck = ?", (deck_name,)
+        ).fetchone()
+        if not row or time.time() - row[0] >= DUPLICATE_INDEX_TTL:
+            refresh_deck_index(ankiconnect_url, deck_name)
+
+
+def is_duplicate(ankiconnect_url, deck_name, front, refresh=True):
+    """
+    Tells whether the deck already has a note for the word.
+
+    Uses the local index, refreshed from Anki at most every
+    `DUPLICATE_INDEX_TTL` seconds. If Anki can't be reached the check is
+    skipped and `addNote` remains the final duplicate check. With
+    `refresh=False` the index is used as it is and Anki is never called.
+    """
+    if not DUPLICATE_CHECK:
+        return False
+    if refresh:
+        try:
+            with span("duplicate_check"):
+                _refresh_if_stale(ankiconnect_url, deck_name)
+        except Exception as e:
+            logger.warning(
+                f"Could not refresh the note index for '{deck_name}': {e}"
+            )
+    row = (
+        _connection()
+        .execute(
+            "SELECT 1 FROM note_index WHERE deck = ? AND front = ? LIMIT 1",
+            (deck_name, normalize_front(front)),
+        )
+        .fetchone()
+    )
+    return row is not None
+
+
+def ensure_not_duplicate(ankiconnect_url, deck_name, front, refresh=True):
+    """
+    Raises DuplicateNoteError if the deck already has a note for the word.
+    """
+    if is_duplicate(ankiconnect_url, deck_name, front, refresh):
+        logger.info(f"'{front}' is already in '{deck_name}', skipping")
+        raise DuplicateNoteError(f"'{front}' is already in the '{deck_name}' deck")
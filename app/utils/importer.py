@@ -0,0 +1,197 @@
+import csv
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.duplicates import DuplicateNoteError
+from app.utils.utils import addnote, addnote_english
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "4"))
+IMPORT_PROGRESS_EVERY = 50
+
+
+def read_entries(path, default_deck):
+    """
+    Streams the words of an import file without loading it into memory.
+
+    CSV files (`.csv`) need a `word` column and may have a `deck` column
+    ("japanese" or "english"). Other files have one word per line; blank lines
+    and lines starting with `#` are skipped.
+
+    Yields:
+      (index, word, deck) tuples, where index counts the words in the file.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = (
+                (row.get("word") or "", row.get("deck") or default_deck)
+                for row in csv.DictReader(f)
+            )
+        else:
+            rows = (
+                (line, default_deck) for line in f if not line.lstrip().startswith("#")
+            )
+        index = 0
+        for word, deck in rows:
+            word = word.strip()
+            if not word:
+                continue
+            yield index, word, deck.strip().lower()
+            index += 1
+
+
+class Checkpoint:
+    """
+    Remembers which words of an import are finished.
+
+    Words finish out of order, so the file stores the position before which
+    every word is finished plus the few finished words after it. Words that
+    failed are finished too, but are also listed as failed so that a resumed
+    import tries them again. Its size is bounded by the concurrency and the
+    number of failed words, not by the input.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.position = 0
+        self.done = set()
+        self.failed = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.position = state["position"]
+            self.done = set(state["done"])
+            self.failed = set(state.get("failed", []))
+
+    def is_done(self, index):
+        if index in self.failed:
+            return False
+        return index < self.position or index in self.done
+
+    def complete(self, index, failed=False):
+        with self._lock:
+            if failed:
+                self.failed.add(index)
+            else:
+                self.failed.discard(index)
+            if index >= self.position:
+                self.done.add(index)
+            while self.position in self.done:
+                self.done.remove(self.position)
+                self.position += 1
+            state = {
+                "position": self.position,
+                "done": sorted(self.done),
+                "failed": sorted(self.failed),
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+
+
+def import_words(
+    ankiconnect_url,
+    path,
+    default_deck="japanese",
+    concurrency=None,
+    checkpoint_path=None,
+    fresh=False,
+    max_consecutive_failures=10,
+):
+    """
+    Adds every word of a file to Anki through the note pipeline.
+
+    At most `concurrency` words are in flight at a time and the file is read as
+    words are submitted, so memory use doesn't depend on the file size. Every
+    added or duplicate word is recorded in the checkpoint file, and a new run
+    with the same checkpoint skips it. Words that fail, e.g. on a 429 or while
+    AnkiConnect is down, are retried by the next run, and are also appended to
+    `<checkpoint>.failed.csv` as a report. The import
+    stops early after `max_consecutive_failures` failures in a row, e.g. when an
+    API is rate limiting.
+
+    Args:
+      ankiconnect_url: The AnkiConnect URL.
+      path: The text or CSV file to import.
+      default_deck: The deck of words without a `deck` column.
+      concurrency: How many words are processed at once.
+      checkpoint_path: The checkpoint file. Defaults to `<path>.checkpoint`.
+      fresh: Skip the generation cache and ask Gemini for new content.
+      max_consecutive_failures: Failures in a row before giving up.
+
+    Returns:
+      A dict with the number of words added, skipped as duplicates, failed and
+      already done in a previous run, and whether the import was stopped.
+    """
+    concurrency = concurrency or IMPORT_CONCURRENCY
+    checkpoint = Checkpoint(checkpoint_path or f"{path}.checkpoint")
+    failed_path = f"{checkpoint.path}.failed.csv"
+    counts = {"added": 0, "duplicate": 0, "failed": 0, "resumed": 0}
+    state = {"consecutive_failures": 0, "stopped": False}
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def record_failure(word, deck, error):
+        new_file = not os.path.exists(failed_path)
+        with open(failed_path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["word", "deck", "error"])
+            writer.writerow([word, deck, error])
+
+    def process(index, word, deck):
+        add = addnote if deck == "japanese" else addnote_english
+        try:
+            add(ankiconnect_url, deck.capitalize(), word, fresh)
+            status = "added"
+        except DuplicateNoteError:
+            status = "duplicate"
+        except Exception as e:
+            status = "failed"
+            with lock:
+                record_failure(word, deck, str(e))
+        with lock:
+            counts[status] += 1
+            if status == "failed":
+                state["consecutive_failures"] += 1
+                if state["consecutive_failures"] >= max_consecutive_failures:
+                    state["stopped"] = True
+            else:
+                state["consecutive_failures"] = 0
+            finished = counts["added"] + counts["duplicate"] + counts["failed"]
+        checkpoint.complete(index, failed=status == "failed")
+        if finished % IMPORT_PROGRESS_EVERY == 0:
+            logger.info(f"Import progress: {counts}")
+
+    def run(index, word, deck):
+        try:
+            process(index, word, deck)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="import"
+    ) as executor:
+        for index, word, deck in read_entries(path, default_deck):
+            if checkpoint.is_done(index):
+                counts["resumed"] += 1
+                continue
+            slots.acquire()
+            if state["stopped"]:
+                slots.release()
+                logger.error(
+                    f"Stopping the import after {max_consecutive_failures} "
+                    "failures in a row; run it again to resume"
+                )
+                break
+            executor.submit(run, index, word, deck)
+
+    logger.info(f"Import finished: {counts}")
+    return dict(counts, stopped=state["stopped"])
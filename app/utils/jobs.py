@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.utils.cache import get_connection
+from app.utils.metrics import collect_timings, server_timing_header, span
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+
+DB_NAME = "jobs.db"
+
+_handlers = {}
+_workers_pid = None
+_workers_lock = threading.Lock()
+_schema_pid = None
+
+
+def _connection():
+    global _schema_pid
+    connection = get_connection(DB_NAME)
+    if _schema_pid != os.getpid():
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                lease_until REAL,
+                timings TEXT
+            )"""
+        )
+        # Tables created before jobs kept their timings. Another worker may be
+        # adding the column at the same time.
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(jobs)")]
+        if "timings" not in columns:
+            try:
+                connection.execute("ALTER TABLE jobs ADD COLUMN timings TEXT")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):
+                    raise
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+        )
+        _schema_pid = os.getpid()
+    return connection
+
+
+def register_job_handler(kind, handler):
+    """
+    Registers the function that runs jobs of a kind.
+
+    The handler is called as `handler(payload, progress)`, where `progress` is a
+    callable that records the name of the stage the job is in. Its return value
+    must be JSON serializable and becomes the job result.
+    """
+    _handlers[kind] = handler
+
+
+def enqueue_job(kind, payload):
+    """
+    Stores a new job and returns its id. The job workers of this process are
+    started if they aren't running yet.
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    _connection().execute(
+        "INSERT INTO jobs (id, kind, payload, status, stage, created_at, updated_at) "
+        "VALUES (?, ?, ?, 'queued', 'queued', ?, ?)",
+        (job_id, kind, json.dumps(payload), now, now),
+    )
+    start_job_workers()
+    return job_id
+
+
+def get_job(job_id):
+    """
+    Returns a job as a dict, or None if it doesn't exist. A finished job has
+    the stages it went through as a Server-Timing header value in "timings".
+    """
+    row = (
+        _connection()
+        .execute(
+            "SELECT id, kind, status, stage, result, error, attempts, created_at, "
+            "updated_at, timings FROM jobs WHERE id = ?",
+            (job_id,),
+        )
+        .fetchone()
+    )
+    if row is None:
+        return None
+    return {
+        "id": row[0],
+        "kind": row[1],
+        "status": row[2],
+        "stage": row[3],
+        "result": json.loads(row[4]) if row[4] else None,
+        "error": row[5],
+        "attempts": row[6],
+        "created_at": row[7],
+        "updated_at": row[8],
+        "timings": row[9],
+    }
+
+
+def _claim_job():
+    """
+    Atomically takes the oldest queued job, or one whose lease has expired
+    because the worker running it died.
+    """
+    connection = _connection()
+    now = time.time()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        row = connection.execute(
+            "SELECT id, kind, payload, attempts FROM jobs "
+            "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+            "ORDER BY created_at LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row is None:
+            connection.execute("COMMIT")
+            return None
+        job_id, kind, payload, attempts = row
+        if attempts >= JOB_MAX_ATTEMPTS:
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+                "WHERE id = ?",
+                ("Job was interrupted too many times", now, job_id),
+            )
+            connection.execute("COMMIT")
+            return None
+        connection.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+            "lease_until = ?, updated_at = ? WHERE id = ?",
+            (now + JOB_LEASE_SECONDS, now, job_id),
+        )
+        connection.execute("COMMIT")
+        return job_id, kind, json.loads(payload)
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+
+def _update_job(job_id, **fields):
+    fields["updated_at"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    _connection().execute(
+        f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id)
+    )
+
+
+def _run_job(job_id, kind, payload):
+    handler = _handlers.get(kind)
+    if handler is None:
+        _update_job(job_id, status="failed", error=f"No handler for '{kind}' jobs")
+        return
+
+    def progress(stage):
+        _update_job(
+            job_id, stage=stage, lease_until=time.time() + JOB_LEASE_SECONDS
+        )
+
+    fields = {}
+    with collect_timings() as timings:
+        try:
+            with span("total"):
+                result = handler(payload, progress)
+            fields.update(status="done", stage="done", result=json.dumps(result))
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            fields.update(status="failed", stage="failed", error=str(e))
+    _update_job(job_id, timings=server_timing_header(timings), **fields)
+
+
+def _purge_old_jobs():
+    _connection().execute(
+        "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+        (time.time() - JOB_RETENTION,),
+    )
+
+
+def _worker_loop():
+    while True:
+        try:
+            job = _claim_job()
+        except Exception as e:
+            logger.error(f"Could not claim a job: {e}")
+            job = None
+        if job is None:
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        _run_job(*job)
+
+
+def start_job_workers():
+    """
+    Starts the bounded pool of background job workers for this process.
+
+    Safe to call more than once; after a fork the new process starts its own
+    workers. Jobs left queued or running by a previous process are picked up
+    again, since the queue lives in SQLite.
+    """
+    global _workers_pid
+    if JOB_WORKERS <= 0 or _workers_pid == os.getpid():
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        _workers_pid = os.getpid()
+        try:
+            _purge_old_jobs()
+        except Exception as e:
+            logger.error(f"Could not purge old jobs: {e}")
+        for index in range(JOB_WORKERS):
+            threading.Thread(
+                target=_worker_loop, name=f"job-worker-{index}", daemon=True
+            ).start()
+        logger.info(f"Started {JOB_WORKERS} job workers")
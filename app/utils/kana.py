@@ -0,0 +1,129 @@
+import logging
+import re
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VOWELS = "aiueo"
+
+# fmt: off
+ROMAJI_TO_HIRAGANA = {
+    "a": "あ", "i": "い", "u": "う", "e": "え", "o": "お",
+    "ka": "か", "ki": "き", "ku": "く", "ke": "け", "ko": "こ",
+    "kya": "きゃ", "kyu": "きゅ", "kyo": "きょ",
+    "ga": "が", "gi": "ぎ", "gu": "ぐ", "ge": "げ", "go": "ご",
+    "gya": "ぎゃ", "gyu": "ぎゅ", "gyo": "ぎょ",
+    "sa": "さ", "shi": "し", "si": "し", "su": "す", "se": "せ", "so": "そ",
+    "sha": "しゃ", "shu": "しゅ", "she": "しぇ", "sho": "しょ",
+    "sya": "しゃ", "syu": "しゅ", "syo": "しょ",
+    "za": "ざ", "ji": "じ", "zi": "じ", "zu": "ず", "ze": "ぜ", "zo": "ぞ",
+    "ja": "じゃ", "ju": "じゅ", "je": "じぇ", "jo": "じょ",
+    "jya": "じゃ", "jyu": "じゅ", "jyo": "じょ",
+    "zya": "じゃ", "zyu": "じゅ", "zyo": "じょ",
+    "ta": "た", "chi": "ち", "ti": "ち", "tsu": "つ", "tu": "つ", "te": "て", "to": "と",
+    "cha": "ちゃ", "chu": "ちゅ", "che": "ちぇ", "cho": "ちょ",
+    "tya": "ちゃ", "tyu": "ちゅ", "tyo": "ちょ",
+    "da": "だ", "di": "ぢ", "du": "づ", "de": "で", "do": "ど",
+    "na": "な", "ni": "に", "nu": "ぬ", "ne": "ね", "no": "の",
+    "nya": "にゃ", "nyu": "にゅ", "nyo": "にょ",
+    "ha": "は", "hi": "ひ", "fu": "ふ", "hu": "ふ", "he": "へ", "ho": "ほ",
+    "hya": "ひゃ", "hyu": "ひゅ", "hyo": "ひょ",
+    "fa": "ふぁ", "fi": "ふぃ", "fe": "ふぇ", "fo": "ふぉ",
+    "ba": "ば", "bi": "び", "bu": "ぶ", "be": "べ", "bo": "ぼ",
+    "bya": "びゃ", "byu": "びゅ", "byo": "びょ",
+    "pa": "ぱ", "pi": "ぴ", "pu": "ぷ", "pe": "ぺ", "po": "ぽ",
+    "pya": "ぴゃ", "pyu": "ぴゅ", "pyo": "ぴょ",
+    "ma": "ま", "mi": "み", "mu": "む", "me": "め", "mo": "も",
+    "mya": "みゃ", "myu": "みゅ", "myo": "みょ",
+    "ya": "や", "yu": "ゆ", "yo": "よ",
+    "ra": "ら", "ri": "り", "ru": "る", "re": "れ", "ro": "ろ",
+    "rya": "りゃ", "ryu": "りゅ", "ryo": "りょ",
+    "wa": "わ", "wo": "を",
+    "va": "ゔぁ", "vi": "ゔぃ", "vu": "ゔ", "ve": "ゔぇ", "vo": "ゔぉ",
+}
+
+# Long vowels written with a macron or circumflex (Hepburn).
+LONG_VOWELS = {
+    "ā": "aa", "â": "aa",
+    "ī": "ii", "î": "ii",
+    "ū": "uu", "û": "uu",
+    "ē": "ee", "ê": "ee",
+    "ō": "ou", "ô": "ou",
+}
+
+PUNCTUATION = {
+    ".": "。", ",": "、", "?": "？", "!": "！",
+    ":": "：", ";": "；", "-": "ー", "~": "〜",
+    '"': "", "'": "", "(": "（", ")": "）",
+}
+# fmt: on
+
+# Particles written as they are pronounced in romaji but spelled differently.
+PARTICLES = {"wa": "は", "e": "へ", "o": "を", "wo": "を"}
+
+MAX_SYLLABLE = max(len(key) for key in ROMAJI_TO_HIRAGANA)
+
+
+def _word_to_hiragana(word):
+    kana = []
+    i = 0
+    while i < len(word):
+        char = word[i]
+        next_char = word[i + 1] if i + 1 < len(word) else ""
+
+        if char in PUNCTUATION:
+            kana.append(PUNCTUATION[char])
+            i += 1
+            continue
+
+        # "n" is a syllable of its own unless a vowel or "y" follows it.
+        if char == "n" and (not next_char or next_char not in VOWELS + "y"):
+            kana.append("ん")
+            i += 2 if next_char == "'" else 1
+            continue
+
+        # Doubled consonants ("kk", "tt", "tch") become a small tsu.
+        if char.isalpha() and char not in VOWELS and (
+            char == next_char or (char == "t" and word[i + 1 : i + 3] == "ch")
+        ):
+            kana.append("っ")
+            i += 1
+            continue
+
+        for length in range(MAX_SYLLABLE, 0, -1):
+            syllable = word[i : i + length]
+            if syllable in ROMAJI_TO_HIRAGANA:
+                kana.append(ROMAJI_TO_HIRAGANA[syllable])
+                i += length
+                break
+        else:
+            raise ValueError(f"Cannot transliterate '{word[i:]}'")
+    return "".join(kana)
+
+
+def romaji_to_hiragana(romaji):
+    """
+    Transliterates a romaji sentence to hiragana with a lookup table.
+
+    Args:
+      romaji: A Hepburn (or Kunrei) romaji sentence, as returned by Gemini.
+
+    Returns:
+      The sentence in hiragana, without spaces.
+
+    Raises:
+      ValueError: If part of the sentence is not valid romaji.
+    """
+    text = romaji.lower()
+    for long_vowel, vowels in LONG_VOWELS.items():
+        text = text.replace(long_vowel, vowels)
+
+    kana = []
+    for token in text.split():
+        word = re.sub(r"[^a-z']", "", token)
+        if word in PARTICLES and len(kana) > 0:
+            kana.append(PARTICLES[word])
+            kana.append(_word_to_hiragana(token[len(token.rstrip(".,?!:;")) :]))
+        else:
+            kana.append(_word_to_hiragana(token))
+    return "".join(kana)
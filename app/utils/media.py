@@ -0,0 +1,128 @@
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import re
+import secrets
+import time
+
+from app.utils.audio_cache import AUDIO_CACHE_DIR, audio_path
+from app.utils.cache import CACHE_DIR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How AnkiConnect's storeMediaFile gets the audio:
+#   "base64": the mp3 is inlined in the JSON request.
+#   "url": Anki downloads it from a signed, short-lived /media URL of this app.
+#   "path": Anki reads it from the audio cache through a shared volume.
+MEDIA_TRANSFER = os.getenv("MEDIA_TRANSFER", "base64").lower()
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "").rstrip("/")
+MEDIA_TOKEN_TTL = int(os.getenv("MEDIA_TOKEN_TTL", "300"))
+MEDIA_PATH_PREFIX = os.getenv("MEDIA_PATH_PREFIX", AUDIO_CACHE_DIR)
+MEDIA_FALLBACK_TTL = int(os.getenv("MEDIA_FALLBACK_TTL", "300"))
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+_secret = None
+_fallback_until = 0.0
+
+
+def _token_secret():
+    """
+    Returns the key that signs media URLs.
+
+    Taken from MEDIA_TOKEN_SECRET, otherwise generated once and kept in
+    CACHE_DIR so that every gunicorn worker accepts the same tokens. Never
+    derived from SECRET_KEY, whose example value is published.
+    """
+    global _secret
+    if _secret is None:
+        configured = os.getenv("MEDIA_TOKEN_SECRET")
+        if configured:
+            _secret = configured.encode("utf-8")
+        else:
+            path = os.path.join(CACHE_DIR, "media.key")
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, "w") as f:
+                    f.write(secrets.token_hex(32))
+            except FileExistsError:
+                pass
+            with open(path) as f:
+                _secret = f.read().strip().encode("utf-8")
+    return _secret
+
+
+def _signature(key, expires):
+    message = f"{key}:{expires}".encode("utf-8")
+    return hmac.new(_token_secret(), message, hashlib.sha256).hexdigest()
+
+
+def media_url(key):
+    """
+    Returns a URL of the clip that expires after `MEDIA_TOKEN_TTL` seconds.
+    """
+    expires = int(time.time()) + MEDIA_TOKEN_TTL
+    return (
+        f"{MEDIA_BASE_URL}/media/{key}.mp3"
+        f"?expires={expires}&token={_signature(key, expires)}"
+    )
+
+
+def verify_media_token(key, expires, token):
+    """
+    Tells whether a /media request carries a valid, unexpired token.
+    """
+    if not KEY_PATTERN.match(key or "") or not token:
+        return False
+    try:
+        if int(expires) < time.time():
+            return False
+    except (TypeError, ValueError):
+        return False
+    return hmac.compare_digest(_signature(key, int(expires)), token)
+
+
+def transfer_mode():
+    """
+    Returns the transfer mode to use now. After Anki failed to fetch a file by
+    URL or path, base64 is used for `MEDIA_FALLBACK_TTL` seconds.
+    """
+    if MEDIA_TRANSFER not in ("url", "path") or time.time() < _fallback_until:
+        return "base64"
+    if MEDIA_TRANSFER == "url" and not MEDIA_BASE_URL:
+        return "base64"
+    return MEDIA_TRANSFER
+
+
+def fall_back_to_base64(error):
+    global _fallback_until
+    logger.warning(
+        f"AnkiConnect could not fetch media by {MEDIA_TRANSFER} ({error}), "
+        f"sending it as base64 for the next {MEDIA_FALLBACK_TTL} seconds"
+    )
+    _fallback_until = time.time() + MEDIA_FALLBACK_TTL
+
+
+def media_params(filename, key, mode=None):
+    """
+    Returns the `storeMediaFile` params for a clip of the audio cache.
+
+    Args:
+      filename: The name of the file in Anki's media folder.
+      key: The audio cache key of the clip.
+      mode: "base64", "url" or "path". Defaults to `transfer_mode()`.
+    """
+    mode = mode or transfer_mode()
+    if mode == "url":
+        return {"filename": filename, "url": media_url(key)}
+    if mode == "path":
+        return {
+            "filename": filename,
+            "path": os.path.join(MEDIA_PATH_PREFIX, key[:2], f"{key}.mp3"),
+        }
+    with open(audio_path(key), "rb") as f:
+        return {"filename": filename, "data": base64.b64encode(f.read()).decode()}
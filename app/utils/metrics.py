@@ -0,0 +1,117 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# With several gunicorn workers, point PROMETHEUS_MULTIPROC_DIR at an empty
+# directory so /metrics aggregates the samples of every worker.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+STAGE_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120
+)
+
+STAGE_DURATION = Histogram(
+    "anki_stage_duration_seconds",
+    "Time spent in each stage of adding a note.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_CALLS = Counter(
+    "anki_stage_calls_total", "Number of times each stage ran.", ["stage"]
+)
+STAGE_ERRORS = Counter(
+    "anki_stage_errors_total", "Number of times each stage failed.", ["stage"]
+)
+
+# Spans recorded while handling the current request, for the Server-Timing
+# header. Copied into pipeline threads by `run_stage`.
+_timings = contextvars.ContextVar("timings", default=None)
+_timings_lock = threading.Lock()
+
+
+def record_error(stage):
+    """
+    Counts a failure of a stage that handles its own exceptions.
+    """
+    STAGE_ERRORS.labels(stage).inc()
+
+
+@contextmanager
+def span(stage):
+    """
+    Times a block, or a function when used as a decorator, as one stage.
+
+    The duration goes to the `anki_stage_duration_seconds` histogram and to the
+    timings of the current request, if `collect_timings` is active. An
+    exception leaving the block is counted in `anki_stage_errors_total`.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record_error(stage)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_DURATION.labels(stage).observe(duration)
+        STAGE_CALLS.labels(stage).inc()
+        timings = _timings.get()
+        if timings is not None:
+            with _timings_lock:
+                timings.append((stage, duration))
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collects the spans recorded inside the block and yields them as a list of
+    (stage, seconds) tuples.
+    """
+    timings = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def server_timing_header(timings):
+    """
+    Formats collected spans as a Server-Timing header value.
+
+    Spans of the same stage are added up. Stages that ran in parallel overlap,
+    so the total can be less than their sum.
+    """
+    totals = {}
+    with _timings_lock:
+        for stage, duration in timings:
+            totals[stage] = totals.get(stage, 0.0) + duration
+    return ", ".join(
+        f"{stage};dur={duration * 1000:.1f}" for stage, duration in totals.items()
+    )
+
+
+def metrics_payload():
+    """
+    Returns the body and content type of the /metrics response.
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
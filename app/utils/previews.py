@@ -0,0 +1,131 @@
+import logging
+import os
+
+from app.utils.audio_cache import audio_path, record_audio_sources
+from app.utils.cache import SQLiteCache
+from app.utils.clients import run_blocking
+from app.utils.duplicates import DuplicateNoteError, front_key, normalize_front
+from app.utils.single_flight import flight_key, single_flight, single_flight_async
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PREVIEW_TTL = int(os.getenv("PREVIEW_TTL", "600"))
+PREVIEW_MAX_ENTRIES = int(os.getenv("PREVIEW_MAX_ENTRIES", "1000"))
+
+# Notes built by /api/preview, with the audio cache keys of their clips and
+# what the clips say, so that adding the same word afterwards only has to write
+# to Anki.
+preview_cache = SQLiteCache(
+    "previews",
+    ttl=PREVIEW_TTL,
+    max_entries=PREVIEW_MAX_ENTRIES,
+    db_name="previews.db",
+)
+
+
+def _cached(deck_name, word):
+    # Imported here because utils imports this module.
+    from app.utils.utils import synthesize_audio
+
+    cached = preview_cache.get(deck_name, normalize_front(word))
+    if not cached:
+        return None
+    # The clips may have been evicted from the audio cache in the meantime.
+    # They are synthesized again rather than building the whole note.
+    sources = cached.get("sources", {})
+    missing = [
+        filename
+        for filename, key in cached["media"].items()
+        if not os.path.exists(audio_path(key))
+    ]
+    for filename in missing:
+        if filename not in sources:
+            return None
+        logger.info(f"Audio of the preview of '{word}' was evicted, synthesizing")
+        key = synthesize_audio(*sources[filename])
+        if not key:
+            return None
+        cached["media"][filename] = key
+    if missing:
+        preview_cache.set(cached, deck_name, normalize_front(word))
+    return cached
+
+
+def _build_key(deck_name, word, fresh):
+    # A fresh build must not be handed the result of a cached one.
+    return flight_key(word, f"{deck_name}:{'fresh' if fresh else 'build'}")
+
+
+def _store(deck_name, word, note, media, sources):
+    built = {
+        "note": note,
+        "media": media,
+        "sources": {
+            filename: sources[key]
+            for filename, key in media.items()
+            if key in sources
+        },
+    }
+    preview_cache.set(built, deck_name, normalize_front(word))
+    return built
+
+
+def cached_build(build, deck_name, word, fresh=False, progress=None, preflight=None):
+    """
+    Builds a note with `build` (`build_note` or `build_note_english`), reusing
+    a recent preview of the same word.
+
+    A build of the word that is already running, e.g. a preview the user is
+    waiting on, is awaited instead of being started again. `fresh` always
+    builds a new note, and only joins other fresh builds.
+
+    Returns:
+      A tuple containing the AnkiConnect note and a dict mapping each media
+      filename to the audio cache key of its clip.
+    """
+    if not fresh:
+        cached = _cached(deck_name, word)
+        if cached:
+            logger.info(f"Using the preview of '{word}'")
+            if preflight:
+                preflight(front_key(cached["note"]["fields"]["Front"]))
+            return cached["note"], cached["media"]
+
+    def run():
+        with record_audio_sources() as sources:
+            note, media = build(deck_name, word, fresh, progress, preflight)
+        return _store(deck_name, word, note, media, sources)
+
+    built = single_flight(
+        _build_key(deck_name, word, fresh),
+        run,
+        shared_errors=(DuplicateNoteError,),
+    )
+    return built["note"], built["media"]
+
+
+async def cached_build_async(build, deck_name, word, fresh=False, preflight=None):
+    """
+    Async version of `cached_build` for `build_note_async` and
+    `build_note_english_async`. `preflight` is an async callable.
+    """
+    if not fresh:
+        cached = await run_blocking(_cached, deck_name, word)
+        if cached:
+            logger.info(f"Using the preview of '{word}'")
+            if preflight:
+                await preflight(front_key(cached["note"]["fields"]["Front"]))
+            return cached["note"], cached["media"]
+
+    async def run():
+        with record_audio_sources() as sources:
+            note, media = await build(deck_name, word, fresh, preflight=preflight)
+        return await run_blocking(_store, deck_name, word, note, media, sources)
+
+    built = await single_flight_async(
+        _build_key(deck_name, word, fresh),
+        run,
+        shared_errors=(DuplicateNoteError,),
+    )
+    return built["note"], built["media"]
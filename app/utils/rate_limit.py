@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+
+from app.utils.cache import get_connection
+from app.utils.clients import run_blocking
+from app.utils.metrics import span
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Requests per minute allowed for each service, shared by every worker. The
+# rate is halved on a 429 and recovers linearly afterwards. 0, the default,
+# disables the bucket: calls are only held back for everyone after a 429.
+RATE_LIMITS = {
+    "gemini": float(os.getenv("GEMINI_RATE_LIMIT", "0")),
+    "gtts": float(os.getenv("GTTS_RATE_LIMIT", "0")),
+}
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_MAX_ATTEMPTS = int(os.getenv("RATE_LIMIT_MAX_ATTEMPTS", "6"))
+RATE_LIMIT_BACKOFF_BASE = float(os.getenv("RATE_LIMIT_BACKOFF_BASE", "1"))
+RATE_LIMIT_BACKOFF_MAX = float(os.getenv("RATE_LIMIT_BACKOFF_MAX", "60"))
+# Fraction of the configured rate regained per second after a slowdown.
+RATE_LIMIT_RECOVERY = 0.02
+RATE_LIMIT_MIN_FRACTION = 0.05
+# 429s from several workers within this window count as one signal.
+THROTTLE_WINDOW = 1.0
+# A 429 in an error message without a status code: at the start, as in
+# "429 RESOURCE_EXHAUSTED" or gTTS's "429 (Too Many Requests)", or after a
+# status/code marker, as in '"code": 429'. A bare "429" elsewhere, e.g. in a
+# word or an id, is not a throttle.
+THROTTLE_PATTERN = re.compile(
+    r"^\s*429\b|\b(?:status|code|HTTP)(?:_code)?['\"]?\s*[:=]?\s*429\b"
+    r"|RESOURCE_EXHAUSTED|Too Many Requests",
+    re.IGNORECASE,
+)
+
+DB_NAME = "ratelimit.db"
+
+_schema_pid = None
+
+
+class RateLimitError(Exception):
+    """
+    Raised when a service kept answering 429 after every retry.
+    """
+
+
+def _connection():
+    global _schema_pid
+    connection = get_connection(DB_NAME)
+    if _schema_pid != os.getpid():
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS rate_limits (
+                service TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                rate REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                blocked_until REAL NOT NULL DEFAULT 0,
+                throttled_at REAL NOT NULL DEFAULT 0
+            )"""
+        )
+        _schema_pid = os.getpid()
+    return connection
+
+
+def _update_bucket(service, update):
+    """
+    Loads the bucket of a service, refilled up to now, passes it to `update`
+    and stores the result, all in one transaction.
+    """
+    max_rate = RATE_LIMITS.get(service, 0) / 60
+    connection = _connection()
+    now = time.time()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        row = connection.execute(
+            "SELECT tokens, rate, updated_at, blocked_until, throttled_at "
+            "FROM rate_limits WHERE service = ?",
+            (service,),
+        ).fetchone()
+        if row is None:
+            row = (RATE_LIMIT_BURST, max_rate, now, 0.0, 0.0)
+        tokens, rate, updated_at, blocked_until, throttled_at = row
+        elapsed = max(0.0, now - updated_at)
+        rate = min(max_rate, rate + max_rate * RATE_LIMIT_RECOVERY * elapsed)
+        bucket = {
+            "tokens": min(RATE_LIMIT_BURST, tokens + rate * elapsed),
+            "rate": rate,
+            "blocked_until": blocked_until,
+            "throttled_at": throttled_at,
+        }
+        result = update(bucket, now, max_rate)
+        connection.execute(
+            "INSERT OR REPLACE INTO rate_limits "
+            "(service, tokens, rate, updated_at, blocked_until, throttled_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                service,
+                bucket["tokens"],
+                bucket["rate"],
+                now,
+                bucket["blocked_until"],
+                bucket["throttled_at"],
+            ),
+        )
+        connection.execute("COMMIT")
+        return result
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+
+def _take_token(bucket, now, max_rate):
+    if now < bucket["blocked_until"]:
+        return bucket["blocked_until"] - now
+    if max_rate <= 0:
+        return 0.0
+    if bucket["tokens"] >= 1:
+        bucket["tokens"] -= 1
+        return 0.0
+    # A bucket stored while the limit was 0 has no rate to refill at yet.
+    rate = max(bucket["rate"], max_rate * RATE_LIMIT_MIN_FRACTION)
+    return (1 - bucket["tokens"]) / rate
+
+
+def try_acquire(service):
+    """
+    Takes a token from the bucket of a service.
+
+    Returns:
+      0 if the call may go ahead, otherwise the seconds to wait before trying
+      again.
+    """
+    wait = _update_bucket(service, _take_token)
+    # Jitter keeps waiting workers from retrying in lockstep.
+    return wait * random.uniform(1, 1.1) if wait else 0.0
+
+
+def acquire(service):
+    """
+    Blocks until the bucket of a service has a token. Time spent waiting is
+    reported as the `<service>_wait` stage.
+    """
+    wait = try_acquire(service)
+    if not wait:
+        return
+    with span(f"{service}_wait"):
+        while wait:
+            time.sleep(wait)
+            wait = try_acquire(service)
+
+
+async def acquire_async(service):
+    """
+    Async version of `acquire`. The bucket is updated in the pool of
+    `run_blocking`.
+    """
+    wait = await run_blocking(try_acquire, service)
+    if not wait:
+        return
+    with span(f"{service}_wait"):
+        while wait:
+            await asyncio.sleep(wait)
+            wait = await run_blocking(try_acquire, service)
+
+
+def report_throttled(service, retry_after=None):
+    """
+    Slows a service down for every worker after it answered 429.
+
+    The rate is halved (at most once per `THROTTLE_WINDOW`) and, if the service
+    sent a Retry-After, nobody calls it before then. Without a rate limit, the
+    service is paused for everyone for `RATE_LIMIT_BACKOFF_BASE` seconds when
+    it gave no Retry-After.
+    """
+
+    def throttle(bucket, now, max_rate):
+        if now - bucket["throttled_at"] >= THROTTLE_WINDOW and max_rate > 0:
+            bucket["rate"] = max(
+                max_rate * RATE_LIMIT_MIN_FRACTION, bucket["rate"] / 2
+            )
+            bucket["throttled_at"] = now
+        bucket["tokens"] = min(bucket["tokens"], 0.0)
+        pause = retry_after or (RATE_LIMIT_BACKOFF_BASE if max_rate <= 0 else 0)
+        if pause:
+            bucket["blocked_until"] = max(bucket["blocked_until"], now + pause)
+
+    _update_bucket(service, throttle)
+    logger.warning(
+        f"{service} is rate limiting"
+        + (f", retrying after {retry_after:.1f}s" if retry_after else "")
+    )
+
+
+def rate_limit_info(error):
+    """
+    Tells whether an exception is a 429 from Gemini or gTTS.
+
+    Returns:
+      A tuple (throttled, retry_after), where retry_after is in seconds or None.
+    """
+    # requests' Response is falsy for error statuses, so compare with None.
+    response = getattr(error, "response", None)
+    if response is None:
+        response = getattr(error, "rsp", None)
+    status = (
+        getattr(error, "code", None)
+        or getattr(error, "status_code", None)
+        or getattr(response, "status_code", None)
+    )
+    message = str(error)
+    if isinstance(status, int):
+        throttled = status == 429
+    else:
+        throttled = bool(THROTTLE_PATTERN.search(message))
+    if not throttled:
+        return False, None
+
+    retry_after = None
+    headers = getattr(response, "headers", None) or {}
+    try:
+        retry_after = float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        # Gemini puts the delay in the error details, e.g. "retryDelay": "13s".
+        match = re.search(r"retryDelay['\"]?\s*:\s*['\"]?(\d+(?:\.\d+)?)s", message)
+        if match:
+            retry_after = float(match.group(1))
+    return True, retry_after
+
+
+def _backoff(attempt, retry_after):
+    # Full jitter, but never earlier than the service asked for.
+    delay = random.uniform(
+        0, min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * 2**attempt)
+    )
+    return max(delay, retry_after or 0)
+
+
+def rate_limited(service, func, *args, **kwargs):
+    """
+    Calls `func` once the service's bucket allows it, retrying 429s.
+
+    Other exceptions are raised right away.
+
+    Raises:
+      RateLimitError: If every attempt was rate limited.
+    """
+    for attempt in range(RATE_LIMIT_MAX_ATTEMPTS):
+        acquire(service)
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            throttled, retry_after = rate_limit_info(e)
+            if not throttled:
+                raise
+            report_throttled(service, retry_after)
+            time.sleep(_backoff(attempt, retry_after))
+    raise RateLimitError(f"{service} is still rate limiting, giving up")
+
+
+async def rate_limited_async(service, func, *args, **kwargs):
+    """
+    Async version of `rate_limited` for a coroutine function.
+    """
+    for attempt in range(RATE_LIMIT_MAX_ATTEMPTS):
+        await acquire_async(service)
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            throttled, retry_after = rate_limit_info(e)
+            if not throttled:
+                raise
+            await run_blocking(report_throttled, service, retry_after)
+            await asyncio.sleep(_backoff(attempt, retry_after))
+    raise RateLimitError(f"{service} is still rate limiting, giving up")
@@ -0,0 +1,309 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app.utils.circuit_breaker import ensure_anki_available
+from app.utils.duplicates import NOTES_INFO_CHUNK, front_key
+from app.utils.media import fall_back_to_base64, transfer_mode
+from app.utils.sync_scheduler import request_sync
+from app.utils.utils import (
+    FINGERPRINT_TAG_PREFIX,
+    audio_media_action,
+    build_note,
+    build_note_english,
+    fingerprint_tag,
+    invoke_ankiconnect,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REFRESH_CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", "4"))
+# Notes rebuilt before their fields are written back in one `multi` request.
+REFRESH_BATCH_SIZE = int(os.getenv("REFRESH_BATCH_SIZE", "50"))
+REFRESHABLE_FIELDS = ("Front", "Back")
+
+BUILDERS = {
+    "japanese_anki_generator": build_note,
+    "english_anki_generator": build_note_english,
+}
+
+
+def refresh_query(tag=None, deck=None):
+    """
+    Returns the Anki search for the notes to refresh. Without a tag or deck,
+    every note created by this app matches.
+    """
+    terms = []
+    if tag:
+        terms.append(f'"tag:{tag}"')
+    if deck:
+        terms.append(f'"deck:{deck}"')
+    if not terms:
+        terms.append(" OR ".join(f"tag:{name}" for name in BUILDERS).join("()"))
+    return " ".join(terms)
+
+
+def _pending_query(query, fields):
+    """
+    Narrows a search to the notes missing the current fingerprint tag of one of
+    the fields.
+    """
+    missing = " OR ".join(f'-"tag:{fingerprint_tag(field)}"' for field in fields)
+    return f"({query}) ({missing})"
+
+
+def _stale_tags(tags, fields):
+    """
+    Returns the fingerprint tags of the fields that are not current. Anki tags
+    are case-insensitive.
+    """
+    current = {fingerprint_tag(field) for field in fields}
+    prefixes = tuple(f"{FINGERPRINT_TAG_PREFIX}{field.lower()}::" for field in fields)
+    return {
+        tag
+        for tag in tags
+        if tag.lower().startswith(prefixes) and tag.lower() not in current
+    }
+
+
+def _rebuild(info, fields, fresh):
+    """
+    Builds the note again from the word on its Front.
+
+    Raises:
+      Exception: If the build failed or came out for another word.
+
+    Returns:
+      A tuple containing the new values of the selected fields that changed and
+      the media referenced by the selected fields, as (filename, clip) pairs.
+    """
+    build = next(BUILDERS[tag] for tag in info["tags"] if tag in BUILDERS)
+    word = front_key(info["fields"]["Front"]["value"])
+    note, media = build("", word, fresh)
+    # The word must survive the round trip through language detection and
+    # translation, or the note would silently turn into another card.
+    rebuilt_word = front_key(note["fields"]["Front"])
+    if rebuilt_word != word:
+        raise Exception(f"The note was rebuilt for '{rebuilt_word}', not '{word}'")
+
+    changed = {}
+    media_items = []
+    for field in fields:
+        value = note["fields"][field]
+        if value != info["fields"][field]["value"]:
+            changed[field] = value
+        for filename in re.findall(r"\[sound:([^\]]+)\]", value):
+            if filename in media:
+                media_items.append((filename, media[filename]))
+    return changed, media_items
+
+
+def _store_media(ankiconnect_url, media_items):
+    """
+    Uploads media in one `multi` request, falling back to base64 like
+    `addnotes`.
+    """
+    mode = transfer_mode()
+    actions = [
+        audio_media_action(filename, clip, mode) for filename, clip in media_items
+    ]
+    responses = invoke_ankiconnect(ankiconnect_url, "multi", actions=actions)
+    failed = [
+        (item, response["error"])
+        for item, response in zip(media_items, responses)
+        if response.get("error")
+    ]
+    if failed and mode != "base64":
+        fall_back_to_base64(failed[0][1])
+        retry = [audio_media_action(*item, "base64") for item, _ in failed]
+        responses = invoke_ankiconnect(ankiconnect_url, "multi", actions=retry)
+        failed = [
+            (item, response["error"])
+            for (item, _), response in zip(failed, responses)
+            if response.get("error")
+        ]
+    return {filename: error for (filename, _), error in failed}
+
+
+def _tag(ankiconnect_url, infos, fields):
+    """
+    Replaces the fingerprint tags of the selected fields with the current ones.
+    """
+    note_ids = [info["noteId"] for info in infos]
+    stale = set().union(*(_stale_tags(info["tags"], fields) for info in infos))
+    actions = []
+    if stale:
+        actions.append(
+            {
+                "action": "removeTags",
+                "version": 6,
+                "params": {"notes": note_ids, "tags": " ".join(sorted(stale))},
+            }
+        )
+    actions.append(
+        {
+            "action": "addTags",
+            "version": 6,
+            "params": {
+                "notes": note_ids,
+                "tags": " ".join(fingerprint_tag(field) for field in fields),
+            },
+        }
+    )
+    for response in invoke_ankiconnect(ankiconnect_url, "multi", actions=actions):
+        if response.get("error"):
+            logger.warning(f"Could not update fingerprint tags: {response['error']}")
+
+
+def _write_batch(ankiconnect_url, rebuilt, fields):
+    """
+    Writes a batch of rebuilt notes back to Anki: their audio, one
+    `updateNoteFields` per note with changed fields, each group in one `multi`
+    request, then the fingerprint tags of the notes that were written.
+
+    Args:
+      rebuilt: A list of (notesInfo entry, changed fields, media) tuples.
+
+    Returns:
+      A dict mapping the id of each note that could not be written to the error.
+    """
+    media_items = [item for _, _, media in rebuilt for item in media]
+    media_errors = _store_media(ankiconnect_url, media_items) if media_items else {}
+
+    errors = {}
+    ready = []
+    for info, changed, media in rebuilt:
+        failed = [media_errors[name] for name, _ in media if name in media_errors]
+        if failed:
+            errors[info["noteId"]] = f"storeMediaFile failed: {failed[0]}"
+        else:
+            ready.append((info, changed))
+
+    updates = [(info, changed) for info, changed in ready if changed]
+    if updates:
+        actions = [
+            {
+                "action": "updateNoteFields",
+                "version": 6,
+                "params": {"note": {"id": info["noteId"], "fields": changed}},
+            }
+            for info, changed in updates
+        ]
+        responses = invoke_ankiconnect(ankiconnect_url, "multi", actions=actions)
+        for (info, _), response in zip(updates, responses):
+            if response.get("error"):
+                errors[info["noteId"]] = response["error"]
+
+    written = [info for info, _ in ready if info["noteId"] not in errors]
+    if written:
+        _tag(ankiconnect_url, written, fields)
+    return errors
+
+
+def refresh_notes(
+    ankiconnect_url,
+    query,
+    fields=REFRESHABLE_FIELDS,
+    concurrency=None,
+    batch_size=None,
+    fresh=False,
+    force=False,
+    dry_run=False,
+):
+    """
+    Regenerates fields of existing notes, e.g. after changing `GEMINI_MODEL`.
+
+    Notes already tagged with the current fingerprint of every selected field
+    are left out by the search itself, so they cost nothing. The others are
+    built again from the word on their Front, at most `concurrency` at a time,
+    and written back every `batch_size` notes: their audio is uploaded again,
+    fields that came out different are updated, and the fingerprint tags are
+    replaced. Notes not created by this app are skipped.
+
+    Args:
+      ankiconnect_url: The AnkiConnect URL.
+      query: The Anki search of the notes, see `refresh_query`.
+      fields: The fields to regenerate, "Front" and/or "Back".
+      concurrency: How many notes are rebuilt at once.
+      batch_size: How many notes are written back per batch.
+      fresh: Skip the generation cache and ask Gemini for new content.
+      force: Also rebuild notes whose fingerprint is current.
+      dry_run: Only count the notes that would be rebuilt.
+
+    Returns:
+      A dict with the number of notes matching the query, already up to date,
+      updated, rebuilt without any field changing, skipped and failed.
+    """
+    fields = [field for field in REFRESHABLE_FIELDS if field in fields]
+    if not fields:
+        raise Exception(f"No field to refresh, choose from {REFRESHABLE_FIELDS}")
+    concurrency = concurrency or REFRESH_CONCURRENCY
+    batch_size = batch_size or REFRESH_BATCH_SIZE
+
+    ensure_anki_available(ankiconnect_url)
+    matching = invoke_ankiconnect(ankiconnect_url, "findNotes", query=query)
+    if force:
+        pending = matching
+    else:
+        pending = invoke_ankiconnect(
+            ankiconnect_url, "findNotes", query=_pending_query(query, fields)
+        )
+    counts = {
+        "matching": len(matching),
+        "up_to_date": len(matching) - len(pending),
+        "updated": 0,
+        "unchanged": 0,
+        "skipped": 0,
+        "failed": 0,
+    }
+    logger.info(f"{len(pending)} of {len(matching)} notes to refresh for {query}")
+    if dry_run or not pending:
+        return counts
+
+    batch_size = min(batch_size, NOTES_INFO_CHUNK)
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="refresh"
+    ) as executor:
+        for start in range(0, len(pending), batch_size):
+            infos = invoke_ankiconnect(
+                ankiconnect_url,
+                "notesInfo",
+                notes=pending[start : start + batch_size],
+            )
+            futures = {}
+            for info in infos:
+                if not info or not any(tag in BUILDERS for tag in info.get("tags", [])):
+                    counts["skipped"] += 1
+                    continue
+                futures[executor.submit(_rebuild, info, fields, fresh)] = info
+
+            rebuilt = []
+            for future in as_completed(futures):
+                info = futures[future]
+                try:
+                    changed, media = future.result()
+                    rebuilt.append((info, changed, media))
+                except Exception as e:
+                    counts["failed"] += 1
+                    logger.error(f"Could not rebuild note {info['noteId']}: {e}")
+            if not rebuilt:
+                continue
+
+            errors = _write_batch(ankiconnect_url, rebuilt, fields)
+            for info, changed, _ in rebuilt:
+                if info["noteId"] in errors:
+                    counts["failed"] += 1
+                    logger.error(
+                        f"Could not update note {info['noteId']}: "
+                        f"{errors[info['noteId']]}"
+                    )
+                else:
+                    counts["updated" if changed else "unchanged"] += 1
+            logger.info(f"Refresh progress: {counts}")
+
+    if counts["updated"] or counts["unchanged"]:
+        request_sync(ankiconnect_url)
+    logger.info(f"Refresh finished: {counts}")
+    return counts
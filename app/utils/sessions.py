@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import threading
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+HTTP_POOL_STATS_INTERVAL = int(os.getenv("HTTP_POOL_STATS_INTERVAL", "100"))
+
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+_sessions = {}
+_sessions_pid = None
+_lock = threading.Lock()
+_request_count = 0
+_async_clients = weakref.WeakKeyDictionary()
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _build_retry(idempotent):
+    if idempotent:
+        # Safe to repeat: retry connection, read and 5xx/429 failures.
+        return Retry(
+            total=HTTP_RETRIES,
+            backoff_factor=HTTP_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+    # Only retry when the request never reached the server.
+    return Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+    )
+
+
+def _count_request(response, *args, **kwargs):
+    global _request_count
+    _request_count += 1
+    if HTTP_POOL_STATS_INTERVAL and _request_count % HTTP_POOL_STATS_INTERVAL == 0:
+        log_pool_stats()
+
+
+def get_session(service, idempotent=False, retries=True):
+    """
+    Returns the shared session for an external service.
+
+    Sessions are created once per process (a forked worker never reuses the
+    master's connections) and keep connections alive between calls.
+
+    Args:
+      service: A name for the remote service, e.g. "ankiconnect".
+      idempotent: Whether requests made with this session are safe to repeat.
+      retries: Set to False for callers that poll on their own, such as health
+        checks, so that the adapter doesn't add its retries on top.
+
+    Returns:
+      A `requests.Session` with a pooled, retrying adapter.
+    """
+    global _sessions, _sessions_pid
+    key = (service, idempotent, retries)
+    with _lock:
+        if _sessions_pid != os.getpid():
+            _sessions = {}
+            _sessions_pid = os.getpid()
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=_build_retry(idempotent) if retries else 0,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.hooks["response"].append(_count_request)
+            _sessions[key] = session
+    return session
+
+
+def http_request(
+    service, method, url, idempotent=False, timeout=None, retries=True, **kwargs
+):
+    """
+    Sends a request through the shared session of a service with a timeout.
+    """
+    session = get_session(service, idempotent, retries)
+    return session.request(method, url, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+
+
+def get_async_client():
+    """
+    Returns the `httpx.AsyncClient` of the running event loop.
+
+    httpx connections belong to the loop that opened them, so every loop gets
+    its own pooled client. Connection failures are retried by the transport.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_keepalive_connections=HTTP_POOL_SIZE),
+            transport=httpx.AsyncHTTPTransport(retries=HTTP_RETRIES),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def async_http_request(
+    service, method, url, idempotent=False, timeout=None, **kwargs
+):
+    """
+    Async counterpart of `http_request`.
+
+    Idempotent requests are also retried on read timeouts and 429/5xx
+    responses, with the same exponential backoff as the sync sessions.
+    """
+    client = get_async_client()
+    if timeout is not None and isinstance(timeout, tuple):
+        timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+    attempts = HTTP_RETRIES + 1 if idempotent else 1
+    for attempt in range(attempts):
+        last_attempt = attempt == attempts - 1
+        try:
+            response = await client.request(
+                method,
+                url,
+                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+                **kwargs,
+            )
+            if last_attempt or response.status_code not in RETRY_STATUSES:
+                return response
+        except httpx.TimeoutException:
+            if last_attempt:
+                raise
+        logger.warning(f"Retrying {service} request to {url}")
+        await asyncio.sleep(HTTP_BACKOFF_FACTOR * 2**attempt)
+
+
+def pool_stats():
+    """
+    Returns connection pool statistics for every session of this process.
+    """
+    stats = {}
+    for (service, idempotent, retries), session in list(_sessions.items()):
+        adapter = session.get_adapter("http://")
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            kind = f"{service}/idempotent" if idempotent else service
+            kind = kind if retries else f"{kind}/no-retries"
+            name = f"{kind} {pool.host}:{pool.port}"
+            stats[name] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": pool.pool.qsize() if pool.pool else 0,
+            }
+    return stats
+
+
+def log_pool_stats():
+    for name, stats in pool_stats().items():
+        logger.info(
+            f"HTTP pool {name}: {stats['requests']} requests over "
+            f"{stats['connections_opened']} connections, {stats['idle']} idle"
+        )
@@ -0,0 +1,200 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+import uuid
+
+from app.utils.cache import get_connection
+from app.utils.clients import run_blocking
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "True").lower() == "true"
+# How long a leader may run before a waiting request assumes it died and takes
+# over.
+SINGLE_FLIGHT_LEASE = float(os.getenv("SINGLE_FLIGHT_LEASE", "300"))
+# How long a finished result is still handed to late duplicates.
+SINGLE_FLIGHT_RESULT_TTL = float(os.getenv("SINGLE_FLIGHT_RESULT_TTL", "10"))
+SINGLE_FLIGHT_POLL_INTERVAL = 0.2
+
+DB_NAME = "single_flight.db"
+
+_schema_pid = None
+
+
+def _connection():
+    global _schema_pid
+    connection = get_connection(DB_NAME)
+    if _schema_pid != os.getpid():
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS flights (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                error_type TEXT,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            )"""
+        )
+        _schema_pid = os.getpid()
+    return connection
+
+
+def flight_key(word, deck):
+    """
+    Returns the key under which identical note requests are coalesced.
+    """
+    return f"{(deck or '').strip().lower()}\x1f{word.strip().lower()}"
+
+
+def _join(key, owner, joined_at):
+    """
+    Becomes the leader of a flight or reports the state of the current one.
+
+    Returns:
+      A tuple (state, row) where state is "leader", "running", "done" or
+      "failed", and row holds the result or error of a finished flight.
+    """
+    connection = _connection()
+    now = time.time()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        row = connection.execute(
+            "SELECT status, result, error, error_type, started_at, finished_at "
+            "FROM flights WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is not None:
+            status, _, _, _, started_at, finished_at = row
+            if status == "running" and started_at > now - SINGLE_FLIGHT_LEASE:
+                connection.execute("COMMIT")
+                return "running", row
+            if status == "done" and finished_at > now - SINGLE_FLIGHT_RESULT_TTL:
+                connection.execute("COMMIT")
+                return "done", row
+            # Failures are only shared with requests that waited for them; a
+            # request arriving afterwards tries again.
+            if status == "failed" and finished_at >= joined_at:
+                connection.execute("COMMIT")
+                return "failed", row
+        connection.execute(
+            "INSERT OR REPLACE INTO flights (key, owner, status, started_at) "
+            "VALUES (?, ?, 'running', ?)",
+            (key, owner, now),
+        )
+        connection.execute("COMMIT")
+        return "leader", None
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+
+def _finish(key, owner, result=None, error=None):
+    now = time.time()
+    connection = _connection()
+    if error is None:
+        fields = ("done", json.dumps(result), None, None)
+    else:
+        fields = ("failed", None, str(error), type(error).__name__)
+    # A leader that lost its lease leaves the flight to whoever took it over.
+    connection.execute(
+        "UPDATE flights SET status = ?, result = ?, error = ?, error_type = ?, "
+        "finished_at = ? WHERE key = ? AND owner = ?",
+        (*fields, now, key, owner),
+    )
+    connection.execute(
+        "DELETE FROM flights WHERE status != 'running' AND finished_at < ?",
+        (now - max(SINGLE_FLIGHT_RESULT_TTL, SINGLE_FLIGHT_LEASE),),
+    )
+
+
+def _shared_outcome(state, row, shared_errors):
+    _, result, error, error_type, _, _ = row
+    if state == "done":
+        return json.loads(result)
+    for error_class in shared_errors:
+        if error_class.__name__ == error_type:
+            raise error_class(error)
+    raise Exception(error)
+
+
+def single_flight(key, func, shared_errors=(), on_wait=None):
+    """
+    Runs `func()` unless an identical request is already running in any
+    gunicorn worker, in which case its result is awaited and returned instead.
+
+    Args:
+      key: The key of the request, see `flight_key`.
+      func: The work to do. Its return value must be JSON serializable.
+      shared_errors: Exception classes re-raised as such by waiting requests.
+        Any other failure of the leader is raised as a plain Exception with the
+        same message.
+      on_wait: Called once if this request waits for another one.
+
+    Returns:
+      The return value of `func`, from this request or from the leader.
+    """
+    if not SINGLE_FLIGHT:
+        return func()
+
+    owner = uuid.uuid4().hex
+    joined_at = time.time()
+    waiting = False
+    while True:
+        state, row = _join(key, owner, joined_at)
+        if state == "leader":
+            break
+        if state != "running":
+            logger.info(f"Sharing the result of an identical request for {key!r}")
+            return _shared_outcome(state, row, shared_errors)
+        if not waiting:
+            waiting = True
+            logger.info(f"Waiting for an identical request for {key!r}")
+            if on_wait:
+                on_wait()
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+
+    try:
+        result = func()
+    except Exception as e:
+        _finish(key, owner, error=e)
+        raise
+    _finish(key, owner, result=result)
+    return result
+
+
+async def single_flight_async(key, func, shared_errors=()):
+    """
+    Async version of `single_flight` for a coroutine function. The SQLite
+    calls run in the pool of `run_blocking`.
+    """
+    if not SINGLE_FLIGHT:
+        return await func()
+
+    owner = uuid.uuid4().hex
+    joined_at = time.time()
+    while True:
+        state, row = await run_blocking(_join, key, owner, joined_at)
+        if state == "leader":
+            break
+        if state != "running":
+            logger.info(f"Sharing the result of an identical request for {key!r}")
+            return _shared_outcome(state, row, shared_errors)
+        await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+
+    try:
+        result = await func()
+    except asyncio.CancelledError:
+        # Inline: awaiting anything in a task being cancelled is unreliable.
+        _finish(key, owner, error=Exception("The request was cancelled"))
+        raise
+    except Exception as e:
+        await run_blocking(functools.partial(_finish, key, owner, error=e))
+        raise
+    await run_blocking(functools.partial(_finish, key, owner, result=result))
+    return result
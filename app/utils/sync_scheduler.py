@@ -0,0 +1,194 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.utils.cache import get_connection
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SYNC_DEBOUNCE = os.getenv("SYNC_DEBOUNCE", "True").lower() == "true"
+SYNC_QUIET_PERIOD = float(os.getenv("SYNC_QUIET_PERIOD", "5"))
+SYNC_MAX_DELAY = float(os.getenv("SYNC_MAX_DELAY", "30"))
+# How long a claimed sync may run before another worker assumes the one
+# running it died and syncs instead.
+SYNC_LEASE_SECONDS = float(os.getenv("SYNC_LEASE_SECONDS", "300"))
+SYNC_POLL_INTERVAL = 0.5
+
+DB_NAME = "sync.db"
+
+_ticker_pid = None
+_ticker_lock = threading.Lock()
+_schema_pid = None
+
+
+def _connection():
+    global _schema_pid
+    connection = get_connection(DB_NAME)
+    if _schema_pid != os.getpid():
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS sync_state (
+                url TEXT PRIMARY KEY,
+                first_marked REAL,
+                last_marked REAL,
+                owner TEXT,
+                lease_until REAL
+            )"""
+        )
+        # Tables created before syncs were leased. Another worker may be
+        # adding the columns at the same time.
+        columns = [
+            row[1] for row in connection.execute("PRAGMA table_info(sync_state)")
+        ]
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column in columns:
+                continue
+            try:
+                connection.execute(f"ALTER TABLE sync_state ADD COLUMN {column} {kind}")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):
+                    raise
+        _schema_pid = os.getpid()
+    return connection
+
+
+def _sync(ankiconnect_url):
+    # Imported here because utils imports this module.
+    from app.utils.utils import sync_ankiconnect
+
+    sync_ankiconnect(ankiconnect_url)
+
+
+def request_sync(ankiconnect_url):
+    """
+    Marks the collection behind `ankiconnect_url` as needing a sync.
+
+    The sync runs once no other request has marked it for `SYNC_QUIET_PERIOD`
+    seconds, or `SYNC_MAX_DELAY` seconds after the first mark, whichever comes
+    first. Marks from every gunicorn worker are coalesced into one sync. With
+    `SYNC_DEBOUNCE` disabled the sync runs immediately.
+    """
+    if not SYNC_DEBOUNCE:
+        _sync(ankiconnect_url)
+        return
+
+    now = time.time()
+    _connection().execute(
+        "INSERT INTO sync_state (url, first_marked, last_marked) VALUES (?, ?, ?) "
+        "ON CONFLICT(url) DO UPDATE SET "
+        "first_marked = COALESCE(first_marked, excluded.first_marked), "
+        "last_marked = excluded.last_marked",
+        (ankiconnect_url, now, now),
+    )
+    start_sync_ticker()
+
+
+def _claim(ankiconnect_url, owner, now):
+    """
+    Leases a pending sync if no other worker holds it. Only the worker holding
+    the lease runs the sync; the mark stays until the sync succeeded, so a
+    worker that dies mid-sync leaves it to the next one once the lease expires.
+    """
+    cursor = _connection().execute(
+        "UPDATE sync_state SET owner = ?, lease_until = ? "
+        "WHERE url = ? AND first_marked IS NOT NULL "
+        "AND (lease_until IS NULL OR lease_until < ?)",
+        (owner, now + SYNC_LEASE_SECONDS, ankiconnect_url, now),
+    )
+    return cursor.rowcount == 1
+
+
+def _release(ankiconnect_url, owner, started=None, retry_at=None):
+    """
+    Ends the lease of a sync. After a successful sync (`started` given) the
+    mark is cleared unless a request marked it again while the sync ran; after
+    a failed one, the sync is not tried again before `retry_at`.
+    """
+    connection = _connection()
+    if started is not None:
+        connection.execute(
+            "UPDATE sync_state SET first_marked = NULL, last_marked = NULL "
+            "WHERE url = ? AND owner = ? AND last_marked <= ?",
+            (ankiconnect_url, owner, started),
+        )
+    connection.execute(
+        "UPDATE sync_state SET owner = NULL, lease_until = ? "
+        "WHERE url = ? AND owner = ?",
+        (retry_at, ankiconnect_url, owner),
+    )
+
+
+def _run_due_syncs():
+    now = time.time()
+    rows = (
+        _connection()
+        .execute(
+            "SELECT url, first_marked, last_marked FROM sync_state "
+            "WHERE first_marked IS NOT NULL "
+            "AND (lease_until IS NULL OR lease_until < ?)",
+            (now,),
+        )
+        .fetchall()
+    )
+    for ankiconnect_url, first_marked, last_marked in rows:
+        quiet = now - last_marked >= SYNC_QUIET_PERIOD
+        overdue = now - first_marked >= SYNC_MAX_DELAY
+        owner = uuid.uuid4().hex
+        if not (quiet or overdue) or not _claim(ankiconnect_url, owner, now):
+            continue
+        started = time.time()
+        try:
+            _sync(ankiconnect_url)
+        except Exception as e:
+            logger.error(f"Scheduled sync failed, retrying later: {e}")
+            _release(ankiconnect_url, owner, retry_at=time.time() + SYNC_QUIET_PERIOD)
+            continue
+        _release(ankiconnect_url, owner, started=started)
+
+
+def _ticker_loop():
+    while True:
+        time.sleep(SYNC_POLL_INTERVAL)
+        try:
+            _run_due_syncs()
+        except Exception as e:
+            logger.error(f"Sync scheduler error: {e}")
+
+
+def start_sync_ticker():
+    """
+    Starts the thread that runs due syncs in this process.
+
+    Server workers start it when they boot, so a sync marked by a process that
+    exited before it was due, such as a `flask` command, still runs.
+    """
+    global _ticker_pid
+    if _ticker_pid == os.getpid():
+        return
+    with _ticker_lock:
+        if _ticker_pid == os.getpid():
+            return
+        _ticker_pid = os.getpid()
+        threading.Thread(
+            target=_ticker_loop, name="sync-scheduler", daemon=True
+        ).start()
+
+
+def flush_sync(ankiconnect_url):
+    """
+    Syncs immediately and clears any pending scheduled sync.
+
+    The mark is only cleared once the sync succeeded, so a failed sync is
+    retried by the scheduler. Marks made while the sync ran are kept, as their
+    notes may have missed it.
+    """
+    started = time.time()
+    _sync(ankiconnect_url)
+    _connection().execute(
+        "UPDATE sync_state SET first_marked = NULL, last_marked = NULL "
+        "WHERE url = ? AND last_marked <= ?",
+        (ankiconnect_url, started),
+    )
@@ -1,26 +1,132 @@
-import asyncio
-import base64
+import contextvars
+import hashlib
+import json
 import logging
 import os
+import io
 import re
-import shutil
+from concurrent.futures import ThreadPoolExecutor, wait
 
-import pykakasi
 import requests
-from google import genai
-from googletrans import Translator
-from gtts import gTTS
+
+from app.utils.audio_cache import (
+    audio_key,
+    get_cached_audio,
+    record_audio_source,
+    store_audio,
+)
+from app.utils.cache import SQLiteCache
+from app.utils.circuit_breaker import ensure_anki_available, guarded_call
+from app.utils.clients import (
+    genai_types,
+    get_genai_client,
+    get_gtts,
+    get_kakasi,
+    get_translator,
+    run_async,
+    run_blocking,
+)
+from app.utils.duplicates import (
+    ensure_not_duplicate,
+    front_key,
+    is_duplicate,
+    record_note,
+)
+from app.utils.kana import romaji_to_hiragana
+from app.utils.media import fall_back_to_base64, media_params, transfer_mode
+from app.utils.metrics import record_error, span
+from app.utils.previews import cached_build
+from app.utils.rate_limit import rate_limited
+from app.utils.sessions import HTTP_CONNECT_TIMEOUT, http_request
+from app.utils.sync_scheduler import request_sync
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-3.1-flash-lite").strip() or "gemini-3.1-flash-lite"
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "8"))
+TTS_ENGINE = "gtts"
+ANKICONNECT_SYNC_TIMEOUT = float(os.getenv("ANKICONNECT_SYNC_TIMEOUT", "120"))
+KANA_SENTENCE_SOURCE = os.getenv("KANA_SENTENCE_SOURCE", "romaji").lower()
+ROMAJI2KANA_FALLBACK = os.getenv("ROMAJI2KANA_FALLBACK", "False").lower() == "true"
+ROMAJI2KANA_URL = os.getenv("ROMAJI2KANA_URL", "https://api.romaji2kana.com")
+GEMINI_GENERATION_MODE = os.getenv("GEMINI_GENERATION_MODE", "legacy").lower()
+GEMINI_BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", "20"))
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", str(90 * 24 * 3600)))
+TRANSLATION_CACHE_MAX_ENTRIES = int(
+    os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "100000")
+)
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", str(30 * 24 * 3600)))
+GEMINI_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "50000"))
+
+# Generated sentences and definitions, keyed by (model, prompt kind, word).
+generation_cache = SQLiteCache(
+    "gemini", ttl=GEMINI_CACHE_TTL, max_entries=GEMINI_CACHE_MAX_ENTRIES
+)
+
+# Translations, keyed by (source language, destination language, text).
+translation_cache = SQLiteCache(
+    "translation", ttl=TRANSLATION_CACHE_TTL, max_entries=TRANSLATION_CACHE_MAX_ENTRIES
+)
+
+# Shared pool for the independent stages of a note build. Stages never wait on
+# other stages from inside the pool, only the calling thread does, so a bounded
+# pool cannot deadlock.
+pipeline_executor = ThreadPoolExecutor(
+    max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline"
+)
+
+
+def run_stage(func, *args):
+    """
+    Submits one stage of the note build to the shared pipeline pool.
+
+    The stage runs in a copy of the caller's context, so its timing spans are
+    reported with the request that started it.
+    """
+    return pipeline_executor.submit(contextvars.copy_context().run, func, *args)
+
+
+def report_stage(progress, stage):
+    """
+    Tells an optional progress callback which stage a note build reached.
+    """
+    if progress:
+        progress(stage)
+
+
+# Read-only actions, or ones that give the same result when repeated, can be
+# retried on read timeouts and 5xx responses.
+IDEMPOTENT_ACTIONS = {
+    "version",
+    "deckNames",
+    "findNotes",
+    "notesInfo",
+    "canAddNotes",
+    "canAddNotesWithErrorDetail",
+    "storeMediaFile",
+    "updateNoteFields",
+}
 
 
 def invoke_ankiconnect(ankiconnect_url, action, **params):
+    with span(f"ankiconnect_{action}"):
+        return guarded_call(
+            ankiconnect_url, _invoke_ankiconnect, ankiconnect_url, action, params
+        )
+
+
+def _invoke_ankiconnect(ankiconnect_url, action, params):
     payload = {"action": action, "version": 6, "params": params}
     try:
-        response = requests.post(ankiconnect_url, json=payload)
+        response = http_request(
+            "ankiconnect",
+            "POST",
+            ankiconnect_url,
+            idempotent=action in IDEMPOTENT_ACTIONS,
+            json=payload,
+        )
         response.raise_for_status()
         result = response.json()
         if result.get("error"):
@@ -37,10 +143,21 @@ def invoke_ankiconnect(ankiconnect_url, action, **params):
         raise e
 
 
+@span("ankiconnect_sync")
 def sync_ankiconnect(ankiconnect_url):
+    guarded_call(ankiconnect_url, _sync_ankiconnect, ankiconnect_url)
+
+
+def _sync_ankiconnect(ankiconnect_url):
     payload = {"action": "sync", "version": 6}
     try:
-        response = requests.post(ankiconnect_url, json=payload)
+        response = http_request(
+            "ankiconnect",
+            "POST",
+            ankiconnect_url,
+            timeout=(HTTP_CONNECT_TIMEOUT, ANKICONNECT_SYNC_TIMEOUT),
+            json=payload,
+        )
         response.raise_for_status()
         result = response.json()
         logger.info("Sync successful!")
@@ -57,53 +174,66 @@ def sync_ankiconnect(ankiconnect_url):
         raise e
 
 
-def upload_audio(file_path: str, ankiconnect_url: str):
-    if os.path.exists(file_path):
-        with open(file_path, "rb") as f:
-            audio_data = f.read()
-        base64_audio = base64.b64encode(audio_data).decode("utf-8")
-        if base64_audio:
-            logger.info(f"Uploading audio: {os.path.basename(file_path)}")
-            invoke_ankiconnect(
-                ankiconnect_url,
-                "storeMediaFile",
-                filename=os.path.basename(file_path),
-                data=base64_audio,
-            )
-        else:
-            logger.warning(
-                f"Warning: base64_audio is empty for {os.path.basename(file_path)}"
-            )
-    else:
-        logger.warning(f"Warning: Audio file not found: {file_path}")
+def upload_audio(filename: str, clip: str, ankiconnect_url: str):
+    """
+    Stores a clip of the audio cache in Anki's media folder.
+
+    The file is sent as configured by `MEDIA_TRANSFER`; if Anki can't fetch it
+    by URL or path it is sent again as base64.
+    """
+    logger.info(f"Uploading audio: {filename}")
+    mode = transfer_mode()
+    try:
+        invoke_ankiconnect(
+            ankiconnect_url, "storeMediaFile", **media_params(filename, clip, mode)
+        )
+    except Exception as e:
+        if mode == "base64":
+            raise
+        fall_back_to_base64(e)
+        invoke_ankiconnect(
+            ankiconnect_url,
+            "storeMediaFile",
+            **media_params(filename, clip, "base64"),
+        )
 
 
-def get_sentence_with_word(word):
+def get_sentence_with_word(word, fresh=False):
     """
     Generates a sentence with the given word using the Gemini API.
 
     Args:
       word: The word to be used in the sentence.
+      fresh: Skip the generation cache and always call the API.
 
     Returns:
       A tuple containing the Japanese sentence, Romaji, and English translation.
     """
+    if not fresh:
+        cached = generation_cache.get(GEMINI_MODEL, "sentence_ja", word)
+        if cached:
+            return tuple(cached)
     try:
-        client = genai.Client()
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=f"Write EXACTLY ONE simple sentence in Japanese using the word '{word}'. Format: [Japanese sentence] ([Romaji]) - [English translation] but without []",
-        )
+        client = get_genai_client()
+        with span("gemini"):
+            response = rate_limited(
+                "gemini",
+                client.models.generate_content,
+                model=GEMINI_MODEL,
+                contents=f"Write EXACTLY ONE simple sentence in Japanese using the word '{word}'. Format: [Japanese sentence] ([Romaji]) - [English translation] but without []",
+            )
         text = response.text.strip()
 
         # Use regex to parse the sentence
         match = re.match(r"^(.*?)\s*\((.*?)\)\s*-\s*(.*)$", text)
         if match:
-            return (
+            sentence = (
                 match.group(1).strip(),
                 match.group(2).strip(),
                 match.group(3).strip(),
             )
+            generation_cache.set(sentence, GEMINI_MODEL, "sentence_ja", word)
+            return sentence
         else:
             logger.info(text)
             raise Exception("Something went wrong with the setence")
@@ -113,23 +243,33 @@ def get_sentence_with_word(word):
         return f"Error generating sentence: {e}", None, None
 
 
-def get_sentence_with_word_english(word):
+def get_sentence_with_word_english(word, fresh=False):
     """
     Generates a sentence with the given word using the Gemini API.
 
     Args:
       word: The word to be used in the sentence.
+      fresh: Skip the generation cache and always call the API.
 
     Returns:
       A setence with the word.
     """
+    if not fresh:
+        cached = generation_cache.get(GEMINI_MODEL, "sentence_en", word)
+        if cached:
+            return cached
     try:
-        client = genai.Client()
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=f"Write a simple sentence using the word '{word}'. Format: [English setence]",
-        )
+        client = get_genai_client()
+        with span("gemini"):
+            response = rate_limited(
+                "gemini",
+                client.models.generate_content,
+                model=GEMINI_MODEL,
+                contents=f"Write a simple sentence using the word '{word}'. Format: [English setence]",
+            )
         text = response.text.strip().strip("[]")
+        if text:
+            generation_cache.set(text, GEMINI_MODEL, "sentence_en", word)
         return text
 
     except Exception as e:
@@ -137,29 +277,350 @@ def get_sentence_with_word_english(word):
         return f"Error generating sentence: {e}"
 
 
-def get_definition(word):
+def get_definition(word, fresh=False):
     """
     Gets the definition of a word.
 
     Args:
       word: The word.
+      fresh: Skip the generation cache and always call the API.
 
     Returns:
       A definition of the word.
     """
+    if not fresh:
+        cached = generation_cache.get(GEMINI_MODEL, "definition", word)
+        if cached:
+            return cached
     try:
-        client = genai.Client()
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=f"Give a short definition of the word '{word}'. Format: [English definition]",
-        )
+        client = get_genai_client()
+        with span("gemini"):
+            response = rate_limited(
+                "gemini",
+                client.models.generate_content,
+                model=GEMINI_MODEL,
+                contents=f"Give a short definition of the word '{word}'. Format: [English definition]",
+            )
         text = response.text.strip().strip("[]")
+        if text:
+            generation_cache.set(text, GEMINI_MODEL, "definition", word)
         return text
     except Exception as e:
         logger.error(e)
         return f"Error generating sentence: {e}"
 
 
+# Fields returned by the structured (JSON) generation mode, per deck.
+CARD_FIELDS = {
+    "japanese": ("sentence", "romaji", "translation", "definition"),
+    "english": ("sentence", "definition"),
+}
+
+CARD_INSTRUCTIONS = {
+    "japanese": (
+        "'sentence' is EXACTLY ONE simple Japanese sentence using the word, "
+        "'romaji' is that sentence in romaji, 'translation' is its English "
+        "translation and 'definition' is a short English definition of the word."
+    ),
+    "english": (
+        "'sentence' is a simple English sentence using the word and "
+        "'definition' is a short English definition of the word."
+    ),
+}
+
+
+def _card_schema(kind, with_word=False):
+    fields = (("word",) if with_word else ()) + CARD_FIELDS[kind]
+    return {
+        "type": "OBJECT",
+        "properties": {field: {"type": "STRING"} for field in fields},
+        "required": list(fields),
+    }
+
+
+def validate_card_content(data, kind):
+    """
+    Checks a structured Gemini response against the schema of a deck.
+
+    Args:
+      data: The decoded JSON object.
+      kind: "japanese" or "english".
+
+    Returns:
+      A dict with exactly the fields of the deck, stripped.
+
+    Raises:
+      ValueError: If a field is missing, not a string or empty.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected an object, got {type(data).__name__}")
+    content = {}
+    for field in CARD_FIELDS[kind]:
+        value = data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"Missing or empty field '{field}'")
+        content[field] = value.strip()
+    return content
+
+
+def card_request(word, kind):
+    """
+    Returns the prompt and the JSON config of a structured card request.
+    """
+    config = genai_types().GenerateContentConfig(
+        response_mime_type="application/json", response_schema=_card_schema(kind)
+    )
+    prompt = (
+        f"Write the content of a flashcard for the word '{word}'. "
+        f"Return a JSON object where {CARD_INSTRUCTIONS[kind]}"
+    )
+    return prompt, config
+
+
+def generate_card_content(word, kind, fresh=False):
+    """
+    Generates every Gemini field of a card with a single JSON request.
+
+    Malformed responses are retried up to `GEMINI_MAX_ATTEMPTS` times.
+
+    Args:
+      word: The word the card is about (Japanese for "japanese" cards).
+      kind: "japanese" or "english".
+      fresh: Skip the generation cache and always call the API.
+
+    Returns:
+      A dict with the fields in `CARD_FIELDS[kind]`.
+    """
+    if not fresh:
+        cached = generation_cache.get(GEMINI_MODEL, f"card_{kind}", word)
+        if cached:
+            return cached
+
+    prompt, config = card_request(word, kind)
+    error = None
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        try:
+            with span("gemini"):
+                response = rate_limited(
+                    "gemini",
+                    get_genai_client().models.generate_content,
+                    model=GEMINI_MODEL,
+                    contents=prompt,
+                    config=config,
+                )
+            content = validate_card_content(json.loads(response.text), kind)
+            generation_cache.set(content, GEMINI_MODEL, f"card_{kind}", word)
+            return content
+        except (ValueError, TypeError) as e:
+            error = e
+            record_error("gemini")
+            logger.warning(f"Invalid Gemini response for '{word}': {e}")
+    raise Exception(f"Error generating card content for '{word}': {error}")
+
+
+def generate_card_content_batch(words, kind, fresh=False):
+    """
+    Generates card content for many words with one Gemini request per chunk.
+
+    Words found in the cache are skipped. Each word in a response is validated
+    on its own, and words that are missing or malformed are retried one by one
+    with `generate_card_content`, so one bad item doesn't fail the whole batch.
+
+    Args:
+      words: The words to generate content for.
+      kind: "japanese" or "english".
+      fresh: Skip the generation cache and always call the API.
+
+    Returns:
+      A dict mapping each word to its content. Words that still failed after
+      the retries are left out.
+    """
+    results = {}
+    pending = []
+    for word in dict.fromkeys(words):
+        cached = None
+        if not fresh:
+            cached = generation_cache.get(GEMINI_MODEL, f"card_{kind}", word)
+        if cached:
+            results[word] = cached
+        else:
+            pending.append(word)
+
+    config = genai_types().GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema={
+            "type": "ARRAY",
+            "items": _card_schema(kind, with_word=True),
+        },
+    )
+    for start in range(0, len(pending), GEMINI_BATCH_SIZE):
+        chunk = pending[start : start + GEMINI_BATCH_SIZE]
+        prompt = (
+            "Write the content of a flashcard for each of these words: "
+            f"{json.dumps(chunk, ensure_ascii=False)}. Return a JSON array with "
+            "one object per word, where 'word' is the word exactly as given, "
+            f"{CARD_INSTRUCTIONS[kind]}"
+        )
+        try:
+            with span("gemini"):
+                response = rate_limited(
+                    "gemini",
+                    get_genai_client().models.generate_content,
+                    model=GEMINI_MODEL,
+                    contents=prompt,
+                    config=config,
+                )
+            items = json.loads(response.text)
+            if not isinstance(items, list):
+                raise ValueError("Expected a JSON array")
+        except Exception as e:
+            logger.error(f"Batch generation failed, retrying word by word: {e}")
+            items = []
+
+        for item in items:
+            word = item.get("word") if isinstance(item, dict) else None
+            if word not in chunk or word in results:
+                continue
+            try:
+                results[word] = validate_card_content(item, kind)
+                generation_cache.set(
+                    results[word], GEMINI_MODEL, f"card_{kind}", word
+                )
+            except ValueError as e:
+                logger.warning(f"Invalid batch item for '{word}': {e}")
+
+        for word in chunk:
+            if word in results:
+                continue
+            try:
+                results[word] = generate_card_content(word, kind, fresh=True)
+            except Exception as e:
+                logger.error(e)
+    return results
+
+
+def get_japanese_sentence(word, fresh=False):
+    """
+    Generates the sentence of a Japanese card with the configured mode.
+
+    Returns:
+      A tuple containing the Japanese sentence, Romaji, and English translation,
+      or three Nones if generation failed.
+    """
+    if GEMINI_GENERATION_MODE != "structured":
+        return get_sentence_with_word(word, fresh)
+    try:
+        content = generate_card_content(word, "japanese", fresh)
+        return content["sentence"], content["romaji"], content["translation"]
+    except Exception as e:
+        logger.error(e)
+        return None, None, None
+
+
+def get_english_content(word, fresh=False):
+    """
+    Generates the definition and sentence of an English card in one request.
+
+    Returns:
+      A tuple containing the definition and the sentence, or error strings if
+      generation failed.
+    """
+    try:
+        content = generate_card_content(word, "english", fresh)
+        return content["definition"], content["sentence"]
+    except Exception as e:
+        logger.error(e)
+        return f"Error generating sentence: {e}", f"Error generating sentence: {e}"
+
+
+class TranslationError(Exception):
+    """
+    Raised when Google Translate fails, so the error never reaches a card.
+    """
+
+
+def _store_translation(src, dest, text, translation):
+    # Translations are cached in both directions.
+    translation_cache.set(translation, src, dest, text)
+    translation_cache.set(text, dest, src, translation)
+
+
+async def translate(word, src, dest):
+    """
+    Translates a word, using the translation cache when possible.
+
+    Args:
+      word: The word to be translated.
+      src: The language of the word, e.g. "en".
+      dest: The language to translate to, e.g. "ja".
+
+    Returns:
+      The translated word.
+
+    Raises:
+      TranslationError: If the translation failed.
+    """
+    cached = await run_blocking(translation_cache.get, src, dest, word)
+    if cached:
+        return cached
+    try:
+        with span("translation"):
+            translation = await get_translator().translate(word, src=src, dest=dest)
+    except Exception as e:
+        raise TranslationError(f"Error in translation: {e}") from e
+    if not translation.text:
+        raise TranslationError(f"Empty translation for '{word}'")
+    await run_blocking(_store_translation, src, dest, word, translation.text)
+    return translation.text
+
+
+async def translate_many(words, src, dest):
+    """
+    Translates many words, sending the ones missing from the cache to Google
+    Translate in a single request.
+
+    Returns:
+      A dict mapping each word to its translation.
+
+    Raises:
+      TranslationError: If the translation request failed.
+    """
+
+    def lookup():
+        return {word: translation_cache.get(src, dest, word) for word in words}
+
+    results = {}
+    pending = []
+    for word, cached in (await run_blocking(lookup)).items():
+        if cached:
+            results[word] = cached
+        else:
+            pending.append(word)
+    if not pending:
+        return results
+
+    try:
+        with span("translation"):
+            translations = await get_translator().translate(
+                pending, src=src, dest=dest
+            )
+    except Exception as e:
+        raise TranslationError(f"Error in translation: {e}") from e
+    translated = {
+        word: translation.text
+        for word, translation in zip(pending, translations)
+        if translation.text
+    }
+
+    def store():
+        for word, text in translated.items():
+            _store_translation(src, dest, word, text)
+
+    await run_blocking(store)
+    results.update(translated)
+    return results
+
+
 async def translate_to_japanese(word):
     """
     Translates a word from English to Japanese.
@@ -170,12 +631,7 @@ async def translate_to_japanese(word):
     Returns:
       The translated word in Japanese.
     """
-    try:
-        translator = Translator()
-        translation = await translator.translate(word, src="en", dest="ja")
-        return translation.text
-    except Exception as e:
-        return f"Error in translation: {e}"
+    return await translate(word, "en", "ja")
 
 
 async def translate_to_english(word):
@@ -188,12 +644,7 @@ async def translate_to_english(word):
     Returns:
       The translated word in English.
     """
-    try:
-        translator = Translator()
-        translation = await translator.translate(word, src="ja", dest="en")
-        return translation.text
-    except Exception as e:
-        return f"Error in translation: {e}"
+    return await translate(word, "ja", "en")
 
 
 def identify_language(word):
@@ -223,32 +674,54 @@ def identify_language(word):
         return "Language not identified"
 
 
-def download_audio(text, lang, filename):
+def _text_to_speech(text, lang):
+    buffer = io.BytesIO()
+    get_gtts()(text=text, lang=lang).write_to_fp(buffer)
+    return buffer.getvalue()
+
+
+def synthesize_audio(text, lang):
     """
-    Generates and saves an audio file using gTTS.
+    Makes sure the audio cache has a clip of the text and returns its key.
+
+    gTTS only runs on a cache miss. Clips are kept in a content-addressed
+    store keyed by (text, lang, engine), so repeated words and sentences, and
+    retries after a failed `addNote`, are never synthesized again. Notes carry
+    the key rather than the mp3 bytes, which are only read if they have to be
+    sent to Anki as base64. Returns None if the audio could not be created.
     """
     try:
-        tts = gTTS(text=text, lang=lang)
-        tts.save(filename)
-        logger.info(f"Audio saved to {filename}")
-        return True
+        key = audio_key(text, lang, TTS_ENGINE)
+        record_audio_source(key, text, lang)
+        if get_cached_audio(key):
+            logger.info(f"Audio cache hit for '{text}'")
+            return key
+        with span("tts"):
+            audio_data = rate_limited("gtts", _text_to_speech, text, lang)
+        store_audio(key, audio_data)
+        logger.info(f"Audio generated for '{text}'")
+        return key
     except Exception as e:
-        logger.error(f"Error downloading audio {filename}: {e}")
-        return False
+        logger.error(f"Error downloading audio for '{text}': {e}")
+        return None
 
 
 def japanese_to_hiragana(text: str) -> str:
-    kakasi = pykakasi.kakasi()
-    result = kakasi.convert(text)
+    result = get_kakasi().convert(text)
     return "".join([item["hira"] for item in result])
 
 
 def romaji_to_kana(romaji: str) -> str:
     try:
-        response = requests.get(
-            "https://api.romaji2kana.com/v1/to/hiragana", params={"q": romaji}
-        )
-        response.raise_for_status()
+        with span("romaji2kana"):
+            response = http_request(
+                "romaji2kana",
+                "GET",
+                f"{ROMAJI2KANA_URL}/v1/to/hiragana",
+                idempotent=True,
+                params={"q": romaji},
+            )
+            response.raise_for_status()
         kana_with_spaces = response.json()["a"]
         kana_no_spaces = kana_with_spaces.replace(" ", "")
         return kana_no_spaces
@@ -257,53 +730,196 @@ def romaji_to_kana(romaji: str) -> str:
         return ""
 
 
-def empty_folder(folder_path):
+@span("kana")
+def get_kana_sentence(japanese_sentence, romaji_sentence):
     """
-    Empty a folder, ignoring the .gitkeep file.
+    Gets the kana version of a generated sentence without leaving the process.
+
+    `KANA_SENTENCE_SOURCE` picks the converter: "romaji" (the default)
+    transliterates the Gemini romaji with a lookup table, "kakasi" reads the
+    Japanese sentence with pykakasi and "remote" calls api.romaji2kana.com.
+    pykakasi reads kanji without context (今日は becomes こんにちは), so it is
+    only the fallback by default. If the local converter fails the other one
+    is tried, and the remote API only when
+    `ROMAJI2KANA_FALLBACK` is enabled.
+
+    Args:
+      japanese_sentence: The sentence in Japanese.
+      romaji_sentence: The same sentence in romaji.
+
+    Returns:
+      The sentence in kana, or an empty string if every converter failed.
     """
-    for item in os.listdir(folder_path):
-        if item == ".gitkeep":
-            continue
-        item_path = os.path.join(folder_path, item)
+    if KANA_SENTENCE_SOURCE == "remote":
+        return romaji_to_kana(romaji_sentence)
+
+    converters = [
+        (romaji_to_hiragana, romaji_sentence),
+        (japanese_to_hiragana, japanese_sentence),
+    ]
+    if KANA_SENTENCE_SOURCE == "kakasi":
+        converters.reverse()
+    for converter, text in converters:
         try:
-            if os.path.isfile(item_path) or os.path.islink(item_path):
-                os.remove(item_path)
-            elif os.path.isdir(item_path):
-                shutil.rmtree(item_path)
+            kana = converter(text)
+            if kana:
+                return kana
         except Exception as e:
-            logger.error(f"Failed to delete {item_path}. Reason: {e}")
+            record_error("kana")
+            logger.error(f"Error converting '{text}' to kana: {e}")
+
+    if ROMAJI2KANA_FALLBACK:
+        return romaji_to_kana(romaji_sentence)
+    return ""
+
 
+# Notes carry one tag per field naming the settings it was generated with, so
+# that `flask refresh-notes` only rebuilds notes whose settings changed.
+FINGERPRINT_TAG_PREFIX = "anki_generator::"
 
-def addnote(ankiconnect_url, deck_name, word):
-    # Ensure audios directory exists
-    audio_dir = "audios"
-    if not os.path.exists(audio_dir):
-        os.makedirs(audio_dir)
-    empty_folder(audio_dir)
 
+def generation_inputs(field):
+    """
+    Returns the settings that decide the content of a note field.
+    """
+    if field == "Front":
+        return {"tts": TTS_ENGINE}
+    return {
+        "model": GEMINI_MODEL,
+        "mode": GEMINI_GENERATION_MODE,
+        "kana": KANA_SENTENCE_SOURCE,
+        "tts": TTS_ENGINE,
+    }
+
+
+def fingerprint_tag(field):
+    """
+    Returns the tag recording the current `generation_inputs` of a field, e.g.
+    `anki_generator::back::1a2b3c4d`.
+    """
+    inputs = json.dumps(generation_inputs(field), sort_keys=True)
+    digest = hashlib.sha256(inputs.encode("utf-8")).hexdigest()[:8]
+    return f"{FINGERPRINT_TAG_PREFIX}{field.lower()}::{digest}"
+
+
+def japanese_note(
+    deck_name,
+    translation,
+    kana_word,
+    english_word,
+    japanese_sentence,
+    kana_sentence,
+    english_sentence,
+):
+    """
+    Builds the AnkiConnect note of a Japanese card. Its audio is stored as
+    `<translation>.mp3` and `<translation>_sentence.mp3`.
+    """
+    word_audio_filename = f"{translation}.mp3"
+    sentence_audio_filename = f"{translation}_sentence.mp3"
+    return {
+        "deckName": deck_name,
+        "modelName": "Basic",
+        "fields": {
+            "Front": f'<span style="font-size: 60px;">{translation}</span><br>[sound:{word_audio_filename}]<br>{kana_word}',
+            "Back": f'<span style="font-size: 40px;">{english_word}</span><br><span style="font-size: 30px;">{japanese_sentence}</span><br>{kana_sentence}<br>{english_sentence}<br>[sound:{sentence_audio_filename}]',
+        },
+        "options": {"allowDuplicate": False},
+        "tags": [
+            "japanese_anki_generator",
+            fingerprint_tag("Front"),
+            fingerprint_tag("Back"),
+        ],
+    }
+
+
+def english_note(deck_name, english_word, english_definition, english_sentence):
+    """
+    Builds the AnkiConnect note of an English card. Its audio is stored as
+    `<word>.mp3` and `<word>_sentence.mp3`.
+    """
+    word_audio_filename = f"{english_word}.mp3"
+    sentence_audio_filename = f"{english_word}_sentence.mp3"
+    return {
+        "deckName": deck_name,
+        "modelName": "Basic",
+        "fields": {
+            "Front": f'<span style="font-size: 60px;">{english_word}</span><br>[sound:{word_audio_filename}]',
+            "Back": f'<span style="font-size: 20px;">{english_definition}</span><br><br>{english_sentence}<br>[sound:{sentence_audio_filename}]',
+        },
+        "options": {"allowDuplicate": False},
+        "tags": [
+            "english_anki_generator",
+            fingerprint_tag("Front"),
+            fingerprint_tag("Back"),
+        ],
+    }
+
+
+def build_note(deck_name, word, fresh=False, progress=None, preflight=None):
+    """
+    Builds a Japanese note and its audio without touching Anki.
+
+    Args:
+      deck_name: The Anki deck the note belongs to.
+      word: The word (English or Japanese) to build the card for.
+      fresh: Skip the generation cache and ask Gemini for new content.
+      progress: Optional callable that receives the name of each stage.
+      preflight: Optional callable that receives the Front word as soon as it
+        is known, before any Gemini or TTS call. It may raise to stop the build.
+
+    Returns:
+      A tuple containing the AnkiConnect note and a dict mapping each media
+      filename to the audio cache key of its clip.
+    """
     word = word.lower()
     language = identify_language(word)
-    translation = ""
-    english_word = ""
+
+    # translation -> word audio, kana word,
+    #                sentence -> (sentence audio, kana sentence)
+    report_stage(progress, "translation")
     if language == "English":
         english_word = word
-        translation = asyncio.run(translate_to_japanese(word))
-        japanese_sentence, romaji_sentence, english_sentence = get_sentence_with_word(
-            translation
-        )
+        translation = run_async(translate_to_japanese(word))
     else:
-        english_word = asyncio.run(translate_to_english(word)).lower()
         translation = word  # If the word is already Japanese, use it as the translation
-        japanese_sentence, romaji_sentence, english_sentence = get_sentence_with_word(
-            word
+
+    if preflight:
+        preflight(translation)
+
+    english_word_future = None
+    if language != "English":
+        english_word_future = run_stage(
+            lambda: run_async(translate_to_english(word)).lower()
         )
 
+    word_audio_filename = f"{translation}.mp3"
+    sentence_audio_filename = f"{translation}_sentence.mp3"
+
+    report_stage(progress, "generation")
+    sentence_future = run_stage(get_japanese_sentence, translation, fresh)
+    kana_word_future = run_stage(japanese_to_hiragana, translation)
+    word_audio_future = run_stage(synthesize_audio, translation, "ja")
+
+    japanese_sentence, romaji_sentence, english_sentence = sentence_future.result()
     if not japanese_sentence or not romaji_sentence or not english_sentence:
         logger.warning(f"Skipping note for '{word}' due to sentence generation error.")
+        pending = (english_word_future, kana_word_future, word_audio_future)
+        wait([future for future in pending if future])
         raise Exception("Sentences not found")
 
-    kana_word = japanese_to_hiragana(translation)
-    kana_sentence = romaji_to_kana(romaji_sentence)
+    report_stage(progress, "audio")
+    kana_sentence_future = run_stage(
+        get_kana_sentence, japanese_sentence, romaji_sentence
+    )
+    sentence_audio_future = run_stage(synthesize_audio, japanese_sentence, "ja")
+
+    if english_word_future is not None:
+        english_word = english_word_future.result()
+    kana_word = kana_word_future.result()
+    kana_sentence = kana_sentence_future.result()
+    word_audio = word_audio_future.result()
+    sentence_audio = sentence_audio_future.result()
 
     logger.info(f"Processing '{word}':")
     logger.info(f"  Japanese Translation: {translation}")
@@ -313,74 +929,83 @@ def addnote(ankiconnect_url, deck_name, word):
     logger.info(f"  Kana Sentence: {kana_sentence}")
     logger.info(f"  English Sentence: {english_sentence}")
 
-    # Download audio for the word
-    word_audio_filename = os.path.join(audio_dir, f"{translation}.mp3")
-    word_audio_success = download_audio(translation, "ja", word_audio_filename)
-
-    # Download audio for the sentence
-    sentence_audio_filename = os.path.join(audio_dir, f"{translation}_sentence.mp3")
-    sentence_audio_success = download_audio(
-        japanese_sentence, "ja", sentence_audio_filename
-    )
-
-    if not word_audio_success or not sentence_audio_success:
+    if not word_audio or not sentence_audio:
         logger.warning(f"Skipping note for '{word}' due to audio download error.")
         raise Exception("Audios not found")
 
-    try:
-        # Add to Anki
-        logger.info("Adding note to Anki...")
-        # Add note
-        note = {
-            "deckName": deck_name,
-            "modelName": "Basic",
-            "fields": {
-                "Front": f'<span style="font-size: 60px;">{translation}</span><br>[sound:{os.path.basename(word_audio_filename)}]<br>{kana_word}',
-                "Back": f'<span style="font-size: 40px;">{english_word}</span><br><span style="font-size: 30px;">{japanese_sentence}</span><br>{kana_sentence}<br>{english_sentence}<br>[sound:{os.path.basename(sentence_audio_filename)}]',
-            },
-            "options": {"allowDuplicate": False},
-            "tags": ["japanese_anki_generator"],
-        }
-        invoke_ankiconnect(ankiconnect_url, "addNote", note=note)
-
-        logger.info(f"Added note for: {translation}")
-
-        logger.info("Uploading files...")
-
-        # Upload word audio
-        upload_audio(word_audio_filename, ankiconnect_url)
-
-        # Upload sentence audio
-        upload_audio(sentence_audio_filename, ankiconnect_url)
-
-        # Sync
-        sync_ankiconnect(ankiconnect_url)
+    note = japanese_note(
+        deck_name,
+        translation,
+        kana_word,
+        english_word,
+        japanese_sentence,
+        kana_sentence,
+        english_sentence,
+    )
+    return note, {
+        word_audio_filename: word_audio,
+        sentence_audio_filename: sentence_audio,
+    }
 
-    except Exception as e:
-        logger.error(f"Skipping note for '{word}' due to error: {e}")
-        raise e
-    finally:
-        logger.info("Emptying audio folder...")
-        empty_folder(audio_dir)
 
+def build_note_english(
+    deck_name, word, fresh=False, progress=None, preflight=None
+):
+    """
+    Builds an English note and its audio without touching Anki.
 
-def addnote_english(ankiconnect_url, deck_name, word):
-    # Ensure audios directory exists
-    audio_dir = "audios"
-    if not os.path.exists(audio_dir):
-        os.makedirs(audio_dir)
-    empty_folder(audio_dir)
+    Args:
+      deck_name: The Anki deck the note belongs to.
+      word: The word (English or Japanese) to build the card for.
+      fresh: Skip the generation cache and ask Gemini for new content.
+      progress: Optional callable that receives the name of each stage.
+      preflight: Optional callable that receives the Front word as soon as it
+        is known, before any Gemini or TTS call. It may raise to stop the build.
 
+    Returns:
+      A tuple containing the AnkiConnect note and a dict mapping each media
+      filename to the audio cache key of its clip.
+    """
     word = word.lower()
     language = identify_language(word)
-    english_word = ""
+
+    # translation -> word audio, definition, (sentence -> sentence audio)
     if language == "Japanese":
-        english_word = asyncio.run(translate_to_english(word)).lower()
+        report_stage(progress, "translation")
+        english_word = run_async(translate_to_english(word)).lower()
     else:
         english_word = word
 
-    english_definition = get_definition(word)
-    english_sentence = get_sentence_with_word_english(word)
+    if preflight:
+        preflight(english_word)
+
+    report_stage(progress, "generation")
+    structured = GEMINI_GENERATION_MODE == "structured"
+    if structured:
+        content_future = run_stage(get_english_content, word, fresh)
+    else:
+        definition_future = run_stage(get_definition, word, fresh)
+        sentence_future = run_stage(get_sentence_with_word_english, word, fresh)
+
+    word_audio_filename = f"{english_word}.mp3"
+    sentence_audio_filename = f"{english_word}_sentence.mp3"
+    word_audio_future = run_stage(synthesize_audio, english_word, "en")
+
+    if structured:
+        english_definition, english_sentence = content_future.result()
+    else:
+        english_sentence = sentence_future.result()
+    report_stage(progress, "audio")
+    sentence_audio_future = None
+    if english_sentence and "Error generating sentence" not in english_sentence:
+        sentence_audio_future = run_stage(synthesize_audio, english_sentence, "en")
+    if not structured:
+        english_definition = definition_future.result()
+    word_audio = word_audio_future.result()
+    sentence_audio = (
+        sentence_audio_future.result() if sentence_audio_future else None
+    )
+
     if not english_sentence or not english_definition:
         logger.warning(f"Skipping note for '{word}' due to generation error.")
         raise Exception("Sentence or definition not found")
@@ -394,55 +1019,321 @@ def addnote_english(ankiconnect_url, deck_name, word):
     logger.info(f"  Definition: {english_definition}")
     logger.info(f"  English Sentence: {english_sentence}")
 
-    # Download audio for the word
-    word_audio_filename = os.path.join(audio_dir, f"{english_word}.mp3")
-    word_audio_success = download_audio(english_word, "en", word_audio_filename)
+    if not word_audio or not sentence_audio:
+        logger.warning(f"Skipping note for '{word}' due to audio download error.")
+        raise Exception("Audios not found")
 
-    # Download audio for the sentence
-    sentence_audio_filename = os.path.join(audio_dir, f"{english_word}_sentence.mp3")
-    sentence_audio_success = download_audio(
-        english_sentence, "en", sentence_audio_filename
+    note = english_note(
+        deck_name, english_word, english_definition, english_sentence
     )
+    return note, {
+        word_audio_filename: word_audio,
+        sentence_audio_filename: sentence_audio,
+    }
 
-    if not word_audio_success or not sentence_audio_success:
-        logger.warning(f"Skipping note for '{word}' due to audio download error.")
-        raise Exception("Audios not found")
 
+@span("addnote")
+def addnote(ankiconnect_url, deck_name, word, fresh=False, progress=None):
     try:
-        # Sync
-        sync_ankiconnect(ankiconnect_url)
+        # Don't spend Gemini and gTTS calls on a note Anki can't take.
+        ensure_anki_available(ankiconnect_url)
+        note, media = cached_build(
+            build_note,
+            deck_name,
+            word,
+            fresh,
+            progress,
+            preflight=lambda front: ensure_not_duplicate(
+                ankiconnect_url, deck_name, front
+            ),
+        )
+        report_stage(progress, "anki")
 
         # Add to Anki
         logger.info("Adding note to Anki...")
-        # Add note
-        note = {
-            "deckName": deck_name,
-            "modelName": "Basic",
-            "fields": {
-                "Front": f'<span style="font-size: 60px;">{english_word}</span><br>[sound:{os.path.basename(word_audio_filename)}]',
-                "Back": f'<span style="font-size: 20px;">{english_definition}</span><br><br>{english_sentence}<br>[sound:{os.path.basename(sentence_audio_filename)}]',
-            },
-            "options": {"allowDuplicate": False},
-            "tags": ["english_anki_generator"],
-        }
-        invoke_ankiconnect(ankiconnect_url, "addNote", note=note)
-
-        logger.info(f"Added note for: {english_word}")
+        note_id = invoke_ankiconnect(ankiconnect_url, "addNote", note=note)
+        record_note(deck_name, note_id, front_key(note["fields"]["Front"]))
+
+        logger.info(f"Added note for: {word}")
 
         logger.info("Uploading files...")
 
-        # Upload word audio
-        upload_audio(word_audio_filename, ankiconnect_url)
+        for filename, clip in media.items():
+            upload_audio(filename, clip, ankiconnect_url)
+
+        # Sync once the burst of adds is over
+        request_sync(ankiconnect_url)
 
-        # Upload sentence audio
-        upload_audio(sentence_audio_filename, ankiconnect_url)
+    except Exception as e:
+        logger.error(f"Skipping note for '{word}' due to error: {e}")
+        raise e
 
-        # Sync
-        sync_ankiconnect(ankiconnect_url)
+
+@span("addnote_english")
+def addnote_english(ankiconnect_url, deck_name, word, fresh=False, progress=None):
+    try:
+        # Don't spend Gemini and gTTS calls on a note Anki can't take.
+        ensure_anki_available(ankiconnect_url)
+        note, media = cached_build(
+            build_note_english,
+            deck_name,
+            word,
+            fresh,
+            progress,
+            preflight=lambda front: ensure_not_duplicate(
+                ankiconnect_url, deck_name, front
+            ),
+        )
+        report_stage(progress, "anki")
+
+        # Add to Anki
+        logger.info("Adding note to Anki...")
+        note_id = invoke_ankiconnect(ankiconnect_url, "addNote", note=note)
+        record_note(deck_name, note_id, front_key(note["fields"]["Front"]))
+
+        logger.info(f"Added note for: {word}")
+
+        logger.info("Uploading files...")
+
+        for filename, clip in media.items():
+            upload_audio(filename, clip, ankiconnect_url)
+
+        # Sync once the burst of adds is over
+        request_sync(ankiconnect_url)
 
     except Exception as e:
         logger.error(f"Skipping note for '{word}' due to error: {e}")
         raise e
-    finally:
-        logger.info("Emptying the audio folder...")
-        empty_folder(audio_dir)
+
+
+def audio_media_action(filename, clip, mode=None):
+    """
+    Builds a `storeMediaFile` action for an AnkiConnect `multi` request.
+    """
+    return {
+        "action": "storeMediaFile",
+        "version": 6,
+        "params": media_params(filename, clip, mode),
+    }
+
+
+def prefetch_card_content(entries, fresh=False, is_duplicate=None):
+    """
+    Generates the Gemini content of many cards with batched requests.
+
+    Words that need a translation are translated with one bulk request first.
+    The results land in the translation and generation caches, where the note
+    builders find them.
+
+    Args:
+      entries: A list of dicts with "word" and "deck".
+      fresh: Skip the generation cache and ask Gemini for new content.
+      is_duplicate: Optional callable `(deck, front)` used to leave out words
+        that are already in the deck.
+
+    Returns:
+      The set of (deck, word) pairs that were prefetched.
+    """
+    if GEMINI_GENERATION_MODE != "structured":
+        return set()
+
+    # Front words that need a translation are translated in bulk first.
+    to_translate = {("en", "ja"): [], ("ja", "en"): []}
+    for entry in entries:
+        word = entry["word"].lower()
+        language = identify_language(word)
+        if entry["deck"] == "japanese" and language == "English":
+            to_translate[("en", "ja")].append(word)
+        elif entry["deck"] != "japanese" and language == "Japanese":
+            to_translate[("ja", "en")].append(word)
+    translated = {}
+    for (src, dest), pending in to_translate.items():
+        try:
+            translated[dest] = run_async(translate_many(pending, src, dest))
+        except TranslationError as e:
+            logger.error(f"Bulk translation failed: {e}")
+            translated[dest] = {}
+
+    words = {"japanese": [], "english": []}
+    for entry in entries:
+        deck, word = entry["deck"], entry["word"].lower()
+        language = identify_language(word)
+        kind = "japanese" if deck == "japanese" else "english"
+        if language == kind.capitalize():
+            front = word
+        else:
+            front = translated["ja" if kind == "japanese" else "en"].get(word)
+        if not front or (is_duplicate and is_duplicate(deck, front.lower())):
+            continue
+        # Japanese cards are generated for the Japanese word, English cards for
+        # the word as it was given.
+        generation_word = front if kind == "japanese" else word
+        words[kind].append((deck, word, generation_word))
+
+    prefetched = set()
+    for kind, items in words.items():
+        if len(items) > 1:
+            content = generate_card_content_batch(
+                [generation_word for _, _, generation_word in items], kind, fresh
+            )
+            prefetched.update(
+                (deck, word) for deck, word, generation_word in items
+                if generation_word in content
+            )
+    return prefetched
+
+
+def addnotes(ankiconnect_url, entries, fresh=False, progress=None):
+    """
+    Builds several notes and pushes them to Anki with a single `multi` request.
+
+    Up to `PIPELINE_WORKERS` notes are built at once, their stages sharing the
+    pipeline pool. The `multi` request then stores every audio file, checks
+    which notes can be added and adds them all with one `addNotes` action. A
+    single sync is scheduled at the end.
+
+    Args:
+      ankiconnect_url: The AnkiConnect URL.
+      entries: A list of dicts with "word" and "deck" ("japanese" or "english").
+      fresh: Skip the generation cache and ask Gemini for new content.
+      progress: Optional callable receiving the stage of the batch, e.g.
+        "building 3/20", after each note is built.
+
+    Returns:
+      A list with one result dict per entry, in the same order.
+
+    Raises:
+      AnkiUnavailableError: If AnkiConnect is down, before anything is built.
+    """
+    ensure_anki_available(ankiconnect_url)
+
+    # A word repeated in the batch is only built and added once.
+    results = []
+    unique = []
+    seen = set()
+    for entry in entries:
+        result = {"word": entry["word"], "value": entry["deck"]}
+        results.append(result)
+        key = (entry["deck"], entry["word"].strip().lower())
+        if key in seen:
+            result.update({"status": "error", "error": "Repeated word in the batch"})
+            continue
+        seen.add(key)
+        unique.append((entry, result))
+
+    prefetched = prefetch_card_content(
+        [entry for entry, _ in unique],
+        fresh,
+        is_duplicate=lambda deck, front: is_duplicate(
+            ankiconnect_url, deck.capitalize(), front
+        ),
+    )
+
+    def build(entry):
+        word, deck = entry["word"], entry["deck"]
+        builder = build_note if deck == "japanese" else build_note_english
+        # Content generated by the batch request is already fresh.
+        word_fresh = fresh and (deck, word.lower()) not in prefetched
+        return builder(
+            deck.capitalize(),
+            word,
+            word_fresh,
+            preflight=lambda front: ensure_not_duplicate(
+                ankiconnect_url, deck.capitalize(), front
+            ),
+        )
+
+    notes = []
+    media = []
+    # Each build waits on its stages in the pipeline pool, so the builds run
+    # on threads of their own.
+    with ThreadPoolExecutor(
+        max_workers=min(PIPELINE_WORKERS, len(unique)), thread_name_prefix="addnotes"
+    ) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, build, entry)
+            for entry, _ in unique
+        ]
+        for built, ((entry, result), future) in enumerate(zip(unique, futures), 1):
+            try:
+                note, note_media = future.result()
+                media.extend(note_media.items())
+                notes.append((result, note))
+            except Exception as e:
+                logger.error(f"Skipping note for '{entry['word']}' due to error: {e}")
+                result.update({"status": "error", "error": str(e)})
+            report_stage(progress, f"building {built}/{len(unique)}")
+
+    if not notes:
+        return results
+
+    logger.info(f"Adding {len(notes)} notes to Anki...")
+    report_stage(progress, "anki")
+    note_payload = [note for _, note in notes]
+    mode = transfer_mode()
+    media_actions = [
+        audio_media_action(filename, clip, mode) for filename, clip in media
+    ]
+    actions = media_actions + [
+        {
+            "action": "canAddNotesWithErrorDetail",
+            "version": 6,
+            "params": {"notes": note_payload},
+        },
+        {"action": "addNotes", "version": 6, "params": {"notes": note_payload}},
+    ]
+    responses = invoke_ankiconnect(ankiconnect_url, "multi", actions=actions)
+    can_add, added = responses[-2], responses[-1]
+
+    failed_media = [
+        (item, response["error"])
+        for item, response in zip(media, responses)
+        if response.get("error")
+    ]
+    if failed_media and mode != "base64":
+        fall_back_to_base64(failed_media[0][1])
+        retry = [audio_media_action(*item, "base64") for item, _ in failed_media]
+        responses = invoke_ankiconnect(ankiconnect_url, "multi", actions=retry)
+        failed_media = [
+            (item, response["error"])
+            for (item, _), response in zip(failed_media, responses)
+            if response.get("error")
+        ]
+    for (filename, _), error in failed_media:
+        logger.warning(f"storeMediaFile failed for {filename}: {error}")
+
+    details = can_add.get("result") or [{} for _ in notes]
+    note_ids = added.get("result")
+    errors = {}
+    if not isinstance(note_ids, list):
+        # addNotes fails as a whole when one note can't be added, without
+        # saying which ones were. Add the notes that can be one at a time.
+        logger.warning(f"addNotes failed ({added.get('error')}), adding one by one")
+        note_ids = [None] * len(notes)
+        retry = [index for index, detail in enumerate(details) if detail.get("canAdd")]
+        if retry:
+            actions = [
+                {"action": "addNote", "version": 6, "params": {"note": notes[i][1]}}
+                for i in retry
+            ]
+            responses = invoke_ankiconnect(ankiconnect_url, "multi", actions=actions)
+            for index, response in zip(retry, responses):
+                note_ids[index] = response.get("result")
+                errors[index] = response.get("error")
+    for index, (result, note) in enumerate(notes):
+        note_id = note_ids[index]
+        if note_id:
+            result.update({"status": "added", "note_id": note_id})
+            record_note(note["deckName"], note_id, front_key(note["fields"]["Front"]))
+        else:
+            error = (
+                errors.get(index)
+                or details[index].get("error")
+                or added.get("error")
+                or "Note not added"
+            )
+            result.update({"status": "error", "error": error})
+
+    if any(result["status"] == "added" for result, _ in notes):
+        request_sync(ankiconnect_url)
+    return results
@@ -0,0 +1,13 @@
+import logging
+
+from app import create_app, start_background_workers
+from app.asgi import create_asgi_app
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+app = create_asgi_app(create_app())
+start_background_workers()
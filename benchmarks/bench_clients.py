@@ -0,0 +1,81 @@
+"""
+Micro-benchmark: per-call client construction vs. the shared process-wide clients.
+
+Only measures object construction and event loop overhead, so it needs no
+network access. Run from the project root:
+
+    python -m benchmarks.bench_clients [iterations]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pykakasi
+from google import genai
+from googletrans import Translator
+
+from app.utils.clients import get_genai_client, get_kakasi, get_translator, run_async
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-key")
+
+
+def timed(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+async def noop():
+    return None
+
+
+async def translator_per_call():
+    Translator()
+
+
+async def translator_shared():
+    # The translator is kept per event loop.
+    get_translator()
+
+
+def kakasi_per_call():
+    pykakasi.kakasi().convert("猫が好きです")
+
+
+def kakasi_shared():
+    get_kakasi().convert("猫が好きです")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    cases = [
+        ("pykakasi", kakasi_per_call, kakasi_shared),
+        (
+            "googletrans Translator",
+            lambda: run_async(translator_per_call()),
+            lambda: run_async(translator_shared()),
+        ),
+        ("genai.Client", genai.Client, get_genai_client),
+        (
+            "event loop",
+            lambda: asyncio.run(noop()),
+            lambda: run_async(noop()),
+        ),
+    ]
+
+    print(f"{'stage':<24}{'per call (ms)':>16}{'shared (ms)':>16}{'saved (ms)':>14}")
+    total_saved = 0.0
+    for name, per_call, shared in cases:
+        shared()  # first use pays the init cost once, as in warm_up()
+        before = timed(per_call, iterations)
+        after = timed(shared, iterations)
+        total_saved += before - after
+        print(f"{name:<24}{before:>16.3f}{after:>16.3f}{before - after:>14.3f}")
+    print(f"{'saved per request':<56}{total_saved:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
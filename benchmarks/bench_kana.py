@@ -0,0 +1,96 @@
+"""
+Correctness corpus and latency comparison for the kana sentence converters.
+
+Checks pykakasi (from the Japanese sentence) and the lookup-table
+transliterator (from the romaji) against the expected kana, then times both.
+Pass --remote to also time api.romaji2kana.com (needs network access). Run from
+the project root:
+
+    python -m benchmarks.bench_kana [--remote]
+
+Exits with a non-zero status if the table converter, the default, disagrees
+with the corpus. pykakasi is only the fallback: it reads kanji without context
+(今日は as こんにちは), so its mismatches are reported but don't fail the check.
+"""
+
+import sys
+import time
+
+from app.utils.kana import romaji_to_hiragana
+from app.utils.utils import japanese_to_hiragana, romaji_to_kana
+
+# (Japanese sentence, romaji returned by Gemini, expected kana)
+CORPUS = [
+    ("私は猫が好きです。", "Watashi wa neko ga suki desu.", "わたしはねこがすきです。"),
+    ("今日は天気がいいです。", "Kyō wa tenki ga ii desu.", "きょうはてんきがいいです。"),
+    ("学校に行きます。", "Gakkō ni ikimasu.", "がっこうにいきます。"),
+    ("水を飲みます。", "Mizu o nomimasu.", "みずをのみます。"),
+    ("本を読んでいます。", "Hon o yonde imasu.", "ほんをよんでいます。"),
+    ("駅はどこですか？", "Eki wa doko desu ka?", "えきはどこですか？"),
+    ("東京へ行きたいです。", "Tōkyō e ikitai desu.", "とうきょうへいきたいです。"),
+    ("新聞を読みました。", "Shinbun o yomimashita.", "しんぶんをよみました。"),
+    ("先生は優しいです。", "Sensei wa yasashii desu.", "せんせいはやさしいです。"),
+    (
+        "日本語を勉強しています。",
+        "Nihongo o benkyō shite imasu.",
+        "にほんごをべんきょうしています。",
+    ),
+    (
+        "友達と映画を見ました。",
+        "Tomodachi to eiga o mimashita.",
+        "ともだちとえいがをみました。",
+    ),
+    ("雨が降っています。", "Ame ga futte imasu.", "あめがふっています。"),
+    (
+        "電車で会社に行きます。",
+        "Densha de kaisha ni ikimasu.",
+        "でんしゃでかいしゃにいきます。",
+    ),
+    (
+        "昨日、友達に会いました。",
+        "Kinō, tomodachi ni aimashita.",
+        "きのう、ともだちにあいました。",
+    ),
+    ("母は料理が上手です。", "Haha wa ryōri ga jōzu desu.", "はははりょうりがじょうずです。"),
+    ("抹茶を飲みます。", "Matcha o nomimasu.", "まっちゃをのみます。"),
+]
+
+
+def check(name, convert, column):
+    failures = 0
+    for row in CORPUS:
+        expected = row[2]
+        try:
+            actual = convert(row[column])
+        except Exception as e:
+            actual = f"<{e}>"
+        if actual != expected:
+            failures += 1
+            print(f"  {name}: {row[column]!r} -> {actual!r}, expected {expected!r}")
+    print(f"{name:<12}{len(CORPUS) - failures}/{len(CORPUS)} correct")
+    return failures
+
+
+def timed(convert, column, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for row in CORPUS:
+            convert(row[column])
+    return (time.perf_counter() - start) / (iterations * len(CORPUS)) * 1000
+
+
+def main():
+    failures = check("table", romaji_to_hiragana, 1)
+    check("pykakasi", japanese_to_hiragana, 0)
+
+    print(f"\n{'converter':<12}{'ms per sentence':>18}")
+    print(f"{'pykakasi':<12}{timed(japanese_to_hiragana, 0, 20):>18.3f}")
+    print(f"{'table':<12}{timed(romaji_to_hiragana, 1, 20):>18.3f}")
+    if "--remote" in sys.argv:
+        print(f"{'remote':<12}{timed(romaji_to_kana, 1, 1):>18.3f}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
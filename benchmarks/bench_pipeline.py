@@ -0,0 +1,190 @@
+"""
+Offline load test of the note pipeline against fake external services.
+
+Starts local fakes for AnkiConnect, Portainer and romaji2kana, swaps Gemini,
+Google Translate and gTTS for in-process fakes (see benchmarks/fakes.py) and
+adds notes at a fixed concurrency. No network access or API keys are needed.
+Run from the project root:
+
+    python -m benchmarks.bench_pipeline --requests 200 --concurrency 16
+    python -m benchmarks.bench_pipeline --mode direct --deck english
+    python -m benchmarks.bench_pipeline --gemini-latency 2 --tts-error-rate 0.05
+    python -m benchmarks.bench_pipeline --gemini-quota 30 --requests 60
+
+`--mode http` posts to /api/addnote through the Flask test client, one thread
+per in-flight request; `--mode asgi` posts to the ASGI app (asgi.py) from a
+single event loop; `--mode direct` calls addnote/addnote_english. Reports
+p50/p95/p99 latency per pipeline stage and per fake service, error counts and
+throughput.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import DEFAULT_PROFILES, FakeEnvironment, ServiceProfile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=("http", "asgi", "direct"), default="http")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--deck", choices=("japanese", "english"), default="japanese")
+    parser.add_argument(
+        "--handle-container",
+        action="store_true",
+        help="check the (fake) Portainer container on every request",
+    )
+    for service, profile in DEFAULT_PROFILES.items():
+        flag = service.replace("_", "-")
+        parser.add_argument(
+            f"--{flag}-latency", type=float, default=profile.latency, metavar="S"
+        )
+        parser.add_argument(
+            f"--{flag}-error-rate", type=float, default=0.0, metavar="P"
+        )
+        parser.add_argument(
+            f"--{flag}-quota",
+            type=float,
+            default=0.0,
+            metavar="N",
+            help="calls per minute before the fake answers 429",
+        )
+    return parser.parse_args()
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def print_table(title, samples):
+    print(
+        f"\n{title:<28}{'n':>6}{'errors':>8}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    for name in sorted(samples):
+        durations = [duration for duration, _ in samples[name]]
+        errors = sum(1 for _, failed in samples[name] if failed)
+        print(
+            f"{name:<28}{len(durations):>6}{errors:>8}"
+            f"{percentile(durations, 50) * 1000:>10.1f}"
+            f"{percentile(durations, 95) * 1000:>10.1f}"
+            f"{percentile(durations, 99) * 1000:>10.1f}"
+        )
+
+
+def main():
+    args = parse_args()
+    profiles = {
+        service: ServiceProfile(
+            latency=getattr(args, f"{service}_latency"),
+            error_rate=getattr(args, f"{service}_error_rate"),
+            quota=getattr(args, f"{service}_quota"),
+        )
+        for service in DEFAULT_PROFILES
+    }
+    fakes = FakeEnvironment(profiles)
+
+    # The app reads its configuration at import time.
+    os.environ.update(fakes.environ())
+    os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="bench-pipeline-"))
+    os.environ["WARM_UP"] = "False"
+    os.environ["HANDLE_CONTAINER"] = str(args.handle_container)
+    os.environ.setdefault("KANA_SENTENCE_SOURCE", "romaji")
+    # Configured rate limits would cap the benchmark instead of the pipeline.
+    # They only apply when a fake has a quota, to see how the limiter copes.
+    if not any(getattr(args, f"{service}_quota") for service in DEFAULT_PROFILES):
+        os.environ["GEMINI_RATE_LIMIT"] = "0"
+        os.environ["GTTS_RATE_LIMIT"] = "0"
+
+    from app import create_app
+    from app.utils.utils import addnote, addnote_english
+
+    fakes.install()
+    app = create_app()
+    client = app.test_client()
+    run_id = uuid.uuid4().hex[:6]
+    deck = args.deck.capitalize()
+    stages = defaultdict(list)
+
+    def one(index):
+        word = f"word{run_id}{index}"
+        start = time.perf_counter()
+        if args.mode == "http":
+            response = client.post(
+                "/api/addnote", json={"word": word, "dropdownValue": args.deck}
+            )
+            failed = response.status_code != 200
+            stages["request"].append((time.perf_counter() - start, failed))
+            return
+
+        marks = []
+
+        def progress(stage):
+            marks.append((stage, time.perf_counter()))
+
+        add = addnote if args.deck == "japanese" else addnote_english
+        failed = False
+        try:
+            add(fakes.anki.url, deck, word, progress=progress)
+        except Exception:
+            failed = True
+        end = time.perf_counter()
+        for (stage, at), (_, next_at) in zip(marks, marks[1:] + [(None, end)]):
+            stages[f"stage:{stage}"].append((next_at - at, False))
+        stages["request"].append((end - start, failed))
+
+    async def run_asgi():
+        import httpx
+
+        from app.asgi import create_asgi_app
+
+        transport = httpx.ASGITransport(app=create_asgi_app(app))
+        slots = asyncio.Semaphore(args.concurrency)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as asgi_client:
+
+            async def one_async(index):
+                async with slots:
+                    start = time.perf_counter()
+                    word = f"word{run_id}{index}"
+                    response = await asgi_client.post(
+                        "/api/addnote", json={"word": word, "dropdownValue": args.deck}
+                    )
+                    failed = response.status_code != 200
+                    stages["request"].append((time.perf_counter() - start, failed))
+
+            await asyncio.gather(*(one_async(i) for i in range(args.requests)))
+
+    started = time.perf_counter()
+    if args.mode == "asgi":
+        asyncio.run(run_asgi())
+    else:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    failures = sum(1 for _, failed in stages["request"] if failed)
+    print(
+        f"{args.requests} {args.deck} notes via {args.mode}, "
+        f"concurrency {args.concurrency}: {elapsed:.2f}s, "
+        f"{args.requests / elapsed:.2f} notes/s, {failures} failed"
+    )
+    print_table("pipeline", stages)
+    print_table("fake service", fakes.recorder.samples)
+    fakes.stop()
+    sys.exit(1 if failures == args.requests else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Startup time and per-worker memory of the app under gunicorn.
+
+First measures, each in a fresh interpreter, how long importing the app takes
+and how much each of the heavy client libraries adds on first use. Then starts
+gunicorn (with gunicorn.conf.py) with and without PRELOAD_APP and reports the
+time until every worker has booted and answers requests, plus the RSS, PSS
+(RSS with shared pages split between the processes sharing them) and USS
+(private memory) of the master and of each worker. Linux only, as memory is
+read from /proc. Run from the project root:
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --workers 4 --no-warm-up
+"""
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+IMPORTS = (
+    ("app", "import app"),
+    ("google.genai", "import google.genai"),
+    ("googletrans", "import googletrans"),
+    ("gtts", "import gtts"),
+    ("pykakasi + dictionaries", "import pykakasi; pykakasi.kakasi().convert('日本語')"),
+)
+
+PROBE = """
+import time
+started = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - started
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+print(elapsed, rss)
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--no-warm-up",
+        action="store_true",
+        help="start workers with WARM_UP=false, so no client is created up front",
+    )
+    parser.add_argument("--timeout", type=float, default=120)
+    return parser.parse_args()
+
+
+def app_environ(**extra):
+    env = dict(os.environ)
+    env.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="bench-startup-"))
+    # The Gemini client refuses to start without a key; it is never used.
+    env.setdefault("GOOGLE_API_KEY", "bench")
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [os.getcwd(), env.get("PYTHONPATH")])
+    )
+    env.update(extra)
+    return env
+
+
+def measure_imports(repeat):
+    print(f"{'import (fresh interpreter)':<28}{'seconds':>10}{'RSS MiB':>10}")
+    for name, statement in (("python", "pass"),) + IMPORTS:
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", PROBE.format(statement=statement)],
+                capture_output=True,
+                text=True,
+                env=app_environ(WARM_UP="False"),
+                check=True,
+            ).stdout.split()
+            runs.append((float(output[0]), int(output[1]) / 1024))
+        seconds = min(elapsed for elapsed, _ in runs)
+        rss = min(rss for _, rss in runs)
+        print(f"{name:<28}{seconds:>10.3f}{rss:>10.1f}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def memory(pid):
+    """
+    Returns the RSS, PSS and USS of a process in MiB.
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    uss = values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    return values.get("Rss", 0), values.get("Pss", 0), uss
+
+
+def responds(url):
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def measure_gunicorn(workers, preload, warm_up, timeout):
+    port = free_port()
+    env = app_environ(
+        PRELOAD_APP=str(preload),
+        WARM_UP=str(warm_up),
+        JOB_WORKERS="1",
+    )
+    started = time.perf_counter()
+    master = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "gunicorn.conf.py",
+            "-w",
+            str(workers),
+            "-b",
+            f"127.0.0.1:{port}",
+            "run:app",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        deadline = started + timeout
+        while len(children(master.pid)) < workers or not responds(
+            f"http://127.0.0.1:{port}/"
+        ):
+            if master.poll() is not None or time.perf_counter() > deadline:
+                raise Exception(f"gunicorn did not start: {master.stderr.read()}")
+            time.sleep(0.05)
+        # A sync worker only accepts connections once it has loaded (or, with
+        # preload, inherited) the app, so keep going until all have answered.
+        for _ in range(workers * 4):
+            responds(f"http://127.0.0.1:{port}/")
+        ready = time.perf_counter() - started
+        time.sleep(1)
+        master_memory = memory(master.pid)
+        worker_memory = [memory(pid) for pid in children(master.pid)]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        try:
+            master.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            master.kill()
+    return ready, master_memory, worker_memory
+
+
+def main():
+    args = parse_args()
+    measure_imports(args.repeat)
+
+    warm_up = not args.no_warm_up
+    print(
+        f"\ngunicorn, {args.workers} workers, WARM_UP={warm_up}"
+        f"\n{'mode':<14}{'ready s':>9}{'process':>10}"
+        f"{'RSS MiB':>10}{'PSS MiB':>10}{'USS MiB':>10}"
+    )
+    for preload in (False, True):
+        mode = "preload" if preload else "per-worker"
+        ready, master_memory, worker_memory = measure_gunicorn(
+            args.workers, preload, warm_up, args.timeout
+        )
+        rows = [("master", master_memory)] + [
+            (f"worker {index}", values)
+            for index, values in enumerate(worker_memory, 1)
+        ]
+        for index, (name, (rss, pss, uss)) in enumerate(rows):
+            label = (mode, f"{ready:.2f}") if index == 0 else ("", "")
+            print(
+                f"{label[0]:<14}{label[1]:>9}{name:>10}"
+                f"{rss:>10.1f}{pss:>10.1f}{uss:>10.1f}"
+            )
+        total_pss = sum(pss for _, (_, pss, _) in rows)
+        print(f"{'':<14}{'':>9}{'total':>10}{'':>10}{total_pss:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
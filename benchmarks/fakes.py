@@ -0,0 +1,466 @@
+"""
+Local stand-ins for every external service the pipeline talks to.
+
+HTTP services (AnkiConnect, Portainer, romaji2kana) run as real local servers,
+so the app's sessions, timeouts and retries are exercised. Gemini, Google
+Translate and gTTS are replaced in-process by fakes with the same interface as
+the clients the app uses. Every fake sleeps for a configurable latency, fails
+with a configurable probability and records how long each call took.
+"""
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class ServiceProfile:
+    """
+    Latency (seconds, +/- jitter as a fraction), error rate and quota (calls
+    per minute, 0 for none) of a service.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.2
+    error_rate: float = 0.0
+    quota: float = 0.0
+    _calls: deque = field(default_factory=deque, repr=False, compare=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False
+    )
+
+    def sample(self):
+        spread = self.latency * self.jitter
+        return max(0.0, random.uniform(self.latency - spread, self.latency + spread))
+
+    def fails(self):
+        return random.random() < self.error_rate
+
+    def throttle(self, stage):
+        """
+        Raises a 429 if the quota of the last minute is used up.
+        """
+        if not self.quota:
+            return
+        now = time.monotonic()
+        with self._lock:
+            while self._calls and now - self._calls[0] >= 60:
+                self._calls.popleft()
+            if len(self._calls) >= self.quota:
+                retry_after = 60 - (now - self._calls[0])
+                raise FakeRateLimitError(stage, retry_after)
+            self._calls.append(now)
+
+
+DEFAULT_PROFILES = {
+    "gemini": ServiceProfile(latency=1.2),
+    "translate": ServiceProfile(latency=0.3),
+    "tts": ServiceProfile(latency=0.8),
+    "romaji2kana": ServiceProfile(latency=0.3),
+    "portainer": ServiceProfile(latency=0.05),
+    "ankiconnect": ServiceProfile(latency=0.05),
+    "ankiconnect_sync": ServiceProfile(latency=2.0),
+}
+
+
+class StageRecorder:
+    """
+    Thread-safe store of (duration, failed) samples per stage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+
+    def record(self, stage, duration, failed=False):
+        with self._lock:
+            self.samples[stage].append((duration, failed))
+
+    def simulate(self, stage, profile):
+        """
+        Sleeps for one latency sample and raises if the call should fail.
+        """
+        try:
+            profile.throttle(stage)
+        except FakeRateLimitError:
+            self.record(f"{stage}:429", 0.0, True)
+            raise
+        duration = profile.sample()
+        time.sleep(duration)
+        failed = profile.fails()
+        self.record(stage, duration, failed)
+        if failed:
+            raise FakeServiceError(f"{stage}: simulated failure")
+
+
+class FakeServiceError(Exception):
+    pass
+
+
+class FakeRateLimitError(FakeServiceError):
+    """
+    A 429 carrying its Retry-After the way the real clients expose it.
+    """
+
+    code = 429
+
+    def __init__(self, stage, retry_after):
+        super().__init__(f"{stage}: 429 RESOURCE_EXHAUSTED")
+        self.response = _FakeResponse("")
+        self.response.status_code = 429
+        self.response.headers = {"Retry-After": f"{retry_after:.1f}"}
+
+
+# === In-process fakes ===
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeModels:
+    def __init__(self, recorder, profile):
+        self.recorder = recorder
+        self.profile = profile
+
+    def generate_content(self, model, contents, config=None):
+        self.recorder.simulate("gemini", self.profile)
+        return _FakeResponse(_generate(contents, config))
+
+
+class _FakeAsyncModels(_FakeModels):
+    async def generate_content(self, model, contents, config=None):
+        try:
+            self.profile.throttle("gemini")
+        except FakeRateLimitError:
+            self.recorder.record("gemini:429", 0.0, True)
+            raise
+        duration = self.profile.sample()
+        await asyncio.sleep(duration)
+        failed = self.profile.fails()
+        self.recorder.record("gemini", duration, failed)
+        if failed:
+            raise FakeServiceError("gemini: simulated failure")
+        return _FakeResponse(_generate(contents, config))
+
+
+def _generate(contents, config):
+    """
+    Returns the text Gemini would answer to one of the app's prompts.
+    """
+    if getattr(config, "response_schema", None) is not None:
+        batch = re.search(r"these words: (\[.*?\])\.", contents)
+        if batch:
+            words = json.loads(batch.group(1))
+            return json.dumps([dict(_card(word), word=word) for word in words])
+        word = re.search(r"for the word '(.*?)'", contents).group(1)
+        return json.dumps(_card(word))
+
+    word = re.search(r"word '(.*?)'", contents).group(1)
+    if contents.startswith("Write EXACTLY ONE"):
+        card = _card(word)
+        return f"{card['sentence']} ({card['romaji']}) - {card['translation']}"
+    if contents.startswith("Give a short definition"):
+        return f"A word used for {word}."
+    return f"This is a sentence with {word}."
+
+
+def _card(word):
+    return {
+        "sentence": f"{word}が好きです。",
+        "romaji": "Kore ga suki desu.",
+        "translation": f"I like {word}.",
+        "definition": f"A word used for {word}.",
+    }
+
+
+class _FakeAsyncClient:
+    def __init__(self, recorder, profile):
+        self.models = _FakeAsyncModels(recorder, profile)
+
+
+class FakeGenaiClient:
+    def __init__(self, recorder, profile):
+        self.models = _FakeModels(recorder, profile)
+        self.aio = _FakeAsyncClient(recorder, profile)
+
+
+class _Translated:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeTranslator:
+    def __init__(self, recorder, profile):
+        self.recorder = recorder
+        self.profile = profile
+
+    async def translate(self, text, src="auto", dest="en"):
+        duration = self.profile.sample()
+        await asyncio.sleep(duration)
+        failed = self.profile.fails()
+        self.recorder.record("translate", duration, failed)
+        if failed:
+            raise FakeServiceError("translate: simulated failure")
+        if isinstance(text, list):
+            return [_Translated(f"{dest}:{item}") for item in text]
+        return _Translated(f"{dest}:{text}")
+
+
+def make_fake_gtts(recorder, profile):
+    class FakeGTTS:
+        def __init__(self, text, lang="en", **kwargs):
+            self.text = text
+
+        def write_to_fp(self, fp):
+            recorder.simulate("tts", profile)
+            fp.write(b"ID3" + self.text.encode("utf-8") * 64)
+
+    return FakeGTTS
+
+
+# === Local HTTP servers ===
+
+
+def _json_handler(respond):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            status, payload = respond(self.command, self.path, body)
+            data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = _handle
+        do_POST = _handle
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class FakeServer:
+    """
+    Runs a JSON HTTP server on a free local port in a background thread.
+    """
+
+    def __init__(self, respond):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _json_handler(respond))
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+class FakeAnkiConnect:
+    def __init__(self, recorder, profile, sync_profile):
+        self.recorder = recorder
+        self.profile = profile
+        self.sync_profile = sync_profile
+        self.notes = {}
+        self.lock = threading.Lock()
+        self.server = FakeServer(self.respond)
+        self.url = self.server.url
+
+    def _front(self, note):
+        return note["fields"]["Front"]
+
+    def _add(self, note):
+        with self.lock:
+            if any(self._front(n) == self._front(note) for n in self.notes.values()):
+                raise FakeServiceError("cannot create note because it is a duplicate")
+            note_id = int(time.time() * 1000) * 1000 + len(self.notes)
+            self.notes[note_id] = note
+            return note_id
+
+    def _store_media(self, params):
+        # Like Anki, fetch files passed by URL or path so that media transfer
+        # modes are exercised for real.
+        try:
+            if "url" in params:
+                with urllib.request.urlopen(params["url"], timeout=5) as response:
+                    response.read()
+            elif "path" in params:
+                with open(params["path"], "rb") as f:
+                    f.read()
+        except OSError as e:
+            raise FakeServiceError(f"could not fetch {params['filename']}: {e}")
+        return params["filename"]
+
+    def run(self, action, params):
+        if action == "multi":
+            results = []
+            for item in params["actions"]:
+                try:
+                    result = self.run(item["action"], item.get("params", {}))
+                    results.append({"result": result, "error": None})
+                except FakeServiceError as e:
+                    results.append({"result": None, "error": str(e)})
+            return results
+
+        profile = self.sync_profile if action == "sync" else self.profile
+        self.recorder.simulate(f"ankiconnect:{action}", profile)
+        if action == "version":
+            return 6
+        if action == "addNote":
+            return self._add(params["note"])
+        if action == "addNotes":
+            ids = []
+            for note in params["notes"]:
+                try:
+                    ids.append(self._add(note))
+                except FakeServiceError:
+                    ids.append(None)
+            return ids
+        if action == "canAddNotesWithErrorDetail":
+            fronts = {self._front(n) for n in self.notes.values()}
+            return [
+                {"canAdd": True}
+                if self._front(n) not in fronts
+                else {"canAdd": False, "error": "duplicate"}
+                for n in params["notes"]
+            ]
+        if action == "storeMediaFile":
+            return self._store_media(params)
+        if action == "findNotes":
+            # Only the `-"tag:..."` terms of the refresh search are understood;
+            # a note is left out if it has all of them.
+            excluded = set(re.findall(r'-"tag:([^"]+)"', params.get("query", "")))
+            return [
+                note_id
+                for note_id, note in self.notes.items()
+                if not excluded or not excluded <= set(note.get("tags", []))
+            ]
+        if action == "notesInfo":
+            return [
+                {
+                    "noteId": note_id,
+                    "tags": list(note.get("tags", [])),
+                    "fields": {
+                        name: {"value": value} for name, value in note["fields"].items()
+                    },
+                }
+                for note_id, note in self.notes.items()
+                if note_id in set(params["notes"])
+            ]
+        if action == "updateNoteFields":
+            with self.lock:
+                note = self.notes[params["note"]["id"]]
+                note["fields"].update(params["note"]["fields"])
+            return None
+        if action in ("addTags", "removeTags"):
+            with self.lock:
+                for note_id in params["notes"]:
+                    tags = self.notes[note_id].setdefault("tags", [])
+                    for tag in params["tags"].split():
+                        if action == "addTags" and tag not in tags:
+                            tags.append(tag)
+                        elif action == "removeTags" and tag in tags:
+                            tags.remove(tag)
+            return None
+        return None
+
+    def respond(self, method, path, body):
+        request = json.loads(body or b"{}")
+        try:
+            result = self.run(request.get("action"), request.get("params", {}))
+            return 200, {"result": result, "error": None}
+        except FakeServiceError as e:
+            return 200, {"result": None, "error": str(e)}
+
+
+class FakePortainer:
+    def __init__(self, recorder, profile):
+        self.recorder = recorder
+        self.profile = profile
+        self.server = FakeServer(self.respond)
+        self.url = self.server.url
+
+    def respond(self, method, path, body):
+        try:
+            self.recorder.simulate("portainer", self.profile)
+        except FakeServiceError:
+            return 500, {"message": "simulated failure"}
+        if path == "/api/auth":
+            # A JWT whose payload is {"exp": 4102444800} (year 2100).
+            return 200, {"jwt": "e30.eyJleHAiOiA0MTAyNDQ0ODAwfQ.sig"}
+        if path.endswith("/json"):
+            return 200, {"State": {"Status": "running"}}
+        return 304, None
+
+
+class FakeRomaji2Kana:
+    def __init__(self, recorder, profile):
+        self.recorder = recorder
+        self.profile = profile
+        self.server = FakeServer(self.respond)
+        self.url = self.server.url
+
+    def respond(self, method, path, body):
+        try:
+            self.recorder.simulate("romaji2kana", self.profile)
+        except FakeServiceError:
+            return 500, {"message": "simulated failure"}
+        query = parse_qs(urlparse(path).query).get("q", [""])[0]
+        return 200, {"a": f"かな {query}"}
+
+
+class FakeEnvironment:
+    """
+    Starts every fake and returns the environment variables that point the app
+    at them. Call `install()` after the app modules are imported to swap in
+    the in-process fakes.
+    """
+
+    def __init__(self, profiles=None):
+        self.profiles = dict(DEFAULT_PROFILES, **(profiles or {}))
+        self.recorder = StageRecorder()
+        self.anki = FakeAnkiConnect(
+            self.recorder,
+            self.profiles["ankiconnect"],
+            self.profiles["ankiconnect_sync"],
+        )
+        self.portainer = FakePortainer(self.recorder, self.profiles["portainer"])
+        self.romaji2kana = FakeRomaji2Kana(self.recorder, self.profiles["romaji2kana"])
+
+    def environ(self):
+        return {
+            "ANKICONNECT_URL": self.anki.url,
+            "PORTAINER_URL": self.portainer.url,
+            "PORTAINER_CONTAINER_ID": "anki",
+            "ROMAJI2KANA_URL": self.romaji2kana.url,
+            "GOOGLE_API_KEY": "benchmark",
+        }
+
+    def install(self):
+        from app.utils import async_pipeline, utils
+
+        genai_client = FakeGenaiClient(self.recorder, self.profiles["gemini"])
+        translator = FakeTranslator(self.recorder, self.profiles["translate"])
+        utils.get_genai_client = lambda: genai_client
+        async_pipeline.get_async_genai_client = lambda: genai_client.aio
+        utils.get_translator = lambda: translator
+        fake_gtts = make_fake_gtts(self.recorder, self.profiles["tts"])
+        utils.get_gtts = lambda: fake_gtts
+
+    def stop(self):
+        for fake in (self.anki, self.portainer, self.romaji2kana):
+            fake.server.stop()
@@ -0,0 +1,26 @@
+import gc
+import logging
+import os
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# With PRELOAD_APP=true the master imports the app, the client libraries and
+# pykakasi's dictionaries once, and the workers share those pages
+# copy-on-write instead of each loading their own copy.
+preload_app = os.getenv("PRELOAD_APP", "False").lower() == "true"
+
+
+def when_ready(server):
+    if preload_app:
+        # Keep the garbage collector from touching, and so copying, the
+        # preloaded objects in every worker.
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    from app import init_worker, start_background_workers
+
+    if preload_app:
+        init_worker()
+    start_background_workers()
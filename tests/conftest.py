@@ -0,0 +1,27 @@
+import pytest
+
+from app.utils import (
+    cache,
+    circuit_breaker,
+    duplicates,
+    jobs,
+    rate_limit,
+    single_flight,
+    sync_scheduler,
+)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """
+    Gives every test its own SQLite databases.
+    """
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache._local, "connections", None, raising=False)
+    monkeypatch.setattr(circuit_breaker, "_schema_pid", None)
+    monkeypatch.setattr(duplicates, "_schema_pid", None)
+    monkeypatch.setattr(jobs, "_schema_pid", None)
+    monkeypatch.setattr(rate_limit, "_schema_pid", None)
+    monkeypatch.setattr(single_flight, "_schema_pid", None)
+    monkeypatch.setattr(sync_scheduler, "_schema_pid", None)
+    return tmp_path
@@ -0,0 +1,138 @@
+import pytest
+
+from app.utils import utils
+
+
+class FakeAnkiConnect:
+    """
+    Answers the `multi` requests of `addnotes`.
+    """
+
+    def __init__(self, can_add, added, add_one=None):
+        self.can_add = can_add
+        self.added = added
+        self.add_one = add_one or {}
+        self.requests = []
+
+    def __call__(self, ankiconnect_url, action, **params):
+        assert action == "multi"
+        self.requests.append([item["action"] for item in params["actions"]])
+        return [self.respond(item) for item in params["actions"]]
+
+    def respond(self, item):
+        if item["action"] == "storeMediaFile":
+            return {"result": item["params"]["filename"], "error": None}
+        if item["action"] == "canAddNotesWithErrorDetail":
+            return {"result": self.can_add, "error": None}
+        if item["action"] == "addNotes":
+            return self.added
+        front = item["params"]["note"]["fields"]["Front"]
+        return self.add_one[front]
+
+
+def fake_build(deck_name, word, fresh=False, progress=None, preflight=None):
+    if word == "broken":
+        raise Exception("Gemini answered 500")
+    note = {"deckName": deck_name, "fields": {"Front": word, "Back": "-"}}
+    return note, {f"{word}.mp3": f"key-{word}"}
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    syncs = []
+    monkeypatch.setattr(utils, "ensure_anki_available", lambda url: None)
+    monkeypatch.setattr(utils, "prefetch_card_content", lambda *args, **kw: set())
+    monkeypatch.setattr(utils, "build_note", fake_build)
+    monkeypatch.setattr(utils, "build_note_english", fake_build)
+    monkeypatch.setattr(utils, "transfer_mode", lambda: "path")
+    monkeypatch.setattr(utils, "request_sync", syncs.append)
+
+    def run(anki, words):
+        monkeypatch.setattr(utils, "invoke_ankiconnect", anki)
+        entries = [{"word": word, "deck": "japanese"} for word in words]
+        stages = []
+        return utils.addnotes("http://anki.test", entries, progress=stages.append), {
+            "syncs": syncs,
+            "stages": stages,
+        }
+
+    return run
+
+
+def test_adds_every_note_in_one_multi(batch):
+    anki = FakeAnkiConnect(
+        can_add=[{"canAdd": True}, {"canAdd": True}],
+        added={"result": [11, 12], "error": None},
+    )
+    results, seen = batch(anki, ["猫", "犬", "猫"])
+
+    assert [(r["word"], r["status"]) for r in results] == [
+        ("猫", "added"),
+        ("犬", "added"),
+        ("猫", "error"),
+    ]
+    assert results[1]["note_id"] == 12
+    assert results[2]["error"] == "Repeated word in the batch"
+    assert anki.requests == [
+        [
+            "storeMediaFile",
+            "storeMediaFile",
+            "canAddNotesWithErrorDetail",
+            "addNotes",
+        ]
+    ]
+    assert seen["syncs"] == ["http://anki.test"]
+    assert seen["stages"] == ["building 1/2", "building 2/2", "anki"]
+
+
+def test_failed_addnotes_falls_back_to_one_by_one(batch):
+    anki = FakeAnkiConnect(
+        can_add=[
+            {"canAdd": True},
+            {"canAdd": False, "error": "cannot create note because it is a duplicate"},
+            {"canAdd": True},
+        ],
+        added={"result": None, "error": "cannot create note because it is a duplicate"},
+        add_one={
+            "猫": {"result": 21, "error": None},
+            "鳥": {"result": None, "error": "collection is not available"},
+        },
+    )
+    results, seen = batch(anki, ["猫", "犬", "鳥"])
+
+    assert anki.requests[1] == ["addNote", "addNote"]
+    assert results[0]["status"] == "added"
+    assert results[0]["note_id"] == 21
+    assert results[1] == {
+        "word": "犬",
+        "value": "japanese",
+        "status": "error",
+        "error": "cannot create note because it is a duplicate",
+    }
+    assert results[2]["error"] == "collection is not available"
+    assert seen["syncs"] == ["http://anki.test"]
+
+
+def test_nothing_added_schedules_no_sync(batch):
+    anki = FakeAnkiConnect(
+        can_add=[{"canAdd": False, "error": "model was not found"}],
+        added={"result": None, "error": "model was not found"},
+    )
+    results, seen = batch(anki, ["猫", "broken"])
+
+    assert results[0]["error"] == "model was not found"
+    assert results[1]["error"] == "Gemini answered 500"
+    assert len(anki.requests) == 1
+    assert seen["syncs"] == []
+
+
+def test_null_ids_in_addnotes_result_are_errors(batch):
+    anki = FakeAnkiConnect(
+        can_add=[{"canAdd": True}, {"canAdd": False, "error": "empty front"}],
+        added={"result": [31, None], "error": None},
+    )
+    results, _ = batch(anki, ["猫", "犬"])
+
+    assert results[0]["status"] == "added"
+    assert results[1]["status"] == "error"
+    assert results[1]["error"] == "empty front"
@@ -0,0 +1,56 @@
+import time
+
+from app.utils import cache
+from app.utils.cache import SQLiteCache
+
+
+def test_get_returns_what_was_set():
+    store = SQLiteCache("sentences", ttl=60, max_entries=10)
+    assert store.get("gemini", "猫") is None
+    store.set({"sentence": "猫がいる"}, "gemini", "猫")
+    assert store.get("gemini", "猫") == {"sentence": "猫がいる"}
+    store.delete("gemini", "猫")
+    assert store.get("gemini", "猫") is None
+
+
+def test_expired_entries_are_misses_and_evicted(monkeypatch):
+    store = SQLiteCache("sentences", ttl=60, max_entries=10)
+    clock = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: clock[0])
+    store.set("old", "猫")
+    clock[0] += 30
+    store.set("new", "犬")
+
+    clock[0] += 31
+    assert store.get("猫") is None
+    store.evict()
+    rows = store._connection().execute('SELECT key FROM "sentences"').fetchall()
+    assert rows == [(store.make_key("犬"),)]
+    assert store.get("犬") == "new"
+
+
+def test_evicts_least_recently_used(monkeypatch):
+    store = SQLiteCache("sentences", ttl=0, max_entries=2)
+    clock = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: clock[0])
+    for word in ("a", "b", "c"):
+        clock[0] += 1
+        store.set(word.upper(), word)
+    clock[0] += 1
+    assert store.get("a") == "A"
+
+    store.evict()
+    assert store.get("b") is None
+    assert store.get("a") == "A"
+    assert store.get("c") == "C"
+
+
+def test_tables_follow_cache_dir(tmp_path, monkeypatch):
+    store = SQLiteCache("sentences", ttl=60, max_entries=10)
+    store.set("first", "猫")
+
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path / "other"))
+    monkeypatch.setattr(cache._local, "connections", None)
+    assert store.get("猫") is None
+    store.set("second", "猫")
+    assert store.get("猫") == "second"
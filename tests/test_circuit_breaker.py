@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from app.utils import circuit_breaker
+from app.utils.circuit_breaker import (
+    AnkiUnavailableError,
+    breaker_status,
+    check_breaker,
+    ensure_anki_available,
+    record_failure,
+)
+
+URL = "http://anki.test:8765"
+
+
+class FakeAnkiConnect:
+    """
+    Stands in for `http_request` and counts the `version` probes.
+    """
+
+    def __init__(self):
+        self.up = True
+        self.calls = 0
+        self.delay = 0
+
+    def __call__(self, service, method, url, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        if not self.up:
+            raise requests.ConnectionError("Connection refused")
+        return self
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"result": 6, "error": None}
+
+
+@pytest.fixture
+def anki(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "ANKI_BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(circuit_breaker, "ANKI_BREAKER_COOLDOWN", 30)
+    monkeypatch.setattr(circuit_breaker, "ANKI_HEALTH_TTL", 10)
+    fake = FakeAnkiConnect()
+    monkeypatch.setattr(circuit_breaker, "http_request", fake)
+    return fake
+
+
+def expire_cooldown(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "ANKI_BREAKER_COOLDOWN", 0)
+
+
+def test_opens_after_threshold(anki):
+    error = requests.ConnectionError("Connection refused")
+    record_failure(URL, error)
+    check_breaker(URL)
+
+    record_failure(URL, error)
+    with pytest.raises(AnkiUnavailableError) as excinfo:
+        ensure_anki_available(URL)
+    assert 0 < excinfo.value.retry_after <= 30
+    assert breaker_status(URL)["state"] == "open"
+    assert anki.calls == 0
+
+
+def test_half_open_probe_closes(anki, monkeypatch):
+    anki.up = False
+    with pytest.raises(AnkiUnavailableError):
+        ensure_anki_available(URL)
+    record_failure(URL, requests.ConnectionError("Connection refused"))
+    assert breaker_status(URL)["state"] == "open"
+
+    expire_cooldown(monkeypatch)
+    anki.up = True
+    ensure_anki_available(URL)
+    assert breaker_status(URL)["state"] == "closed"
+    assert breaker_status(URL)["failures"] == 0
+
+
+def test_failed_half_open_probe_reopens(anki, monkeypatch):
+    anki.up = False
+    for _ in range(2):
+        record_failure(URL, requests.ConnectionError("Connection refused"))
+    monkeypatch.setattr(circuit_breaker, "ANKI_BREAKER_COOLDOWN", 0.2)
+    time.sleep(0.2)
+
+    with pytest.raises(AnkiUnavailableError) as excinfo:
+        ensure_anki_available(URL)
+    assert excinfo.value.retry_after > 0
+    assert breaker_status(URL)["state"] == "open"
+    assert anki.calls == 1
+
+
+def test_half_open_lets_one_probe_through(anki, monkeypatch):
+    for _ in range(2):
+        record_failure(URL, requests.ConnectionError("Connection refused"))
+    expire_cooldown(monkeypatch)
+
+    assert circuit_breaker._claim_probe(URL)
+    assert breaker_status(URL)["state"] == "half_open"
+    monkeypatch.setattr(circuit_breaker, "ANKI_BREAKER_COOLDOWN", 30)
+    assert not circuit_breaker._claim_probe(URL)
+    with pytest.raises(AnkiUnavailableError):
+        check_breaker(URL)
+
+
+def test_stale_health_is_probed_once(anki):
+    anki.delay = 0.2
+    errors = []
+
+    def call():
+        try:
+            ensure_anki_available(URL)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert anki.calls == 1
@@ -0,0 +1,68 @@
+import json
+
+from app.utils import importer
+
+
+def write_words(tmp_path, words):
+    path = tmp_path / "words.txt"
+    path.write_text("\n".join(words) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_resumes_after_partial_import(tmp_path, monkeypatch):
+    path = write_words(tmp_path, ["a", "b", "c", "d", "e", "f"])
+    calls = []
+
+    def rate_limited(ankiconnect_url, deck, word, fresh):
+        calls.append(word)
+        if word in ("c", "d"):
+            raise Exception("429 Too Many Requests")
+
+    monkeypatch.setattr(importer, "addnote", rate_limited)
+    counts = importer.import_words(
+        "http://anki.test", path, concurrency=1, max_consecutive_failures=2
+    )
+    assert counts == {
+        "added": 2,
+        "duplicate": 0,
+        "failed": 2,
+        "resumed": 0,
+        "stopped": True,
+    }
+    assert calls == ["a", "b", "c", "d"]
+    with open(f"{path}.checkpoint", encoding="utf-8") as f:
+        assert json.load(f) == {"position": 4, "done": [], "failed": [2, 3]}
+
+    calls.clear()
+    monkeypatch.setattr(
+        importer, "addnote", lambda url, deck, word, fresh: calls.append(word)
+    )
+    counts = importer.import_words("http://anki.test", path, concurrency=1)
+    assert counts["added"] == 4
+    assert counts["resumed"] == 2
+    assert not counts["stopped"]
+    assert calls == ["c", "d", "e", "f"]
+
+    calls.clear()
+    counts = importer.import_words("http://anki.test", path, concurrency=2)
+    assert counts["resumed"] == 6
+    assert calls == []
+
+
+def test_checkpoint_tracks_out_of_order_words(tmp_path):
+    path = str(tmp_path / "checkpoint")
+    checkpoint = importer.Checkpoint(path)
+    checkpoint.complete(2)
+    checkpoint.complete(0)
+    checkpoint.complete(3, failed=True)
+    assert checkpoint.position == 1
+
+    checkpoint = importer.Checkpoint(path)
+    assert checkpoint.done == {2, 3}
+    assert [checkpoint.is_done(index) for index in range(5)] == [
+        True,
+        False,
+        True,
+        False,
+        False,
+    ]
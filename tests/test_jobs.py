@@ -0,0 +1,103 @@
+import pytest
+
+from app.utils import jobs
+from app.utils.metrics import span
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Stops the job workers from starting and lets tests move time forward.
+    """
+    now = [1000.0]
+    monkeypatch.setattr(jobs, "start_job_workers", lambda: None)
+    monkeypatch.setattr(jobs.time, "time", lambda: now[0])
+    monkeypatch.setattr(jobs, "JOB_LEASE_SECONDS", 60)
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    return now
+
+
+def test_running_job_is_not_claimed_twice(clock):
+    job_id = jobs.enqueue_job("addnote", {"word": "猫"})
+
+    assert jobs._claim_job() == (job_id, "addnote", {"word": "猫"})
+    assert jobs._claim_job() is None
+    job = jobs.get_job(job_id)
+    assert job["status"] == "running"
+    assert job["attempts"] == 1
+
+
+def test_expired_lease_is_retried_then_failed(clock):
+    job_id = jobs.enqueue_job("addnote", {"word": "猫"})
+    jobs._claim_job()
+
+    clock[0] += 61
+    assert jobs._claim_job() == (job_id, "addnote", {"word": "猫"})
+    assert jobs.get_job(job_id)["attempts"] == 2
+
+    clock[0] += 61
+    assert jobs._claim_job() is None
+    job = jobs.get_job(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Job was interrupted too many times"
+
+
+def test_progress_renews_the_lease(clock, monkeypatch):
+    def handler(payload, progress):
+        clock[0] += 50
+        progress("generation")
+        clock[0] += 50
+        assert jobs._claim_job() is None
+        return {"word": payload["word"]}
+
+    monkeypatch.setitem(jobs._handlers, "test", handler)
+    job_id = jobs.enqueue_job("test", {"word": "猫"})
+    jobs._run_job(*jobs._claim_job())
+
+    job = jobs.get_job(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"word": "猫"}
+
+
+def test_failed_handler_fails_the_job(clock, monkeypatch):
+    def handler(payload, progress):
+        raise Exception("Gemini answered 500")
+
+    monkeypatch.setitem(jobs._handlers, "test", handler)
+    job_id = jobs.enqueue_job("test", {})
+    jobs._run_job(*jobs._claim_job())
+
+    job = jobs.get_job(job_id)
+    assert (job["status"], job["stage"], job["error"]) == (
+        "failed",
+        "failed",
+        "Gemini answered 500",
+    )
+    assert jobs._claim_job() is None
+
+
+def test_jobs_are_claimed_oldest_first(clock):
+    first = jobs.enqueue_job("addnote", {"word": "猫"})
+    clock[0] += 1
+    second = jobs.enqueue_job("addnote", {"word": "犬"})
+
+    assert jobs._claim_job()[0] == first
+    assert jobs._claim_job()[0] == second
+
+
+def test_finished_job_keeps_its_stage_timings(clock, monkeypatch):
+    def handler(payload, progress):
+        with span("generation"):
+            pass
+        return {}
+
+    monkeypatch.setitem(jobs._handlers, "test", handler)
+    job_id = jobs.enqueue_job("test", {})
+    assert jobs.get_job(job_id)["timings"] is None
+    jobs._run_job(*jobs._claim_job())
+
+    timings = jobs.get_job(job_id)["timings"]
+    assert [entry.split(";")[0] for entry in timings.split(", ")] == [
+        "generation",
+        "total",
+    ]
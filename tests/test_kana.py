@@ -0,0 +1,32 @@
+import pytest
+
+from app.utils.kana import romaji_to_hiragana
+from benchmarks.bench_kana import CORPUS
+
+
+@pytest.mark.parametrize(
+    "romaji, expected", [(romaji, kana) for _, romaji, kana in CORPUS], ids=str
+)
+def test_matches_corpus(romaji, expected):
+    assert romaji_to_hiragana(romaji) == expected
+
+
+@pytest.mark.parametrize(
+    "romaji, expected",
+    [
+        ("Kon'nichiwa", "こんにちわ"),
+        ("kin'en", "きんえん"),
+        ("kinen", "きねん"),
+        ("Kitte", "きって"),
+        ("Kôhî", "こうひい"),
+        ("Sushi wo tabemasu!", "すしをたべます！"),
+        ("Wa", "わ"),
+    ],
+)
+def test_spelling_rules(romaji, expected):
+    assert romaji_to_hiragana(romaji) == expected
+
+
+def test_rejects_text_that_is_not_romaji():
+    with pytest.raises(ValueError):
+        romaji_to_hiragana("Watashi wa xq desu.")
@@ -0,0 +1,81 @@
+import hashlib
+import hmac
+import os
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from app.utils import media
+
+KEY = hashlib.sha256(b"neko.mp3").hexdigest()
+
+
+@pytest.fixture(autouse=True)
+def secret(tmp_path, monkeypatch):
+    """
+    Generates the signing key in the test's own directory.
+    """
+    monkeypatch.delenv("MEDIA_TOKEN_SECRET", raising=False)
+    monkeypatch.setattr(media, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(media, "_secret", None)
+    monkeypatch.setattr(media, "MEDIA_TOKEN_TTL", 300)
+
+
+def signed(key):
+    url = urlparse(media.media_url(key))
+    query = parse_qs(url.query)
+    return url.path, query["expires"][0], query["token"][0]
+
+
+def test_signed_url_verifies():
+    path, expires, token = signed(KEY)
+    assert path == f"/media/{KEY}.mp3"
+    assert media.verify_media_token(KEY, expires, token)
+
+
+def test_tampered_requests_are_rejected():
+    _, expires, token = signed(KEY)
+    other = hashlib.sha256(b"inu.mp3").hexdigest()
+    assert not media.verify_media_token(other, expires, token)
+    assert not media.verify_media_token(KEY, str(int(expires) + 60), token)
+    flipped = token[:-1] + ("1" if token[-1] == "0" else "0")
+    assert not media.verify_media_token(KEY, expires, flipped)
+    assert not media.verify_media_token(KEY, expires, "")
+    assert not media.verify_media_token(KEY, "soon", token)
+    assert not media.verify_media_token("../media.key", expires, token)
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    _, expires, token = signed(KEY)
+    now = time.time()
+    monkeypatch.setattr(media.time, "time", lambda: now + 301)
+    assert not media.verify_media_token(KEY, expires, token)
+
+
+def test_secret_key_does_not_sign_tokens(monkeypatch):
+    monkeypatch.setenv("SECRET_KEY", "your-secret-key")
+    expires = int(time.time()) + 60
+    forged = hmac.new(
+        b"your-secret-key", f"{KEY}:{expires}".encode(), hashlib.sha256
+    ).hexdigest()
+    assert not media.verify_media_token(KEY, expires, forged)
+
+
+def test_generated_key_is_shared_and_private(tmp_path, monkeypatch):
+    _, expires, token = signed(KEY)
+    path = tmp_path / "cache" / "media.key"
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    # Another worker reads the same key.
+    monkeypatch.setattr(media, "_secret", None)
+    assert media.verify_media_token(KEY, expires, token)
+
+
+def test_configured_secret_is_used(monkeypatch):
+    monkeypatch.setenv("MEDIA_TOKEN_SECRET", "s3cret")
+    _, expires, token = signed(KEY)
+    expected = hmac.new(
+        b"s3cret", f"{KEY}:{expires}".encode(), hashlib.sha256
+    ).hexdigest()
+    assert token == expected
@@ -0,0 +1,83 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.utils import audio_cache, duplicates, previews, utils
+
+
+@pytest.fixture
+def tts(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_cache, "AUDIO_CACHE_DIR", str(tmp_path / "audio"))
+    spoken = []
+
+    def text_to_speech(text, lang):
+        spoken.append(text)
+        return f"{lang}:{text}".encode("utf-8")
+
+    monkeypatch.setattr(utils, "_text_to_speech", text_to_speech)
+    return spoken
+
+
+def build(deck_name, word, fresh=False, progress=None, preflight=None):
+    build.calls += 1
+    if preflight:
+        preflight(word)
+    # Like build_note, a clip is synthesized in another thread.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        word_audio = executor.submit(
+            contextvars.copy_context().run, utils.synthesize_audio, word, "ja"
+        )
+    sentence_audio = utils.synthesize_audio(f"{word}です", "ja")
+    note = {"deckName": deck_name, "fields": {"Front": word, "Back": "-"}}
+    return note, {
+        f"{word}.mp3": word_audio.result(),
+        f"{word}_sentence.mp3": sentence_audio,
+    }
+
+
+@pytest.fixture(autouse=True)
+def reset_build():
+    build.calls = 0
+
+
+def test_preview_is_reused(tts):
+    note, media = previews.cached_build(build, "Japanese", "猫")
+    assert previews.cached_build(build, "Japanese", "猫") == (note, media)
+    assert build.calls == 1
+    assert tts == ["猫", "猫です"]
+
+
+def test_evicted_clips_are_synthesized_again(tts):
+    _, media = previews.cached_build(build, "Japanese", "猫")
+    os.remove(audio_cache.audio_path(media["猫_sentence.mp3"]))
+
+    _, reused = previews.cached_build(build, "Japanese", "猫")
+
+    assert build.calls == 1
+    assert reused == media
+    assert tts == ["猫", "猫です", "猫です"]
+    assert all(os.path.exists(audio_cache.audio_path(key)) for key in media.values())
+
+
+def test_preview_without_sources_is_not_reused(tts):
+    _, media = previews.cached_build(build, "Japanese", "猫")
+    cached = previews.preview_cache.get("Japanese", "猫")
+    del cached["sources"]
+    previews.preview_cache.set(cached, "Japanese", "猫")
+    os.remove(audio_cache.audio_path(media["猫.mp3"]))
+
+    assert previews._cached("Japanese", "猫") is None
+
+
+def test_local_duplicate_check_never_calls_anki(monkeypatch):
+    def refresh(ankiconnect_url, deck_name):
+        raise AssertionError("Anki was called")
+
+    monkeypatch.setattr(duplicates, "refresh_deck_index", refresh)
+    duplicates.record_note("Japanese", 1, "猫")
+
+    with pytest.raises(duplicates.DuplicateNoteError):
+        duplicates.ensure_not_duplicate(None, "Japanese", "猫", refresh=False)
+    duplicates.ensure_not_duplicate(None, "Japanese", "犬", refresh=False)
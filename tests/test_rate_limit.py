@@ -0,0 +1,151 @@
+import pytest
+import requests
+
+from app.utils import rate_limit
+from app.utils.rate_limit import RateLimitError, rate_limit_info
+
+
+class ClientError(Exception):
+    """
+    Shaped like google-genai's errors, which carry the status as `code`.
+    """
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class gTTSError(Exception):
+    """
+    Shaped like gTTS's error, which keeps the response as `rsp`.
+    """
+
+    def __init__(self, message, rsp):
+        super().__init__(message)
+        self.rsp = rsp
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(f"{status} Client Error", response=response)
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (ClientError(429, "RESOURCE_EXHAUSTED"), (True, None)),
+        (
+            ClientError(429, "{'retryDelay': '13s'}"),
+            (True, 13.0),
+        ),
+        (http_error(429, {"Retry-After": "7"}), (True, 7.0)),
+        (gTTSError("429 (Too Many Requests)", http_error(429).response), (True, None)),
+        (Exception("429 RESOURCE_EXHAUSTED"), (True, None)),
+        (Exception('{"error": {"code": 429}}'), (True, None)),
+        (Exception("Too Many Requests from this client"), (True, None)),
+        (ClientError(500, "Too Many Requests"), (False, None)),
+        (http_error(503), (False, None)),
+        (Exception("Could not add note 1742900429123"), (False, None)),
+        (Exception("'429 Street' is not a word"), (False, None)),
+    ],
+)
+def test_rate_limit_info(error, expected):
+    assert rate_limit_info(error) == expected
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr(rate_limit.time, "time", lambda: now[0])
+    monkeypatch.setattr(rate_limit.time, "sleep", sleep)
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: low)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_BURST", 5)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_BACKOFF_BASE", 1)
+    monkeypatch.setattr(rate_limit, "RATE_LIMITS", {"gemini": 60, "gtts": 0})
+    return now
+
+
+def test_bucket_allows_a_burst_then_the_rate(clock):
+    waits = [rate_limit.try_acquire("gemini") for _ in range(6)]
+    assert waits == [0, 0, 0, 0, 0, pytest.approx(1.0)]
+
+    clock[0] += 1
+    assert rate_limit.try_acquire("gemini") == 0
+    assert rate_limit.try_acquire("gemini") == pytest.approx(1.0)
+
+
+def test_429_halves_the_rate_and_honours_retry_after(clock):
+    for _ in range(5):
+        rate_limit.try_acquire("gemini")
+    rate_limit.report_throttled("gemini", retry_after=10)
+    assert rate_limit.try_acquire("gemini") == pytest.approx(10)
+
+    clock[0] += 10
+    assert [rate_limit.try_acquire("gemini") for _ in range(5)] == [0] * 5
+    # Half the rate, plus what it regained in 10 s.
+    rate = 0.5 + 1 * rate_limit.RATE_LIMIT_RECOVERY * 10
+    assert rate_limit.try_acquire("gemini") == pytest.approx(1 / rate)
+
+
+def test_no_limit_only_pauses_after_a_429(clock):
+    assert all(rate_limit.try_acquire("gtts") == 0 for _ in range(100))
+
+    rate_limit.report_throttled("gtts")
+    assert rate_limit.try_acquire("gtts") == pytest.approx(1)
+    clock[0] += 1
+    assert rate_limit.try_acquire("gtts") == 0
+
+    rate_limit.report_throttled("gtts", retry_after=30)
+    assert rate_limit.try_acquire("gtts") == pytest.approx(30)
+
+
+def test_limit_raised_from_zero_has_a_rate(clock, monkeypatch):
+    # A 429 while unlimited stores an empty bucket with no rate.
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_BACKOFF_BASE", 0)
+    monkeypatch.setattr(rate_limit, "RATE_LIMITS", {"gemini": 0})
+    rate_limit.report_throttled("gemini")
+
+    monkeypatch.setattr(rate_limit, "RATE_LIMITS", {"gemini": 60})
+    wait = rate_limit.try_acquire("gemini")
+    assert wait == pytest.approx(1 / rate_limit.RATE_LIMIT_MIN_FRACTION)
+
+
+def test_rate_limited_retries_429s(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMITS", {"gemini": 0})
+    answers = [ClientError(429, "RESOURCE_EXHAUSTED"), "猫がいる"]
+
+    def call():
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert rate_limit.rate_limited("gemini", call) == "猫がいる"
+
+
+def test_rate_limited_gives_up(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMITS", {"gemini": 0})
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_MAX_ATTEMPTS", 3)
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise ClientError(429, "RESOURCE_EXHAUSTED")
+
+    with pytest.raises(RateLimitError):
+        rate_limit.rate_limited("gemini", call)
+    assert len(calls) == 3
+
+
+def test_other_errors_are_not_retried(clock):
+    def call():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        rate_limit.rate_limited("gemini", call)
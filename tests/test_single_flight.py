@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+
+from app.utils import single_flight
+from app.utils.duplicates import DuplicateNoteError
+from app.utils.single_flight import flight_key
+
+KEY = flight_key("猫", "japanese")
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(single_flight, "SINGLE_FLIGHT", True)
+    monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_POLL_INTERVAL", 0.01)
+
+
+def run_in_thread(func):
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = func()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, outcome
+
+
+def test_leader_failure_is_shared_with_waiters():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def leader():
+        calls.append("leader")
+        started.set()
+        release.wait(5)
+        raise DuplicateNoteError("'猫' is already in the deck")
+
+    def waiter():
+        calls.append("waiter")
+
+    leader_thread, leader_outcome = run_in_thread(
+        lambda: single_flight.single_flight(
+            KEY, leader, shared_errors=(DuplicateNoteError,)
+        )
+    )
+    assert started.wait(5)
+
+    waiting = threading.Semaphore(0)
+    waiters = [
+        run_in_thread(
+            lambda: single_flight.single_flight(
+                KEY,
+                waiter,
+                shared_errors=(DuplicateNoteError,),
+                on_wait=waiting.release,
+            )
+        )
+        for _ in range(3)
+    ]
+    for _ in waiters:
+        assert waiting.acquire(timeout=5)
+    release.set()
+
+    leader_thread.join(5)
+    for thread, _ in waiters:
+        thread.join(5)
+    assert isinstance(leader_outcome["error"], DuplicateNoteError)
+    for _, outcome in waiters:
+        assert isinstance(outcome["error"], DuplicateNoteError)
+        assert str(outcome["error"]) == "'猫' is already in the deck"
+    assert calls == ["leader"]
+
+
+def test_unshared_failure_is_a_plain_exception():
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader():
+        started.set()
+        release.wait(5)
+        raise ValueError("Gemini answered 500")
+
+    leader_thread, _ = run_in_thread(lambda: single_flight.single_flight(KEY, leader))
+    assert started.wait(5)
+    waiting = threading.Event()
+    waiter_thread, outcome = run_in_thread(
+        lambda: single_flight.single_flight(KEY, dict, on_wait=waiting.set)
+    )
+    assert waiting.wait(5)
+    release.set()
+
+    leader_thread.join(5)
+    waiter_thread.join(5)
+    assert type(outcome["error"]) is Exception
+    assert str(outcome["error"]) == "Gemini answered 500"
+
+
+def test_request_after_failure_tries_again():
+    def fail():
+        raise ValueError("Gemini answered 500")
+
+    with pytest.raises(ValueError):
+        single_flight.single_flight(KEY, fail)
+    assert single_flight.single_flight(KEY, lambda: {"word": "猫"}) == {"word": "猫"}
@@ -0,0 +1,136 @@
+import pytest
+
+from app.utils import sync_scheduler
+from app.utils.sync_scheduler import flush_sync, request_sync
+
+URL = "http://anki.test:8765"
+
+
+@pytest.fixture
+def syncs(monkeypatch):
+    """
+    Records syncs instead of calling AnkiConnect, on a clock moved by hand.
+    """
+    calls = []
+    fail = []
+    now = [1000.0]
+
+    def sync(ankiconnect_url):
+        calls.append((ankiconnect_url, now[0]))
+        if fail:
+            raise Exception(fail.pop())
+
+    monkeypatch.setattr(sync_scheduler, "_sync", sync)
+    monkeypatch.setattr(sync_scheduler, "start_sync_ticker", lambda: None)
+    monkeypatch.setattr(sync_scheduler, "SYNC_DEBOUNCE", True)
+    monkeypatch.setattr(sync_scheduler, "SYNC_QUIET_PERIOD", 5)
+    monkeypatch.setattr(sync_scheduler, "SYNC_MAX_DELAY", 30)
+    monkeypatch.setattr(sync_scheduler, "SYNC_LEASE_SECONDS", 300)
+    monkeypatch.setattr(sync_scheduler.time, "time", lambda: now[0])
+    return calls, fail, now
+
+
+def pending():
+    row = (
+        sync_scheduler._connection()
+        .execute("SELECT first_marked FROM sync_state WHERE url = ?", (URL,))
+        .fetchone()
+    )
+    return row is not None and row[0] is not None
+
+
+def test_marks_are_coalesced_after_a_quiet_period(syncs):
+    calls, _, now = syncs
+    request_sync(URL)
+    now[0] += 3
+    request_sync(URL)
+    now[0] += 3
+    sync_scheduler._run_due_syncs()
+    assert calls == []
+
+    now[0] += 2
+    sync_scheduler._run_due_syncs()
+    sync_scheduler._run_due_syncs()
+    assert calls == [(URL, 1008.0)]
+    assert not pending()
+
+
+def test_steady_marks_sync_after_the_max_delay(syncs):
+    calls, _, now = syncs
+    for _ in range(31):
+        request_sync(URL)
+        sync_scheduler._run_due_syncs()
+        now[0] += 1
+    assert calls == [(URL, 1030.0)]
+
+
+def test_failed_sync_keeps_the_mark_and_backs_off(syncs):
+    calls, fail, now = syncs
+    request_sync(URL)
+    now[0] += 5
+    fail.append("AnkiWeb is unreachable")
+    sync_scheduler._run_due_syncs()
+    assert pending()
+
+    now[0] += 1
+    sync_scheduler._run_due_syncs()
+    assert len(calls) == 1
+
+    now[0] += 5
+    sync_scheduler._run_due_syncs()
+    assert len(calls) == 2
+    assert not pending()
+
+
+def test_sync_of_a_dead_worker_is_taken_over(syncs):
+    calls, _, now = syncs
+    request_sync(URL)
+    now[0] += 5
+    # A worker claims the sync and is killed before it finishes.
+    assert sync_scheduler._claim(URL, "dead-worker", now[0])
+    sync_scheduler._run_due_syncs()
+    assert calls == []
+    assert pending()
+
+    now[0] += 301
+    sync_scheduler._run_due_syncs()
+    assert calls == [(URL, 1306.0)]
+    assert not pending()
+
+
+def test_mark_made_during_the_sync_is_kept(syncs, monkeypatch):
+    calls, _, now = syncs
+
+    def sync(ankiconnect_url):
+        calls.append((ankiconnect_url, now[0]))
+        now[0] += 2
+        request_sync(URL)
+
+    monkeypatch.setattr(sync_scheduler, "_sync", sync)
+    request_sync(URL)
+    now[0] += 5
+    sync_scheduler._run_due_syncs()
+    assert pending()
+
+    now[0] += 5
+    sync_scheduler._run_due_syncs()
+    assert len(calls) == 2
+
+
+def test_flush_syncs_now_and_clears_the_mark(syncs):
+    calls, _, now = syncs
+    request_sync(URL)
+    flush_sync(URL)
+    assert calls == [(URL, 1000.0)]
+    assert not pending()
+
+    now[0] += 30
+    sync_scheduler._run_due_syncs()
+    assert len(calls) == 1
+
+
+def test_without_debounce_syncs_immediately(syncs, monkeypatch):
+    calls, _, _ = syncs
+    monkeypatch.setattr(sync_scheduler, "SYNC_DEBOUNCE", False)
+    request_sync(URL)
+    assert calls == [(URL, 1000.0)]